@@ -1,7 +1,10 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
-from .models import Role
+from cciw.cciwmain.models import Camp, Person
+from cciw.utils.cache import clear_cache_now_and_on_commit
+
+from .models import Role, clear_user_capabilities_cache
 
 
 def recreate_ses_routes_for_role_change(sender, created=None, **kwargs):
@@ -13,3 +16,21 @@ def recreate_ses_routes_for_role_change(sender, created=None, **kwargs):
 
 
 post_save.connect(recreate_ses_routes_for_role_change, sender=Role)
+
+
+def user_capabilities_changed(sender, **kwargs):
+    clear_cache_now_and_on_commit(clear_user_capabilities_cache)
+
+
+post_save.connect(user_capabilities_changed, sender=Role)
+post_delete.connect(user_capabilities_changed, sender=Role)
+m2m_changed.connect(user_capabilities_changed, sender=Role.members.through)
+m2m_changed.connect(user_capabilities_changed, sender=Role.permissions.through)
+
+# User.capabilities includes camps as admin or leader:
+post_save.connect(user_capabilities_changed, sender=Camp)
+post_delete.connect(user_capabilities_changed, sender=Camp)
+post_delete.connect(user_capabilities_changed, sender=Person)
+m2m_changed.connect(user_capabilities_changed, sender=Camp.leaders.through)
+m2m_changed.connect(user_capabilities_changed, sender=Camp.admins.through)
+m2m_changed.connect(user_capabilities_changed, sender=Person.users.through)
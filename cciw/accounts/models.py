@@ -2,6 +2,8 @@
 User accounts for staff
 """
 import logging
+import uuid
+from dataclasses import dataclass
 from datetime import datetime
 
 import yaml
@@ -11,10 +13,13 @@ from django.contrib.auth.models import AbstractBaseUser, Permission
 from django.contrib.auth.models import UserManager as UserManagerDjango
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.expressions import ArraySubquery
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.core.mail import send_mail
 from django.db import models, transaction
-from django.db.models import Q
+from django.db.models import Q, functions
+from django.db.models.functions import JSONObject
 from django.utils import timezone
 from django.utils.functional import cached_property
 
@@ -48,23 +53,97 @@ def active_staff(user):
 
 
 def user_has_role(user, role_names):
-    if len(role_names) == 0:
-        return False
-    # We generally use this multiple times, so it is usually going to be much
-    # faster to fetch and cache all the roles once if not already fetched.
-    roles = None
-    if hasattr(user, "_prefetched_objects_cache"):
-        if "roles" in user._prefetched_objects_cache:
-            roles = user._prefetched_objects_cache["roles"]
+    return user.capabilities.has_role(role_names)
+
+
+@dataclass(frozen=True)
+class UserCapabilities:
+    """
+    The roles, permissions and camps of a user, which are needed for most
+    permission checks, in a compact form that can be stored in the cache.
+    """
+
+    role_names: frozenset[str]
+    # "app_label.codename" strings
+    permissions: frozenset[str]
+    # (camp id, year) pairs for camps the user is an admin or leader for
+    camps_as_admin_or_leader: frozenset[tuple[int, int]]
+
+    def has_role(self, role_names) -> bool:
+        return not self.role_names.isdisjoint(role_names)
+
+    @cached_property
+    def permission_app_labels(self) -> frozenset[str]:
+        return frozenset(perm[: perm.index(".")] for perm in self.permissions)
+
+    @cached_property
+    def camp_ids(self) -> frozenset[int]:
+        return frozenset(camp_id for camp_id, year in self.camps_as_admin_or_leader)
+
+    def camp_ids_for_year(self, year) -> frozenset[int]:
+        return frozenset(camp_id for camp_id, camp_year in self.camps_as_admin_or_leader if camp_year == year)
+
+
+# UserCapabilities are cached across requests, under a key that includes a
+# 'generation' which is changed whenever anything they depend on changes (see
+# hooks). Such changes are rare, so we don't try to do anything more fine
+# grained.
+USER_CAPABILITIES_GENERATION_CACHE_KEY = "cciw.accounts.user_capabilities_generation"
+USER_CAPABILITIES_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_user_capabilities(user) -> UserCapabilities:
+    generation = cache.get(USER_CAPABILITIES_GENERATION_CACHE_KEY)
+    if generation is None:
+        cache.add(USER_CAPABILITIES_GENERATION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+        generation = cache.get(USER_CAPABILITIES_GENERATION_CACHE_KEY)
+    cache_key = f"cciw.accounts.user_capabilities.{generation}.{user.id}.{int(user.is_superuser)}"
+    capabilities = cache.get(cache_key)
+    if capabilities is None:
+        capabilities = _fetch_user_capabilities(user)
+        cache.set(cache_key, capabilities, timeout=USER_CAPABILITIES_CACHE_TIMEOUT)
+    return capabilities
+
+
+def _fetch_user_capabilities(user) -> UserCapabilities:
+    from cciw.cciwmain.models import Camp
+
+    # In contrast to django.contrib.auth.backends.ModelBackend, we
+    # deliberarely don't have user level permissions, everything must be
+    # defined on Role.
+    if user.is_superuser:
+        permissions = Permission.objects.all()
     else:
-        user._prefetched_objects_cache = {}
-    if roles is None:
-        roles = user.roles.all()
-        # Evaluate:
-        list(roles)
-        user._prefetched_objects_cache["roles"] = roles
+        permissions = Permission.objects.filter(roles__members=models.OuterRef("id"))
+    # This can produce duplicates, which we remove below.
+    camps = Camp.objects.filter(Q(admins=models.OuterRef("id")) | Q(leaders__users=models.OuterRef("id")))
+    # Everything is fetched in a single query, using array subqueries.
+    values = (
+        User.objects.filter(id=user.id)
+        .annotate(
+            role_names=ArraySubquery(Role.objects.filter(members=models.OuterRef("id")).values("name")),
+            permissions=ArraySubquery(
+                permissions.annotate(
+                    perm=functions.Concat("content_type__app_label", models.Value("."), "codename")
+                ).values("perm")
+            ),
+            camps=ArraySubquery(camps.annotate(camp=JSONObject(id="id", year="year")).values("camp")),
+        )
+        .values("role_names", "permissions", "camps")
+        .first()
+    )
+    if values is None:
+        # Unsaved user
+        return UserCapabilities(role_names=frozenset(), permissions=frozenset(), camps_as_admin_or_leader=frozenset())
+    return UserCapabilities(
+        role_names=frozenset(values["role_names"]),
+        permissions=frozenset(values["permissions"]),
+        camps_as_admin_or_leader=frozenset((camp["id"], camp["year"]) for camp in values["camps"]),
+    )
 
-    return any(role.name == name for name in role_names for role in roles)
+
+def clear_user_capabilities_cache():
+    cache.set(USER_CAPABILITIES_GENERATION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
 
 
 def get_camp_manager_role_users():
@@ -308,6 +387,10 @@ class User(AbstractBaseUser):
         self.mark_password_validation_done()
 
     # Helpers for roles
+    @cached_property
+    def capabilities(self) -> UserCapabilities:
+        return get_user_capabilities(self)
+
     @cached_property
     def is_booking_secretary(self):
         if not active_staff(self):
@@ -328,7 +411,7 @@ class User(AbstractBaseUser):
         """
         if not active_staff(self):
             return False
-        return user_has_role(self, CAMP_MANAGER_ROLES) or len(self.current_camps_as_admin_or_leader) > 0
+        return user_has_role(self, CAMP_MANAGER_ROLES) or len(self.current_camp_ids_as_admin_or_leader) > 0
 
     @cached_property
     def is_potential_camp_officer(self):
@@ -375,7 +458,7 @@ class User(AbstractBaseUser):
         # They only get view permissions for old camps when they also have
         # edit permissions for at least one camp. i.e. current leaders
         # can view old info, past leaders can't
-        if self.viewable_camps and self.editable_camps:
+        if self.capabilities.camp_ids and self.current_camp_ids_as_admin_or_leader:
             return True
         return False
 
@@ -384,7 +467,7 @@ class User(AbstractBaseUser):
         if self.has_perm("cciwmain.view_camp"):
             return True
 
-        if self.can_view_any_camps and camp in self.viewable_camps:
+        if self.can_view_any_camps and camp.id in self.capabilities.camp_ids:
             return True
         return False
 
@@ -396,15 +479,16 @@ class User(AbstractBaseUser):
     def can_edit_some_camps(self):
         if self.has_perm("cciwmain.change_camp"):
             return True
-        if self.editable_camps:
+        if self.current_camp_ids_as_admin_or_leader:
             return True
         return False
 
     def can_edit_camp(self, camp):
+        # NB also editable_camps
         if self.has_perm("cciwmain.change_camp"):
             return True
 
-        if self.can_edit_some_camps and camp in self.editable_camps:
+        if self.can_edit_some_camps and camp.id in self.current_camp_ids_as_admin_or_leader:
             return True
         return False
 
@@ -420,27 +504,21 @@ class User(AbstractBaseUser):
         """
         Returns all the camps for which the user is an admin or leader.
         """
-        # If the user is am 'admin' for some camps:
-        camps = self.camps_as_admin.all()
-        # Find the 'Person' objects that correspond to this user
-        leaders = list(self.people.all())
-        # Find the camps for this leader
-        # (We could do:
-        #    Person.objects.get(user=user.id).camps_as_leader.all(),
-        #  but we also must we handle the possibility that two Person
-        #  objects have the same User objects, which could happen in the
-        #  case where a leader leads by themselves and as part of a couple)
-        for leader in leaders:
-            camps = camps | leader.camps_as_leader.all()
-
-        return camps.distinct()
+        from cciw.cciwmain.models import Camp
+
+        return Camp.objects.filter(id__in=self.capabilities.camp_ids)
 
     @cached_property
     def current_camps_as_admin_or_leader(self):
+        from cciw.cciwmain.models import Camp
+
+        return list(Camp.objects.filter(id__in=self.current_camp_ids_as_admin_or_leader))
+
+    @cached_property
+    def current_camp_ids_as_admin_or_leader(self):
         from cciw.cciwmain import common
 
-        # re-use cached camps_as_admin_or_leader here.
-        return [c for c in self.camps_as_admin_or_leader if c.year == common.get_thisyear()]
+        return self.capabilities.camp_ids_for_year(common.get_thisyear())
 
     @cached_property
     def can_search_officer_names(self):
@@ -1,6 +1,7 @@
 from unittest.mock import patch
 
 import pytest
+from django.contrib.auth.models import Permission
 from django.urls import reverse
 from furl import furl
 
@@ -8,10 +9,12 @@ from cciw.accounts.models import (
     BOOKING_SECRETARY_ROLE_NAME,
     CAMP_MANAGER_ROLES,
     SECRETARY_ROLE_NAME,
+    Role,
     User,
     user_has_role,
 )
 from cciw.accounts.utils import merge_users
+from cciw.cciwmain import common
 from cciw.cciwmain.tests import factories as camp_factories
 from cciw.officers.models import add_officer_to_camp
 from cciw.officers.tests import factories
@@ -72,6 +75,64 @@ class TestUserModel(TestBase):
         assert not officer_user.has_perm("bookings.add_booking")
 
 
+class TestUserCapabilities(TestBase):
+    def test_single_query(self):
+        camp = camp_factories.create_camp(leader=(leader := factories.create_officer()))
+        leader.roles.add(Role.objects.get_or_create(name=BOOKING_SECRETARY_ROLE_NAME)[0])
+        common.get_thisyear()
+        leader = User.objects.get(id=leader.id)
+        with self.assertNumQueries(1):
+            assert leader.is_booking_secretary
+            assert leader.is_camp_admin
+            assert not leader.is_dbs_officer
+            assert leader.can_manage_application_forms
+            assert leader.can_edit_camp(camp)
+            assert leader.has_module_perms("cciwmain")
+            assert not leader.has_perm("cciwmain.change_camp")
+
+    def test_cached_across_instances(self):
+        user = factories.create_booking_secretary()
+        assert user.is_booking_secretary
+        user = User.objects.get(id=user.id)
+        with self.assertNumQueries(0):
+            assert user.is_booking_secretary
+
+    def test_cleared_on_role_change(self):
+        user = factories.create_officer()
+        assert not user.is_booking_secretary
+        role = Role.objects.get_or_create(name=BOOKING_SECRETARY_ROLE_NAME)[0]
+        role.members.add(user)
+        assert User.objects.get(id=user.id).is_booking_secretary
+        user.roles.remove(role)
+        assert not User.objects.get(id=user.id).is_booking_secretary
+
+    def test_cleared_on_permission_change(self):
+        user = factories.create_officer()
+        role = Role.objects.create(name="Test")
+        role.members.add(user)
+        assert not user.has_perm("cciwmain.change_camp")
+        role.permissions.add(Permission.objects.get(codename="change_camp"))
+        assert User.objects.get(id=user.id).has_perm("cciwmain.change_camp")
+
+    def test_cleared_on_camp_leader_change(self):
+        user = factories.create_officer()
+        camp = camp_factories.create_camp()
+        assert not user.is_camp_admin
+        person = camp_factories.create_person()
+        person.users.add(user)
+        assert not User.objects.get(id=user.id).is_camp_admin
+        camp.leaders.add(person)
+        assert User.objects.get(id=user.id).is_camp_admin
+        assert list(User.objects.get(id=user.id).camps_as_admin_or_leader) == [camp]
+
+        camp.leaders.clear()
+        camp.admins.add(user)
+        assert User.objects.get(id=user.id).can_edit_camp(camp)
+
+        camp.delete()
+        assert not User.objects.get(id=user.id).is_camp_admin
+
+
 class PwnedPasswordPatcherMixin:
     PWNED_PASSWORDS = ["pwnedpassword"]
 
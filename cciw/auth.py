@@ -1,5 +1,4 @@
 from django.contrib.auth import password_validation
-from django.contrib.auth.models import Permission
 from django.core.exceptions import ValidationError
 
 from cciw.accounts.models import User
@@ -41,23 +40,11 @@ class CciwAuthBackend:
         """
         return user.is_active
 
-    def _get_all_permissions(self, user_obj):
-        # In contrast to django.contrib.auth.backends.ModelBackend, we
-        # deliberarely don't have user level permissions, everything must be
-        # defined on Role.
-        if user_obj.is_superuser:
-            perms = Permission.objects.all()
-        else:
-            perms = Permission.objects.filter(roles__members=user_obj)
-        perms = perms.values_list("content_type__app_label", "codename").order_by()
-        return {f"{ct}.{name}" for ct, name in perms}
-
     def get_all_permissions(self, user_obj, obj=None):
         if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
             return set()
-        if not hasattr(user_obj, "_perm_cache"):
-            user_obj._perm_cache = self._get_all_permissions(user_obj)
-        return user_obj._perm_cache
+        # See User.capabilities for how these are fetched and cached
+        return user_obj.capabilities.permissions
 
     def has_perm(self, user_obj, perm, obj=None):
         if not user_obj.is_active:
@@ -101,9 +88,7 @@ class CciwAuthBackend:
             if app_label == "cciwmain":
                 if user_obj.can_edit_some_camps:
                     return True
-        return user_obj.is_active and any(
-            perm[: perm.index(".")] == app_label for perm in self.get_all_permissions(user_obj)
-        )
+        return user_obj.is_active and app_label in user_obj.capabilities.permission_app_labels
 
     def check_password_validation(self, user, password):
         if not user.password_validation_needs_checking():
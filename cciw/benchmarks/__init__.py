@@ -0,0 +1,6 @@
+"""
+Performance benchmarks.
+
+These are pytest tests marked with `@pytest.mark.benchmark`, and are skipped
+unless `--benchmarks` is passed. See docs/development.rst
+"""
@@ -0,0 +1,80 @@
+"""
+Benchmark for concurrent booking via `book_basket_now`.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.db import connection
+
+from cciw.bookings import models as bookings_models
+from cciw.bookings.factories import create_booking, create_booking_account
+from cciw.bookings.models import Booking, book_basket_now, lock_camps_for_booking
+from cciw.cciwmain.models import Camp
+from cciw.cciwmain.tests import factories as camps_factories
+
+from .utils import Timings, print_report
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+CAMPS = 8
+BASKETS = 200
+THREADS = 8
+
+
+def lock_year_for_booking(camp_ids):
+    # The original locking strategy, kept here for comparison: lock every
+    # booking for the year.
+    years = set(Camp.objects.filter(id__in=camp_ids).values_list("year", flat=True))
+    list(Booking.objects.for_year(list(years)[0]).select_for_update())
+
+
+@pytest.mark.parametrize("lock_function", [lock_year_for_booking, lock_camps_for_booking])
+def test_book_basket_now_concurrency(lock_function, monkeypatch):
+    rng = random.Random(1)
+    camps = [camps_factories.create_camp(future=True) for i in range(CAMPS)]
+    for camp in camps:
+        camp.max_campers = camp.max_male_campers = camp.max_female_campers = BASKETS * 2
+        camp.save()
+    account_ids = []
+    for i in range(BASKETS):
+        account = create_booking_account()
+        camp = rng.choice(camps)
+        for j in range(rng.choice([1, 2])):
+            create_booking(account=account, camp=camp, first_name=f"Child{j}", last_name="Smith")
+        account_ids.append(account.id)
+
+    lock_timings = Timings()
+
+    def timed_lock(camp_ids):
+        with lock_timings.timed():
+            lock_function(camp_ids)
+
+    monkeypatch.setattr(bookings_models, "lock_camps_for_booking", timed_lock)
+
+    def book(account_id):
+        try:
+            return book_basket_now(Booking.objects.filter(account_id=account_id).in_basket())
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        results = list(executor.map(book, account_ids))
+    elapsed = time.perf_counter() - start
+
+    assert all(results)
+    print_report(
+        f"book_basket_now with {lock_function.__name__}",
+        [
+            ("Baskets", BASKETS),
+            ("Camps", CAMPS),
+            ("Threads", THREADS),
+            ("Elapsed (s)", elapsed),
+            ("Throughput (baskets/s)", BASKETS / elapsed),
+            ("Total lock wait (s)", lock_timings.total),
+            ("Mean lock wait (s)", lock_timings.mean),
+            ("Max lock wait (s)", lock_timings.max),
+        ],
+    )
@@ -0,0 +1,185 @@
+"""
+Benchmark for booking progress and ages stats, across many years of bookings.
+
+The stats are read from the stored BookingStatsCount rows, so the one-off cost
+of building those is reported separately.
+"""
+import copy
+import random
+import time
+from datetime import date, datetime, timedelta
+
+import datedelta
+import pandas as pd
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from pytz import UTC
+
+from cciw.bookings import factories as bookings_factories
+from cciw.bookings.models import Booking, BookingState
+from cciw.bookings.stats import get_booking_ages_stats, get_booking_progress_stats, rebuild_booking_stats
+from cciw.cciwmain.tests import factories as camps_factories
+from cciw.utils.stats import accumulate, accumulate_dates, counts
+
+from .utils import print_report
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+YEARS = 15
+CAMPS_PER_YEAR = 6
+BOOKINGS_PER_CAMP = 120
+REPEATS = 3
+
+
+# The original implementations, kept here for comparison:
+
+
+def legacy_get_booking_progress_stats(start_year=None, end_year=None, camps=None, overlay_years=False):
+    data_dates = {}
+    data_rel_days = {}
+    if camps:
+        items = camps
+        query_filter = lambda qs, camp: qs.filter(camp=camp)
+        labeller = lambda camp: str(camp.url_id)
+        last_year = max(c.year for c in camps)
+    else:
+        items = range(start_year, end_year + 1)
+        query_filter = lambda qs, year: qs.filter(camp__year=year)
+        labeller = str
+        last_year = end_year
+
+    for item in items:
+        qs = Booking.objects.confirmed()
+        rows = query_filter(qs, item).select_related("camp").values_list("booked_at", "created_at", "camp__start_date")
+        rows2 = [[r[0] if r[0] else r[1], r[2]] for r in rows]
+        if rows2:
+            if overlay_years:
+                dates = [d1.date() + datedelta.datedelta(years=last_year - d2.year) for d1, d2 in rows2]
+            else:
+                dates = [d1.date() for d1, d2 in rows2]
+            label = labeller(item)
+            data_dates[label] = legacy_fill_gaps(accumulate_dates(dates))
+            data_rel_days[label] = legacy_fill_gaps(accumulate([(r[0].date() - r[1]).days for r in rows2]))
+
+    df1 = pd.DataFrame(data=data_dates)
+    df2 = pd.DataFrame(data=data_rel_days)
+    return df1, df2
+
+
+def legacy_fill_gaps(series):
+    last_idx = None
+    last_val = None
+    extra = []
+    for idx in series.index:
+        if last_idx is not None:
+            if isinstance(idx, pd.Timestamp):
+                current_dt = idx.date()
+                last_dt = last_idx.date()
+                missing_dates = [last_dt + timedelta(days=days) for days in range(1, (current_dt - last_dt).days)]
+                extra.extend((pd.Timestamp(dt), last_val) for dt in missing_dates)
+            else:
+                missing_days = [last_idx + days for days in range(1, idx - last_idx)]
+                extra.extend((day, last_val) for day in missing_days)
+
+        last_idx = idx
+        last_val = series[idx]
+
+    for idx, val in extra:
+        series[idx] = val
+    series = series.sort_index()
+    return series
+
+
+def legacy_get_booking_ages_stats(start_year=None, end_year=None, camps=None, include_total=True):
+    if camps:
+        items = camps
+        query_filter = lambda qs, camp: qs.filter(camp=camp)
+        labeller = lambda camp: str(camp.url_id)
+    else:
+        items = range(start_year, end_year + 1)
+        query_filter = lambda qs, year: qs.filter(camp__year=year)
+        labeller = str
+
+    data = {}
+    for item in items:
+        qs = Booking.objects.confirmed().select_related(None).select_related("camp").only("date_of_birth", "camp")
+        objs = query_filter(qs, item)
+        vals = [b.age_on_camp() for b in objs]
+        data[labeller(item)] = counts(vals)
+    df = pd.DataFrame(data=data).fillna(0)
+    if include_total:
+        df["Total"] = sum(df[col] for col in data)
+    return df
+
+
+def create_bookings() -> tuple[int, int]:
+    rnd = random.Random(0)
+    end_year = date.today().year
+    start_year = end_year - YEARS + 1
+    template = None
+    bookings = []
+    for year in range(start_year, end_year + 1):
+        for i in range(CAMPS_PER_YEAR):
+            camp = camps_factories.create_camp(start_date=date(year, 7, 1) + timedelta(days=7 * i))
+            if template is None:
+                template = bookings_factories.create_booking(camp=camp)
+            for j in range(BOOKINGS_PER_CAMP):
+                booking = copy.copy(template)
+                booking.id = None
+                booking.camp = camp
+                booking.state = BookingState.BOOKED
+                booking.booking_expires = None
+                booked_at = datetime(year, 1, 1, tzinfo=UTC) + timedelta(
+                    days=rnd.randint(0, 180), hours=rnd.randint(0, 23)
+                )
+                booking.created_at = booked_at - timedelta(days=rnd.randint(0, 10))
+                booking.booked_at = booked_at if rnd.random() < 0.9 else None
+                booking.date_of_birth = date(year - rnd.randint(10, 18), rnd.randint(1, 12), rnd.randint(1, 28))
+                bookings.append(booking)
+    Booking.objects.bulk_create(bookings)
+    return start_year, end_year
+
+
+def test_booking_stats():
+    start_year, end_year = create_bookings()
+    kwargs = dict(start_year=start_year, end_year=end_year)
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        rebuild_booking_stats()
+        elapsed = time.perf_counter() - start
+    print_report(
+        f"rebuild_booking_stats with {YEARS} years of bookings",
+        [
+            ("Queries", len(queries)),
+            ("Elapsed (s)", elapsed),
+        ],
+    )
+    benchmarks = [
+        ("progress", legacy_get_booking_progress_stats, get_booking_progress_stats, dict(overlay_years=True)),
+        ("ages", legacy_get_booking_ages_stats, get_booking_ages_stats, dict(include_total=False)),
+    ]
+    for name, legacy_func, func, extra_kwargs in benchmarks:
+        results = {}
+        for f in [legacy_func, func]:
+            # Best of a few runs, to reduce noise
+            timings = []
+            for i in range(REPEATS):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    result = f(**kwargs, **extra_kwargs)
+                    timings.append(time.perf_counter() - start)
+            results[f] = result
+            print_report(
+                f"{f.__name__} with {YEARS} years of bookings",
+                [
+                    ("Bookings", Booking.objects.confirmed().count()),
+                    ("Queries", len(queries)),
+                    ("Elapsed (s)", min(timings)),
+                ],
+            )
+        if name == "progress":
+            for legacy_df, df in zip(results[legacy_func], results[func]):
+                pd.testing.assert_frame_equal(legacy_df, df, check_freq=False)
+        else:
+            pd.testing.assert_frame_equal(results[legacy_func], results[func])
@@ -0,0 +1,180 @@
+"""
+Benchmark for get_officers_with_dbs_info_for_camps, as used by the DBS officer page.
+"""
+import operator
+import random
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from functools import reduce
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from cciw.cciwmain.tests import factories as camps_factories
+from cciw.officers.applications import applications_for_camps
+from cciw.officers.dbs import DBSInfo, get_officers_with_dbs_info_for_camps, get_update_service_dbs_numbers
+from cciw.officers.models import Application, DBSActionLog, DBSActionLogType, DBSCheck, Invitation
+from cciw.officers.tests import factories as officers_factories
+
+from .utils import print_report
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+OFFICERS = 500
+CAMPS = 10
+REPEATS = 3
+
+
+def legacy_get_officers_with_dbs_info_for_camps(year_camps, selected_camps, officer_id=None):
+    # The original implementation, kept here for comparison.
+    now = timezone.now()
+
+    camp_invitations = Invitation.objects.filter(camp__in=year_camps).select_related("officer", "camp__camp_name")
+    if officer_id is not None:
+        camp_invitations = camp_invitations.filter(officer__id=officer_id)
+    camp_invitations = list(camp_invitations)
+
+    all_officers = list({i.officer for i in camp_invitations})
+    all_officers.sort(key=lambda o: (o.first_name, o.last_name))
+    apps = list(applications_for_camps(year_camps))
+    recent_dbs_officer_ids = set(
+        reduce(operator.or_, [DBSCheck.objects.get_for_camp(c, include_late=True) for c in year_camps]).values_list(
+            "officer_id", flat=True
+        )
+    )
+
+    all_dbs_officer_ids = set(DBSCheck.objects.filter(officer__in=all_officers).values_list("officer_id", flat=True))
+
+    last_dbs_status = dict(
+        DBSCheck.objects.filter(officer__in=all_dbs_officer_ids).values_list("officer_id", "applicant_accepted")
+    )
+
+    relevant_action_logs = (
+        DBSActionLog.objects.filter(officer__in=all_officers)
+        .filter(created_at__gt=now - timedelta(365))
+        .order_by("created_at")
+    )
+    dbs_forms_sent = list(relevant_action_logs.filter(action_type=DBSActionLogType.FORM_SENT))
+    requests_for_dbs_form_sent = list(
+        relevant_action_logs.filter(action_type=DBSActionLogType.REQUEST_FOR_DBS_FORM_SENT)
+    )
+    leader_alerts_sent = list(relevant_action_logs.filter(action_type=DBSActionLogType.LEADER_ALERT_SENT))
+
+    update_service_dbs_numbers_for_officers = get_update_service_dbs_numbers(all_officers)
+
+    officers_camps = defaultdict(list)
+    for invitation in camp_invitations:
+        officers_camps[invitation.officer_id].append(invitation.camp)
+
+    officer_apps = {a.officer_id: a for a in apps}
+
+    def logs_to_dict(logs):
+        return {f.officer_id: f.created_at for f in logs}
+
+    dbs_forms_sent_for_officers = logs_to_dict(dbs_forms_sent)
+    requests_for_dbs_form_sent_for_officers = logs_to_dict(requests_for_dbs_form_sent)
+    leader_alerts_sent_for_officers = logs_to_dict(leader_alerts_sent)
+
+    retval = []
+    for o in all_officers:
+        officer_camps = officers_camps[o.id]
+        if not any(c in selected_camps for c in officer_camps):
+            continue
+        app = officer_apps.get(o.id, None)
+        dbs_info = DBSInfo(
+            camps=officer_camps,
+            has_application_form=app is not None,
+            application_id=app.id if app is not None else None,
+            has_dbs=o.id in all_dbs_officer_ids,
+            has_recent_dbs=o.id in recent_dbs_officer_ids,
+            last_dbs_form_sent=dbs_forms_sent_for_officers.get(o.id),
+            last_leader_alert_sent=leader_alerts_sent_for_officers.get(o.id),
+            last_form_request_sent=requests_for_dbs_form_sent_for_officers.get(o.id),
+            address=app.one_line_address if app is not None else "",
+            birth_date=app.birth_date if app is not None else None,
+            dbs_check_consent=app.dbs_check_consent if app is not None else False,
+            update_enabled_dbs_number=update_service_dbs_numbers_for_officers.get(o.id),
+            last_dbs_rejected=not last_dbs_status[o.id] if o.id in last_dbs_status else False,
+        )
+        retval.append((o, dbs_info))
+    return retval
+
+
+def create_officers():
+    rnd = random.Random(0)
+    year = date.today().year
+    camps = [camps_factories.create_camp(start_date=date(year, 7, 1) + timedelta(days=7 * i)) for i in range(CAMPS)]
+    now = timezone.now()
+    invitations = []
+    applications = []
+    dbs_checks = []
+    action_logs = []
+    for i in range(OFFICERS):
+        officer = officers_factories.create_officer(first_name=f"Joe{i:04}")
+        for camp in rnd.sample(camps, rnd.randint(1, 2)):
+            invitations.append(Invitation(camp=camp, officer=officer))
+        if rnd.random() < 0.8:
+            applications.append(
+                Application(
+                    officer=officer,
+                    finished=True,
+                    date_saved=date(year, 1, 1) + timedelta(days=rnd.randint(0, 150)),
+                    address_firstline=f"{i} The Street",
+                    address_town="Town",
+                    address_postcode="AB1 2CD",
+                    birth_date=date(1990, 1, 1),
+                    dbs_check_consent=rnd.random() < 0.9,
+                    dbs_number=str(rnd.randint(100000, 999999)) if rnd.random() < 0.5 else "",
+                )
+            )
+        # Oldest first, so that the legacy implementation's idea of 'last' is the most recent:
+        for years_ago in sorted(rnd.sample(range(10), rnd.randint(0, 3)), reverse=True):
+            dbs_checks.append(
+                DBSCheck(
+                    officer=officer,
+                    dbs_number=str(rnd.randint(100000, 999999)),
+                    completed=date(year - years_ago, 5, 1),
+                    applicant_accepted=rnd.random() < 0.95,
+                    registered_with_dbs_update=rnd.choice([True, False, None]),
+                )
+            )
+        for j in range(rnd.randint(0, 6)):
+            action_logs.append(
+                DBSActionLog(
+                    officer=officer,
+                    action_type=rnd.choice(list(DBSActionLogType)),
+                    created_at=now - timedelta(days=rnd.randint(0, 500), seconds=j),
+                )
+            )
+    Invitation.objects.bulk_create(invitations)
+    Application.objects.bulk_create(applications)
+    DBSCheck.objects.bulk_create(dbs_checks)
+    DBSActionLog.objects.bulk_create(action_logs)
+    return camps
+
+
+def test_dbs_info():
+    camps = create_officers()
+    results = {}
+    for func in [legacy_get_officers_with_dbs_info_for_camps, get_officers_with_dbs_info_for_camps]:
+        # Best of a few runs, to reduce noise
+        timings = []
+        for i in range(REPEATS):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                officers_and_dbs_info = func(camps, set(camps))
+                timings.append(time.perf_counter() - start)
+        results[func.__name__] = officers_and_dbs_info
+        print_report(
+            f"{func.__name__} with {OFFICERS} officers",
+            [
+                ("Officers", len(officers_and_dbs_info)),
+                ("Queries", len(queries)),
+                ("Elapsed (s)", min(timings)),
+            ],
+        )
+
+    assert results["legacy_get_officers_with_dbs_info_for_camps"] == results["get_officers_with_dbs_info_for_camps"]
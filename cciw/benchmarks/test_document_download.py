@@ -0,0 +1,65 @@
+"""
+Benchmark for peak memory use when downloading a large uploaded document.
+
+Peak memory is measured with tracemalloc. This doesn't see libpq's buffers,
+which hold a copy of each query result (the whole document for the original
+implementation, one chunk for the streaming one).
+"""
+import time
+import tracemalloc
+
+import pytest
+from django.http import HttpResponse
+from django.test import Client
+
+from cciw.bookings import factories as bookings_factories
+from cciw.documents import views as documents_views
+from cciw.officers.tests import factories as officers_factories
+
+from .utils import print_report
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+DOCUMENT_SIZE = 20 * 1024 * 1024
+
+
+def legacy_document_response(request, document):
+    # The original implementation, kept here for comparison.
+    return HttpResponse(
+        content=document.content,
+        content_type=document.mimetype,
+        headers={"Content-Length": document.size, "Content-Disposition": f'attachment; filename="{document.filename}"'},
+    )
+
+
+def test_document_download_memory(monkeypatch):
+    info = bookings_factories.create_supporting_information(
+        document_filename="large.pdf",
+        document_content=bytes(range(256)) * (DOCUMENT_SIZE // 256),
+        document_mimetype="application/pdf",
+    )
+    client = Client()
+    client.force_login(officers_factories.create_booking_secretary())
+    url = info.document.url
+
+    for name, response_func in [
+        ("document_response", documents_views.document_response),
+        ("legacy_document_response", legacy_document_response),
+    ]:
+        monkeypatch.setattr(documents_views, "document_response", response_func)
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get(url)
+        # Consumed and thrown away, as the web server would:
+        received = sum(len(chunk) for chunk in response)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert received == DOCUMENT_SIZE
+        print_report(
+            f"Download of {DOCUMENT_SIZE // (1024 * 1024)} MB document with {name}",
+            [
+                ("Peak Python memory (MB)", peak / (1024 * 1024)),
+                ("Elapsed (s)", elapsed),
+            ],
+        )
@@ -0,0 +1,128 @@
+"""
+Benchmark for `forward_email_to_list`, sending to a local SMTP server.
+"""
+import email
+import email.policy
+import socketserver
+import threading
+import time
+
+import pytest
+from django.core.mail import make_msgid
+from django.test.utils import override_settings
+from django.utils.encoding import force_bytes
+
+from cciw.accounts.models import User
+from cciw.mail.lists import EmailList, _set_mail_header, forward_email_to_list
+from cciw.mail.smtp import send_mime_message
+from cciw.mail.tests import make_message
+from cciw.officers.email_utils import formatted_email
+
+from .utils import Timings, print_report
+
+pytestmark = pytest.mark.benchmark
+
+RECIPIENTS = 60
+MESSAGES = 5
+# Simulated network round trip for each SMTP command
+LATENCY = 0.002
+BODY_SIZE = 100_000
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Minimal SMTP server that accepts and discards everything.
+    """
+
+    def reply(self, line):
+        time.sleep(LATENCY)
+        self.wfile.write(line + b"\r\n")
+
+    def handle(self):
+        self.server.connection_count += 1
+        self.reply(b"220 localhost")
+        while line := self.rfile.readline():
+            command = line[0:4].upper()
+            if command == b"EHLO":
+                self.reply(b"250 localhost")
+            elif command == b"DATA":
+                self.reply(b"354 Go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.message_count += 1
+                self.reply(b"250 OK")
+            elif command == b"QUIT":
+                self.reply(b"221 Bye")
+                return
+            else:
+                self.reply(b"250 OK")
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    connection_count = 0
+    message_count = 0
+
+
+@pytest.fixture
+def smtp_server():
+    server = SMTPServer(("localhost", 0), SMTPHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    with override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+        EMAIL_HOST="localhost",
+        EMAIL_PORT=server.server_address[1],
+        EMAIL_HOST_USER="",
+        EMAIL_HOST_PASSWORD="",
+        EMAIL_USE_TLS=False,
+    ):
+        yield server
+    server.shutdown()
+    server.server_close()
+
+
+def forward_email_to_list_one_at_a_time(mail, email_list):
+    # The original implementation of the sending part of
+    # `forward_email_to_list`, kept here for comparison: the message is
+    # serialised for every recipient, and sent sequentially using a new
+    # connection each time.
+    messages_to_send = []
+    for user in email_list.get_members():
+        addr = formatted_email(user)
+        _set_mail_header(mail, "To", addr)
+        _set_mail_header(mail, "Message-ID", make_msgid())
+        messages_to_send.append((addr, mail["From"], force_bytes(mail.as_string())))
+    for to_addr, from_address, mail_as_bytes in messages_to_send:
+        send_mime_message(to_addr, from_address, mail_as_bytes)
+
+
+@pytest.mark.parametrize("forward", [forward_email_to_list_one_at_a_time, forward_email_to_list])
+def test_forward_email_to_list(smtp_server, forward):
+    members = [User(first_name="Officer", last_name=str(i), email=f"officer{i}@example.com") for i in range(RECIPIENTS)]
+    email_list = EmailList(
+        local_address="camp-2000-blue-officers",
+        get_members=lambda: members,
+        has_permission=lambda address: True,
+        list_reply=False,
+    )
+    raw_message = make_message(to_email=email_list.address) + (b"x" * 78 + b"\r\n") * (BODY_SIZE // 80)
+
+    timings = Timings()
+    for i in range(MESSAGES):
+        mail = email.message_from_bytes(raw_message, policy=email.policy.SMTP)
+        with timings.timed():
+            forward(mail, email_list)
+
+    assert smtp_server.message_count == RECIPIENTS * MESSAGES
+    print_report(
+        f"Forwarding email with {forward.__name__}",
+        [
+            ("Recipients", RECIPIENTS),
+            ("Messages", MESSAGES),
+            ("SMTP connections", smtp_server.connection_count),
+            ("Mean time per message (s)", timings.mean),
+            ("Throughput (emails/s)", RECIPIENTS * MESSAGES / timings.total),
+        ],
+    )
@@ -0,0 +1,82 @@
+"""
+Benchmark for `process_all_payments` with a large queue of payments.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import pytest
+from django.db import connection, transaction
+from django.utils import timezone
+
+from cciw.bookings.factories import create_booking_account
+from cciw.bookings.models import BookingAccount, Payment, process_all_payments
+
+from .utils import print_report
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+PAYMENTS = 10_000
+ACCOUNTS = 500
+BATCH_SIZE = 500
+THREADS = 4
+
+
+@transaction.atomic
+def process_all_payments_one_at_a_time():
+    # The original implementation, kept here for comparison: one lock over the
+    # whole queue, and one `receive_payment` per payment.
+    for payment in (
+        Payment.objects.select_related(None).select_for_update().filter(processed__isnull=True).order_by("created_at")
+    ):
+        payment.account.receive_payment(payment.amount)
+        Payment.objects.filter(id=payment.id).update(processed=timezone.now())
+
+
+def process_in_batches():
+    process_all_payments(batch_size=BATCH_SIZE)
+
+
+def process_in_batches_concurrently():
+    def worker(i):
+        try:
+            process_all_payments(batch_size=BATCH_SIZE)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        list(executor.map(worker, range(THREADS)))
+
+
+@pytest.mark.parametrize(
+    "process",
+    [process_all_payments_one_at_a_time, process_all_payments, process_in_batches, process_in_batches_concurrently],
+)
+def test_process_payments(process):
+    rng = random.Random(1)
+    accounts = [create_booking_account() for i in range(ACCOUNTS)]
+    now = timezone.now()
+    Payment.objects.bulk_create(
+        [
+            Payment(account=rng.choice(accounts), amount=Decimal(rng.randint(1, 100)), processed=None, created_at=now)
+            for i in range(PAYMENTS)
+        ]
+    )
+    expected_total = sum(Payment.objects.values_list("amount", flat=True))
+
+    start = time.perf_counter()
+    process()
+    elapsed = time.perf_counter() - start
+
+    assert not Payment.objects.filter(processed__isnull=True).exists()
+    assert sum(BookingAccount.objects.values_list("total_received", flat=True)) == expected_total
+    print_report(
+        f"Processing payments with {process.__name__}",
+        [
+            ("Payments", PAYMENTS),
+            ("Accounts", ACCOUNTS),
+            ("Elapsed (s)", elapsed),
+            ("Throughput (payments/s)", PAYMENTS / elapsed),
+        ],
+    )
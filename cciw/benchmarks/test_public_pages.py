@@ -0,0 +1,82 @@
+"""
+Load test for public camp and HTML chunk pages, with and without the page cache.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from cciw.cciwmain import common, pagecache
+from cciw.cciwmain.tests import factories as camps_factories
+from cciw.sitecontent.models import HtmlChunk, MenuLink
+
+from .utils import Timings, print_report
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+CAMPS = 12
+REQUESTS = 2000
+THREADS = 4
+
+
+@pytest.mark.parametrize("use_cache", [False, True])
+def test_public_pages(use_cache, monkeypatch):
+    for i in range(CAMPS):
+        camps_factories.create_camp(leader=camps_factories.create_person(), future=True)
+    for i in range(6):
+        link = MenuLink.objects.create(title=f"Link {i}", url=f"/page-{i}/", listorder=i)
+        link.htmlchunk_set.create(
+            name=f"page-{i}", html=f"<p>Page {i} for {{{{thisyear}}}}</p>", page_title=f"Page {i}"
+        )
+    HtmlChunk.objects.create(name="camp_dates_intro_text", html="<p>Camps this year</p>")
+    HtmlChunk.objects.create(name="camp_dates_outro_text")
+
+    common.clear_thisyear_cache()
+    pagecache.clear_page_cache()
+    pagecache.stats.reset()
+    if not use_cache:
+        monkeypatch.setattr(pagecache, "use_page_cache", lambda request: False)
+
+    camp = camps_factories.create_camp(future=True)
+    urls = [
+        reverse("cciw-cciwmain-thisyear"),
+        reverse("cciw-cciwmain-camps_index"),
+        reverse("cciw-cciwmain-camps_detail", kwargs=dict(year=camp.year, slug=camp.slug_name)),
+        "/page-0/",
+        "/page-1/",
+    ]
+
+    timings = Timings()
+
+    def worker(i):
+        client = Client()
+        try:
+            for j in range(REQUESTS // THREADS):
+                with timings.timed():
+                    response = client.get(urls[j % len(urls)])
+                assert response.status_code == 200
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        list(executor.map(worker, range(THREADS)))
+    elapsed = time.perf_counter() - start
+
+    print_report(
+        f"Public pages {'with' if use_cache else 'without'} page cache",
+        [
+            ("Requests", REQUESTS),
+            ("Threads", THREADS),
+            ("Elapsed (s)", elapsed),
+            ("Throughput (requests/s)", REQUESTS / elapsed),
+            ("Mean latency (s)", timings.mean),
+            ("Max latency (s)", timings.max),
+            ("Cache hits", pagecache.stats.hits),
+            ("Cache misses", pagecache.stats.misses),
+            ("Cache hit rate", pagecache.stats.hit_rate),
+        ],
+    )
@@ -0,0 +1,75 @@
+"""
+Benchmark for the overhead of the sampling query profiler, on a typical
+officers page.
+
+Each request is either not sampled, sampled, or sampled with stacktraces. The
+mean overhead at the production sample rate is estimated from these. Note that
+tests use the local memory cache, while production uses memcached, which adds a
+little to the cost of recording each sampled request.
+"""
+import pytest
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from cciw.cciwmain.tests import factories as camps_factories
+from cciw.officers.tests import factories as officers_factories
+from cciw.query_profiler import get_query_profiles, reset_query_profiles
+
+from .utils import Timings, print_report
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+OFFICERS = 40
+REQUESTS = 300
+# As in production settings:
+PRODUCTION_SAMPLE_RATE = 0.02
+
+
+def test_query_profiler_overhead():
+    leader = officers_factories.create_officer()
+    officers = [officers_factories.create_officer() for i in range(OFFICERS)]
+    camp = camps_factories.create_camp(leader=leader, officers=officers, future=True)
+    for officer in officers[::2]:
+        officers_factories.create_application(officer=officer, year=camp.year)
+    reset_query_profiles()
+
+    url = reverse("cciw-officers-officer_list", kwargs=dict(camp_id=camp.url_id))
+    client = Client()
+    client.force_login(leader)
+    for i in range(10):  # warm up
+        assert client.get(url).status_code == 200
+
+    modes = [
+        ("Not sampled", dict(QUERY_PROFILER_SAMPLE_RATE=0)),
+        ("Sampled", dict(QUERY_PROFILER_SAMPLE_RATE=1, QUERY_PROFILER_STACKTRACES=False)),
+        ("Sampled with stacktraces", dict(QUERY_PROFILER_SAMPLE_RATE=1, QUERY_PROFILER_STACKTRACES=True)),
+    ]
+    timings = {name: Timings() for name, _ in modes}
+    # Modes are interleaved, so that they are equally affected by any drift.
+    for i in range(REQUESTS):
+        for name, profiler_settings in modes:
+            with override_settings(**profiler_settings), timings[name].timed():
+                response = client.get(url)
+            assert response.status_code == 200
+
+    (profile,) = get_query_profiles()
+    assert profile.requests == 2 * REQUESTS
+    baseline = timings["Not sampled"].mean
+    for name, _ in modes:
+        print_report(
+            f"Query profiler: {name}",
+            [
+                ("Requests", REQUESTS),
+                ("Queries per request", profile.mean_queries),
+                ("Mean latency (s)", timings[name].mean),
+                ("Overhead per request (s)", timings[name].mean - baseline),
+            ],
+        )
+    print_report(
+        f"Estimated mean overhead at sample rate {PRODUCTION_SAMPLE_RATE}",
+        [
+            (f"{name} (%)", 100 * PRODUCTION_SAMPLE_RATE * (timings[name].mean - baseline) / baseline)
+            for name in ["Sampled", "Sampled with stacktraces"]
+        ],
+    )
@@ -0,0 +1,224 @@
+"""
+Benchmark for camp_serious_slacker_list with many years of camp history.
+"""
+import random
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from cciw.cciwmain.models import Camp
+from cciw.cciwmain.tests import factories as camps_factories
+from cciw.officers.models import Application, DBSCheck, Invitation, Referee, Reference
+from cciw.officers.tests import factories as officers_factories
+from cciw.officers.utils import camp_serious_slacker_list
+
+from .utils import print_report
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+CAMPS_PER_YEAR = 4
+OFFICERS = 80
+OFFICERS_PER_CAMP = 25
+REPEATS = 3
+
+
+def legacy_camp_serious_slacker_list(camp):
+    # The original implementation, kept here for comparison: for every camp, it
+    # scans all invitations, applications and DBS checks.
+    officers = [i.officer for i in camp.invitations.all()]
+    relevant_camps = list(Camp.objects.filter(year__lte=camp.start_date.year).order_by("-start_date"))
+
+    if len(relevant_camps) == 0:
+        return []
+
+    latest_camp = relevant_camps[0]
+
+    all_invitations = list(
+        Invitation.objects.filter(camp__in=relevant_camps, officer__in=officers).select_related("camp", "officer")
+    )
+    all_apps = list(
+        Application.objects.filter(finished=True, officer__in=officers, date_saved__lte=latest_camp.start_date)
+    )
+
+    all_received_refs = list(Reference.objects.select_related("referee").filter(referee__application__in=all_apps))
+
+    all_dbss = list(DBSCheck.objects.filter(officer__in=officers))
+
+    received_ref_dict = defaultdict(list)
+    for ref in all_received_refs:
+        received_ref_dict[ref.referee.application_id].append(ref)
+
+    officer_apps_missing = defaultdict(list)
+    officer_apps_present = defaultdict(list)
+    officer_refs_missing = defaultdict(list)
+    officer_refs_present = defaultdict(list)
+    officer_dbss_missing = defaultdict(list)
+    officer_dbss_present = defaultdict(list)
+    officer_apps_last_good_year = {}
+    officer_refs_last_good_year = {}
+    officer_dbss_last_good_year = {}
+
+    for c in relevant_camps:
+        camp_officers = {i.officer for i in all_invitations if i.camp == c}
+        camp_applications = [a for a in all_apps if a.could_be_for_camp(c)]
+        officers_with_applications = {a.officer for a in camp_applications}
+        officers_with_two_references = {a.officer for a in camp_applications if len(received_ref_dict[a.id]) >= 2}
+        officers_with_dbss = {dbs.officer for dbs in all_dbss if dbs.could_be_for_camp(c)}
+
+        for o in camp_officers:
+            if o in officers_with_applications:
+                officer_apps_present[o].append(c)
+            else:
+                officer_apps_missing[o].append(c)
+            if o in officers_with_two_references:
+                officer_refs_present[o].append(c)
+            else:
+                officer_refs_missing[o].append(c)
+            if o in officers_with_dbss:
+                officer_dbss_present[o].append(c)
+            else:
+                officer_dbss_missing[o].append(c)
+
+    def get_missing_and_present_lists(present_dict, missing_dict, last_good_year_dict):
+        for officer, camps in present_dict.items():
+            if camps:
+                camps.sort(key=lambda camp: camp.start_date)
+                last_camp_with_item = camps[-1]
+                missing_camps = missing_dict[officer]
+                new_missing_camps = [c for c in missing_camps if c.start_date > last_camp_with_item.start_date]
+                missing_dict[officer] = new_missing_camps
+                last_good_year_dict[officer] = last_camp_with_item.year
+
+        for officer, camps in missing_dict.items():
+            camps.sort(key=lambda camp: camp.start_date, reverse=True)
+
+        for officer, camps in missing_dict.items():
+            missing_dict[officer] = [c for c in camps if c.year < camp.year]
+
+    get_missing_and_present_lists(officer_apps_present, officer_apps_missing, officer_apps_last_good_year)
+    get_missing_and_present_lists(officer_refs_present, officer_refs_missing, officer_refs_last_good_year)
+    get_missing_and_present_lists(officer_dbss_present, officer_dbss_missing, officer_dbss_last_good_year)
+
+    tmp1 = [
+        (o, officer_apps_missing[o], officer_refs_missing[o], officer_dbss_missing[o])
+        for o in (
+            set(officer_apps_missing.keys()) | set(officer_refs_missing.keys()) | set(officer_dbss_missing.keys())
+        )
+    ]
+    tmp1 = [(o, a, r, c) for (o, a, r, c) in tmp1 if len(a) > 0 or len(r) > 0 or len(c) > 0]
+    return [
+        {
+            "officer": o,
+            "missing_application_forms": a,
+            "missing_references": r,
+            "missing_dbss": c,
+            "last_good_apps_year": officer_apps_last_good_year.get(o),
+            "last_good_refs_year": officer_refs_last_good_year.get(o),
+            "last_good_dbss_year": officer_dbss_last_good_year.get(o),
+        }
+        for o, a, r, c in tmp1
+    ]
+
+
+def create_history(years: int) -> Camp:
+    """
+    Creates `years` years of camps, with officers who sometimes submit
+    application forms, references and DBS checks. Returns the latest camp.
+    """
+    rnd = random.Random(years)
+    officers = [officers_factories.create_officer() for i in range(OFFICERS)]
+    this_year = date.today().year
+    camps = []
+    for year in range(this_year - years + 1, this_year + 1):
+        for i in range(CAMPS_PER_YEAR):
+            camps.append(camps_factories.create_camp(start_date=date(year, 7, 1) + timedelta(days=7 * i)))
+
+    latest_camp = camps[-1]
+    invitations = []
+    applications = []
+    dbs_checks = []
+    for camp in camps:
+        camp_officers = officers[:OFFICERS_PER_CAMP] if camp == latest_camp else rnd.sample(officers, OFFICERS_PER_CAMP)
+        for officer in camp_officers:
+            invitations.append(Invitation(camp=camp, officer=officer))
+            if rnd.random() < 0.7:
+                applications.append(
+                    Application(
+                        officer=officer,
+                        finished=True,
+                        date_saved=camp.start_date - timedelta(days=rnd.randint(0, 400)),
+                    )
+                )
+            if rnd.random() < 0.3:
+                dbs_checks.append(
+                    DBSCheck(
+                        officer=officer,
+                        dbs_number=str(rnd.randint(100000, 999999)),
+                        completed=camp.start_date - timedelta(days=rnd.randint(0, 100)),
+                    )
+                )
+    Invitation.objects.bulk_create(invitations, ignore_conflicts=True)
+    Application.objects.bulk_create(applications)
+    DBSCheck.objects.bulk_create(dbs_checks)
+
+    referees = Referee.objects.bulk_create(
+        [Referee(application=app, referee_number=num, name=f"Referee {num}") for app in applications for num in [1, 2]]
+    )
+    Reference.objects.bulk_create(
+        [
+            Reference(
+                referee=referee,
+                referee_name=referee.name,
+                how_long_known="A long time",
+                capacity_known="Pastor",
+                known_offences=False,
+                capability_children="Wonderful",
+                character="Almost sinless",
+                concerns="None",
+                date_created=referee.application.date_saved,
+            )
+            for referee in referees
+            if rnd.random() < 0.8
+        ]
+    )
+    return latest_camp
+
+
+def normalize(slackers):
+    return sorted(
+        [{**item, "officer": item["officer"].id} for item in slackers],
+        key=lambda item: item["officer"],
+    )
+
+
+@pytest.mark.parametrize("years", [5, 10, 20])
+def test_serious_slacker_list(years):
+    camp = create_history(years)
+    results = {}
+    for func in [legacy_camp_serious_slacker_list, camp_serious_slacker_list]:
+        # Best of a few runs, to reduce noise
+        timings = []
+        for i in range(REPEATS):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                slackers = func(camp)
+                timings.append(time.perf_counter() - start)
+        results[func.__name__] = normalize(slackers)
+        print_report(
+            f"{func.__name__} with {years} years of camps",
+            [
+                ("Camps", Camp.objects.count()),
+                ("Invitations", Invitation.objects.count()),
+                ("Applications", Application.objects.count()),
+                ("DBS checks", DBSCheck.objects.count()),
+                ("Slackers", len(slackers)),
+                ("Queries", len(queries)),
+                ("Elapsed (s)", min(timings)),
+            ],
+        )
+
+    assert results["legacy_camp_serious_slacker_list"] == results["camp_serious_slacker_list"]
@@ -0,0 +1,148 @@
+"""
+Benchmark for ExcelSimpleBuilder with a large sheet, measuring time and memory.
+"""
+import time
+import tracemalloc
+from copy import copy
+from datetime import date, datetime, timedelta
+from io import BytesIO
+
+import pytest
+from django.utils import timezone
+from openpyxl import Workbook, styles
+from openpyxl.cell import Cell
+from pytz import UTC
+
+from cciw.utils import xl
+from cciw.utils.spreadsheet import ExcelSimpleBuilder
+
+from .utils import print_report
+
+pytestmark = pytest.mark.benchmark
+
+ROWS = 50_000
+
+
+def get_rows():
+    start = datetime(2020, 1, 1, 12, 0, tzinfo=UTC)
+    for i in range(ROWS):
+        yield [
+            f"First{i}",
+            f"Last{i}",
+            date(2000, 1, 1) + timedelta(days=i % 3000),
+            f"{i} The Street\nSomewhere\nAB1 2CD" if i % 3 == 0 else f"{i} The Street",
+            f"person{i}@example.com",
+            f"https://www.example.com/{i}/" if i % 5 == 0 else "",
+            i % 18,
+            start - timedelta(minutes=i),
+        ]
+
+
+HEADERS = ["First name", "Last name", "DOB", "Address", "Email", "URL", "Age", "Created"]
+
+
+def legacy_add_sheet_with_header_row(wkbk: Workbook, name: str, headers: list[str], contents: list[list[str]]):
+    # The original implementation, kept here for comparison: a normal
+    # Workbook, with styles created for every cell.
+    wksh = wkbk.create_sheet(title=name)
+
+    border = styles.Border(
+        left=styles.Side(border_style="thin"),
+        right=styles.Side(border_style="thin"),
+        top=styles.Side(border_style="thin"),
+        bottom=styles.Side(border_style="thin"),
+    )
+
+    alignment = styles.Alignment(vertical="center")
+    wrapped_alignment = styles.Alignment(vertical="center", wrapText=True)
+    date_format = "YYYY/MM/DD"
+
+    for c_idx, header in enumerate(headers, start=1):
+        cell: Cell = wksh.cell(row=1, column=c_idx, value=header)
+        cell.font = xl.header_font
+        cell.border = border
+
+    for r_idx, row in enumerate(contents, start=2):
+        normal_row_height = xl.font_size
+        row_height = normal_row_height
+        for c_idx, val in enumerate(row, start=1):
+            cell: Cell = wksh.cell(row=r_idx, column=c_idx)
+            cell.border = border
+            cell.alignment = alignment
+            cell.font = xl.default_font
+
+            if isinstance(val, str):
+                val = val.replace("\r\n", "\n")
+
+            if isinstance(val, datetime | date):
+                cell.number_format = date_format
+                if isinstance(val, datetime):
+                    if timezone.is_aware(val):
+                        val = timezone.make_naive(val, UTC)
+            else:
+                if isinstance(val, str) and "\n" in val:
+                    cell.alignment = wrapped_alignment
+                    row_height = max(row_height, xl.font_size * (val.count("\n") + 1))
+                if xl.looks_like_url(val):
+                    val = f'=HYPERLINK("{val}"; "{val}")'
+                    cell.font = xl.url_font
+            cell.value = val
+        if row_height > normal_row_height:
+            wksh.row_dimensions[r_idx].height = row_height
+
+
+def build_legacy() -> bytes:
+    wkbk = Workbook()
+    wkbk.remove(wkbk.worksheets[0])
+    legacy_add_sheet_with_header_row(wkbk, "Data", HEADERS, list(get_rows()))
+    s = BytesIO()
+    wkbk.save(s)
+    s.seek(0)
+    return s.read()
+
+
+def build_streaming() -> bytes:
+    builder = ExcelSimpleBuilder()
+    builder.add_sheet_with_header_row("Data", HEADERS, get_rows())
+    with builder.to_file() as f:
+        return f.read()
+
+
+def cell_details(content: bytes, row_indices):
+    wksh = xl.workbook_from_bytes(content)["Data"]
+    return [
+        (
+            [(c.value, c.number_format, copy(c.font), copy(c.border), copy(c.alignment)) for c in wksh[row_idx]],
+            wksh.row_dimensions[row_idx].height,
+        )
+        for row_idx in row_indices
+    ]
+
+
+def test_spreadsheet_builders():
+    results = {}
+    for build in [build_legacy, build_streaming]:
+        start = time.perf_counter()
+        content = build()
+        elapsed = time.perf_counter() - start
+        results[build.__name__] = content
+
+        # Separate run for memory, as tracemalloc slows things down a lot
+        tracemalloc.start()
+        build()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print_report(
+            f"Building spreadsheet with {build.__name__}",
+            [
+                ("Rows", ROWS),
+                ("Elapsed (s)", elapsed),
+                ("Peak memory (MB)", peak / 1024 / 1024),
+                ("Output size (MB)", len(content) / 1024 / 1024),
+            ],
+        )
+
+    # Same output for a selection of rows:
+    rows = list(range(1, 32)) + [ROWS + 1]
+    assert cell_details(results["build_legacy"], rows) == cell_details(results["build_streaming"], rows)
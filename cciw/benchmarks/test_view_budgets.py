@@ -0,0 +1,264 @@
+"""
+Query count and latency budgets for key views, with realistic data volumes.
+
+The budgets are stored in view_budgets.json next to this file. The test fails
+if a view does more queries than its budget, or is slower than its time budget.
+Query counts are deterministic, so the budget is the current count, and any new
+query (e.g. a queryset in a loop) fails the test. Time budgets are more
+generous, to allow for noisy machines.
+
+After a deliberate change, update the baseline with:
+
+    pytest --benchmarks -n0 cciw/benchmarks/test_view_budgets.py --update-view-budgets
+
+and check the diff in.
+"""
+import copy
+import json
+import random
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+from django.core import signing
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from cciw.bookings import factories as bookings_factories
+from cciw.bookings.middleware import BOOKING_COOKIE_SALT
+from cciw.bookings.models import Booking, BookingAccount, BookingState
+from cciw.cciwmain.tests import factories as camps_factories
+from cciw.db_debug import QueryRecorder, group_query_info
+from cciw.officers.models import Application, DBSCheck, Invitation, Referee, Reference
+from cciw.officers.tests import factories as officers_factories
+
+from .utils import print_report
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db(transaction=True)]
+
+BUDGETS_FILE = Path(__file__).parent / "view_budgets.json"
+
+CAMPS = 10
+ACCOUNTS = 2000
+BOOKINGS = 4000
+OFFICERS = 300
+REPEATS = 5
+# Time budgets written by --update-view-budgets are this multiple of the measured
+# time, with a minimum so that fast views don't fail due to noise:
+TIME_BUDGET_HEADROOM = 3
+MIN_TIME_BUDGET = 0.25
+
+
+def create_data():
+    rnd = random.Random(0)
+    year = date.today().year + 1
+    leader = officers_factories.create_officer()
+    camps = [
+        camps_factories.create_camp(start_date=date(year, 7, 1) + timedelta(days=7 * i), leader=leader)
+        for i in range(CAMPS)
+    ]
+    for camp in camps:
+        camp.max_campers = camp.max_male_campers = camp.max_female_campers = BOOKINGS
+        camp.save()
+    bookings_factories.create_prices(year=year)
+
+    # Bookings
+    now = timezone.now()
+    booker = bookings_factories.create_booking_account(name="Joe Bloggs", address_line1="456 My Street")
+    template = bookings_factories.create_booking(account=booker, camp=camps[0])
+    accounts = BookingAccount.objects.bulk_create(
+        [
+            BookingAccount(name=f"Booker {i}", email=f"booker{i}@example.com", address_post_code="XYZ", created_at=now)
+            for i in range(ACCOUNTS)
+        ]
+    )
+    bookings = []
+    for i in range(BOOKINGS):
+        booking = copy.copy(template)
+        booking.id = None
+        # The logged in account gets a few bookings, like a typical family
+        booking.account = booker if i < 4 else rnd.choice(accounts)
+        booking.camp = rnd.choice(camps)
+        booking.first_name = f"Child{i}"
+        booking.sex = rnd.choice(["m", "f"])
+        booking.state = rnd.choices(
+            [BookingState.BOOKED, BookingState.INFO_COMPLETE, BookingState.CANCELLED_FULL_REFUND],
+            weights=[85, 10, 5],
+        )[0]
+        booking.booked_at = now if booking.state == BookingState.BOOKED else None
+        booking.booking_expires = None
+        bookings.append(booking)
+    Booking.objects.bulk_create(bookings)
+
+    # Officers
+    invitations = []
+    applications = []
+    dbs_checks = []
+    officers = [officers_factories.create_officer(first_name=f"Joe{i:04}", password=None) for i in range(OFFICERS)]
+    for i, officer in enumerate(officers):
+        for camp in rnd.sample(camps, rnd.randint(1, 2)):
+            invitations.append(Invitation(camp=camp, officer=officer))
+        if rnd.random() < 0.8:
+            applications.append(
+                Application(
+                    officer=officer,
+                    full_name=f"Joe{i:04} Bloggs",
+                    finished=True,
+                    date_saved=date(year, 1, 1) + timedelta(days=rnd.randint(0, 150)),
+                    address_firstline=f"{i} The Street",
+                    address_town="Town",
+                    address_postcode="AB1 2CD",
+                    address_email=officer.email,
+                    birth_date=date(1990, 1, 1),
+                    dbs_check_consent=True,
+                )
+            )
+        if rnd.random() < 0.7:
+            dbs_checks.append(
+                DBSCheck(officer=officer, dbs_number=str(100000 + i), completed=date(year - rnd.randint(0, 4), 5, 1))
+            )
+    Invitation.objects.bulk_create(invitations)
+    applications = Application.objects.bulk_create(applications)
+    DBSCheck.objects.bulk_create(dbs_checks)
+    referees = Referee.objects.bulk_create(
+        [
+            Referee(
+                application=application,
+                referee_number=n,
+                name=f"Referee{n} Name",
+                address="Referee Address",
+                email=f"referee{n}-{application.id}@example.com",
+                capacity_known="Pastor",
+            )
+            for application in applications
+            for n in [1, 2]
+        ]
+    )
+    Reference.objects.bulk_create(
+        [
+            Reference(
+                referee=referee,
+                referee_name=referee.name,
+                how_long_known="A long time",
+                capacity_known="Pastor",
+                known_offences=False,
+                capability_children="Wonderful",
+                character="Good",
+                concerns="None",
+                date_created=date(year, 3, 1),
+            )
+            for referee in referees
+            if rnd.random() < 0.6
+        ]
+    )
+    return year, camps[0], leader, booker
+
+
+def get_views(year, camp, leader, booker):
+    """
+    Returns (name, client, url) for each view to be checked.
+    """
+    booking_client = Client()
+    booking_client.cookies["bookingaccount"] = signing.get_cookie_signer(
+        salt="bookingaccount" + BOOKING_COOKIE_SALT
+    ).sign(booker.id)
+    leader_client = Client()
+    leader_client.force_login(leader)
+    booking_secretary_client = Client()
+    booking_secretary_client.force_login(officers_factories.create_booking_secretary())
+    dbs_officer_client = Client()
+    dbs_officer_client.force_login(officers_factories.create_dbs_officer())
+    return [
+        ("cciw-bookings-list_bookings", booking_client, reverse("cciw-bookings-list_bookings")),
+        ("cciw-bookings-account_overview", booking_client, reverse("cciw-bookings-account_overview")),
+        # Known to be slow with this data, where nearly every account has fees
+        # outstanding: most of the time is spent rendering a row for each
+        # outstanding booking, so its time budget is much wider than the others.
+        (
+            "cciw-officers-booking_secretary_reports",
+            booking_secretary_client,
+            reverse("cciw-officers-booking_secretary_reports", kwargs=dict(year=year)),
+        ),
+        (
+            "cciw-officers-officer_list",
+            leader_client,
+            reverse("cciw-officers-officer_list", kwargs=dict(camp_id=camp.url_id)),
+        ),
+        (
+            "cciw-officers-manage_dbss",
+            dbs_officer_client,
+            reverse("cciw-officers-manage_dbss", kwargs=dict(year=year)),
+        ),
+        (
+            "cciw-officers-manage_references",
+            leader_client,
+            reverse("cciw-officers-manage_references", kwargs=dict(camp_id=camp.url_id)),
+        ),
+    ]
+
+
+def measure(client, url):
+    """
+    Returns the queries done by the last request, and the best time, for a number of requests.
+    """
+    timings = []
+    for i in range(REPEATS):
+        recorder = QueryRecorder(stacktraces=False)
+        with connection.execute_wrapper(recorder):
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, f"{url} returned {response.status_code}"
+    return recorder.queries, min(timings)
+
+
+def test_view_budgets(request):
+    year, camp, leader, booker = create_data()
+    budgets = json.loads(BUDGETS_FILE.read_text())
+    measured = {}
+    failures = []
+    for name, client, url in get_views(year, camp, leader, booker):
+        client.get(url)  # warm up caches
+        queries, elapsed = measure(client, url)
+        measured[name] = dict(queries=len(queries), seconds=elapsed)
+        budget = budgets.get(name)
+        print_report(
+            name,
+            [
+                ("Queries", len(queries)),
+                ("Query budget", budget["queries"] if budget else "-"),
+                ("Elapsed (s)", elapsed),
+                ("Time budget (s)", budget["seconds"] if budget else "-"),
+            ],
+        )
+        if budget is None:
+            failures.append(f"{name}: no budget in {BUDGETS_FILE.name}")
+            continue
+        if len(queries) > budget["queries"]:
+            message = f"{name}: {len(queries)} queries, budget {budget['queries']}"
+            duplicates = max(group_query_info(queries), key=len)
+            if len(duplicates) > 1:
+                message += f". Most repeated query ({len(duplicates)} times): {duplicates[0].sql}"
+            failures.append(message)
+        if elapsed > budget["seconds"]:
+            failures.append(f"{name}: {elapsed:.3f}s, budget {budget['seconds']}s")
+
+    if request.config.option.update_view_budgets:
+        BUDGETS_FILE.write_text(
+            json.dumps(
+                {
+                    name: dict(
+                        queries=values["queries"],
+                        seconds=max(round(values["seconds"] * TIME_BUDGET_HEADROOM, 2), MIN_TIME_BUDGET),
+                    )
+                    for name, values in measured.items()
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+        return
+    assert not failures, "View budgets exceeded:\n" + "\n".join(failures)
@@ -0,0 +1,54 @@
+"""
+Utilities for writing benchmarks
+"""
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Timings:
+    """
+    Collects durations of a repeated operation. Can be shared between threads.
+    """
+
+    durations: list[float] = field(default_factory=list)
+
+    @contextmanager
+    def timed(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # list.append is atomic, so this is thread safe
+            self.durations.append(time.perf_counter() - start)
+
+    @property
+    def count(self) -> int:
+        return len(self.durations)
+
+    @property
+    def total(self) -> float:
+        return sum(self.durations)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.durations else 0.0
+
+    @property
+    def max(self) -> float:
+        return max(self.durations, default=0.0)
+
+
+def print_report(title: str, rows: list[tuple[str, object]]) -> None:
+    """
+    Prints a simple 2 column report of (label, value) rows
+    """
+    print()
+    print(title)
+    print("-" * len(title))
+    width = max(len(label) for label, _ in rows)
+    for label, value in rows:
+        if isinstance(value, float):
+            value = f"{value:.4f}"
+        print(f"{label.ljust(width)}  {value}")
@@ -1,5 +1,7 @@
 import base64
 import binascii
+import logging
+import time
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 
@@ -13,6 +15,8 @@ from django.utils import timezone
 from cciw.cciwmain import common
 from cciw.officers.email import admin_emails_for_camp
 
+logger = logging.getLogger(__name__)
+
 
 class VerifyFailed:
     pass
@@ -153,9 +157,20 @@ def send_places_confirmed_email(bookings):
                 queued_mail.send_mail(subject, body, settings.SERVER_EMAIL, emails)
 
 
-def send_booking_expiry_mail(account, bookings, expired):
+def send_booking_expiry_mails(expiry_mails):
+    """
+    Sends booking expiry emails over a single connection, for a list of
+    (account, bookings, expired) tuples.
+    """
+    messages = [_build_booking_expiry_mail(*args) for args in expiry_mails]
+    messages = [message for message in messages if message is not None]
+    if messages:
+        mail.get_connection().send_messages(messages)
+
+
+def _build_booking_expiry_mail(account, bookings, expired):
     if not account.email:
-        return
+        return None
 
     c = {
         "domain": common.get_current_domain(),
@@ -169,7 +184,7 @@ def send_booking_expiry_mail(account, bookings, expired):
         subject = "[CCIW] Booking expired"
     else:
         subject = "[CCIW] Booking expiry warning"
-    mail.send_mail(subject, body, settings.WEBMASTER_FROM_EMAIL, [account.email])
+    return mail.EmailMessage(subject, body, settings.WEBMASTER_FROM_EMAIL, [account.email])
 
 
 def send_booking_approved_mail(booking):
@@ -206,30 +221,98 @@ def send_booking_confirmed_mail(booking):
     return True
 
 
-def send_payment_reminder_emails():
-    from cciw.bookings.models import BookingAccount
+# Number of payment reminders rendered and sent at a time, over the same connection:
+PAYMENT_REMINDER_BATCH_SIZE = 100
 
-    accounts = BookingAccount.objects.payments_due()
 
-    subject = "[CCIW] Payment due"
-    now = timezone.now()
-    for account in accounts:
+@dataclass
+class PaymentReminderReport:
+    accounts_due: int
+    skipped_recently_reminded: int
+    skipped_no_email: int
+    # The accounts that were sent a reminder, or would be for a dry run:
+    accounts: list
+    dry_run: bool
+    find_time: float
+    send_time: float
+
+    def as_rows(self) -> list[tuple[str, object]]:
+        return [
+            ("Accounts with payments due", self.accounts_due),
+            ("Skipped, reminded recently", self.skipped_recently_reminded),
+            ("Skipped, no email", self.skipped_no_email),
+            ("Would send" if self.dry_run else "Sent", len(self.accounts)),
+            ("Finding accounts (s)", f"{self.find_time:.2f}"),
+            ("Sending (s)", f"{self.send_time:.2f}"),
+        ]
+
+
+def send_payment_reminder_emails(*, now: datetime = None, dry_run: bool = False) -> PaymentReminderReport:
+    """
+    Sends reminders to accounts that have payments due, unless they have been
+    reminded recently. With `dry_run=True`, nothing is sent or saved, and the
+    returned report lists the accounts that would be sent reminders.
+    """
+    from cciw.bookings.models import BookingAccount
+
+    if now is None:
+        now = timezone.now()
+    start = time.perf_counter()
+    # Balances for all accounts are calculated in a single query.
+    accounts_due = BookingAccount.objects.payments_due()
+    recently_reminded, no_email, accounts = [], [], []
+    for account in accounts_due:
         if (
             account.last_payment_reminder is not None
             and (now - account.last_payment_reminder) < settings.BOOKING_EMAIL_REMINDER_FREQUENCY
         ):
-            continue
-
-        if account.email is None:
-            continue
-
-        account.last_payment_reminder = now
-        account.save()
-
-        c = {
-            "domain": common.get_current_domain(),
-            "account": account,
-            "token": EmailVerifyTokenGenerator().token_for_email(account.email),
-        }
-        body = loader.render_to_string("cciw/bookings/payments_due_email.txt", c)
-        mail.send_mail(subject, body, settings.WEBMASTER_FROM_EMAIL, [account.email])
+            recently_reminded.append(account)
+        elif not account.email:
+            no_email.append(account)
+        else:
+            accounts.append(account)
+    find_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if not dry_run and accounts:
+        c = {"domain": common.get_current_domain()}
+        token_generator = EmailVerifyTokenGenerator()
+        with mail.get_connection() as connection:
+            for i in range(0, len(accounts), PAYMENT_REMINDER_BATCH_SIZE):
+                batch = accounts[i : i + PAYMENT_REMINDER_BATCH_SIZE]
+                # Each batch is marked immediately before it is sent, so that an
+                # error part way through doesn't cause repeated reminders for
+                # batches already sent, and doesn't stop reminders for batches
+                # not yet sent when the job is run again.
+                BookingAccount.objects.filter(id__in=[account.id for account in batch]).update(
+                    last_payment_reminder=now
+                )
+                for account in batch:
+                    account.last_payment_reminder = now
+                connection.send_messages(
+                    [_build_payment_reminder_mail(account, c, token_generator) for account in batch]
+                )
+    send_time = time.perf_counter() - start
+
+    report = PaymentReminderReport(
+        accounts_due=len(accounts_due),
+        skipped_recently_reminded=len(recently_reminded),
+        skipped_no_email=len(no_email),
+        accounts=accounts,
+        dry_run=dry_run,
+        find_time=find_time,
+        send_time=send_time,
+    )
+    if not dry_run:
+        logger.info("Payment reminders: %s", ", ".join(f"{name}: {value}" for name, value in report.as_rows()))
+    return report
+
+
+def _build_payment_reminder_mail(account, c, token_generator):
+    c = c | {
+        "account": account,
+        "token": token_generator.token_for_email(account.email),
+    }
+    body = loader.render_to_string("cciw/bookings/payments_due_email.txt", c)
+    subject = "[CCIW] Payment due"
+    return mail.EmailMessage(subject, body, settings.WEBMASTER_FROM_EMAIL, [account.email])
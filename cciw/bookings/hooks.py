@@ -1,13 +1,18 @@
 from django.conf import settings
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import post_delete, post_save, pre_delete
 from paypal.standard.ipn.signals import invalid_ipn_received, valid_ipn_received
 
+from cciw.cciwmain.hooks import public_pages_changed
 from cciw.donations.views import DONATION_CUSTOM_VALUE, send_donation_received_email
 
 from .email import send_pending_payment_email, send_unrecognised_payment_email
 from .models import (
     AccountTransferPayment,
+    Booking,
+    BookingStatsYear,
+    CampPlacesBooked,
     ManualPayment,
+    Price,
     RefundPayment,
     WriteOffDebt,
     credit_account,
@@ -91,6 +96,18 @@ def account_transfer_payment_deleted(sender, **kwargs):
     credit_account(-instance.amount, instance.to_account, None)
 
 
+# == Places and stats ==
+
+
+def booking_deleted(sender, **kwargs):
+    instance = kwargs["instance"]
+    # Called within the transaction for the delete
+    place, stats_key = instance.get_saved_place_and_stats_key_for_update()
+    CampPlacesBooked.objects.record_change(old_place=place, new_place=None)
+    if stats_key is not None:
+        BookingStatsYear.objects.mark_stale_for_camps([stats_key[0]])
+
+
 # == Wiring ==
 
 valid_ipn_received.connect(paypal_payment_received)
@@ -103,3 +120,8 @@ post_save.connect(account_transfer_payment_received, sender=AccountTransferPayme
 post_delete.connect(account_transfer_payment_deleted, sender=AccountTransferPayment)
 post_save.connect(write_off_debt_created, sender=WriteOffDebt)
 post_delete.connect(write_off_debt_deleted, sender=WriteOffDebt)
+pre_delete.connect(booking_deleted, sender=Booking)
+
+# Public pages show whether booking is open (see is_booking_open), which depends on prices:
+post_save.connect(public_pages_changed, sender=Price)
+post_delete.connect(public_pages_changed, sender=Price)
@@ -4,5 +4,19 @@ from cciw.bookings.email import send_payment_reminder_emails
 
 
 class Command(BaseCommand):
-    def handle(self, *args, **options):
-        send_payment_reminder_emails()
+    help = "Send reminders to booking accounts that have payments due"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true", help="List the accounts that would be sent reminders, without sending"
+        )
+
+    def handle(self, *args, dry_run=False, verbosity=1, **options):
+        report = send_payment_reminder_emails(dry_run=dry_run)
+        if dry_run:
+            for account in report.accounts:
+                self.stdout.write(f"{account.email:<50} {account.name:<30} £{account.confirmed_balance_due}")
+        # This runs from cron, so by default is silent unless dry_run
+        if dry_run or verbosity > 1:
+            for name, value in report.as_rows():
+                self.stdout.write(f"{name + ':':<30} {value}")
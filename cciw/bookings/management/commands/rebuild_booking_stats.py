@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from cciw.bookings.stats import rebuild_booking_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored booking statistics for all years"
+
+    def handle(self, *args, **options):
+        rebuild_booking_stats()
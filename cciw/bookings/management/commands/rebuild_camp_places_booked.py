@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from cciw.bookings.models import rebuild_camp_places_booked
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalised counts of booked places for all camps"
+
+    def handle(self, *args, **options):
+        rebuild_camp_places_booked()
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.3 on 2026-10-18 21:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_camp_places_booked(apps, schema_editor):
+    Booking = apps.get_model("bookings", "Booking")
+    Camp = apps.get_model("cciwmain", "Camp")
+    CampPlacesBooked = apps.get_model("bookings", "CampPlacesBooked")
+    BOOKED = 2
+    counts = {
+        row["camp_id"]: row
+        for row in Booking.objects.filter(state=BOOKED)
+        .order_by()
+        .values("camp_id")
+        .annotate(
+            male=models.Count("id", filter=models.Q(sex="m")),
+            female=models.Count("id", filter=models.Q(sex="f")),
+        )
+    }
+    CampPlacesBooked.objects.bulk_create(
+        [
+            CampPlacesBooked(
+                camp_id=camp_id,
+                male=counts.get(camp_id, {}).get("male", 0),
+                female=counts.get(camp_id, {}).get("female", 0),
+            )
+            for camp_id in Camp.objects.values_list("id", flat=True)
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("cciwmain", "0002_camp_officers"),
+        ("bookings", "0001_squashed_0057_default_country"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CampPlacesBooked",
+            fields=[
+                (
+                    "camp",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="places_booked",
+                        serialize=False,
+                        to="cciwmain.camp",
+                    ),
+                ),
+                ("male", models.IntegerField(default=0)),
+                ("female", models.IntegerField(default=0)),
+            ],
+            options={
+                "verbose_name_plural": "camp places booked",
+            },
+        ),
+        migrations.RunPython(populate_camp_places_booked, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.3 on 2026-10-18 23:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("cciwmain", "0002_camp_officers"),
+        ("bookings", "0058_camp_places_booked"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookingStatsYear",
+            fields=[
+                ("year", models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ("built_at", models.DateTimeField(blank=True, null=True)),
+                ("stale", models.BooleanField(default=True)),
+            ],
+            options={
+                "verbose_name_plural": "booking stats years",
+            },
+        ),
+        migrations.CreateModel(
+            name="BookingStatsCount",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("booked_on", models.DateField()),
+                ("sex", models.CharField(choices=[("m", "Male"), ("f", "Female")], max_length=1)),
+                ("age", models.SmallIntegerField(help_text="Age on camp")),
+                ("count", models.PositiveIntegerField()),
+                (
+                    "camp",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to="cciwmain.camp"
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("bookings", "0059_booking_stats"),
+    ]
+
+    operations = [
+        # Uncompressed out-of-line storage, so that Document.iter_content() can
+        # read chunks without reading the whole value. Uploads are mostly
+        # already compressed formats, so we lose little.
+        migrations.RunSQL(
+            "ALTER TABLE bookings_supportinginformationdocument ALTER COLUMN content SET STORAGE EXTERNAL;",
+            "ALTER TABLE bookings_supportinginformationdocument ALTER COLUMN content SET STORAGE EXTENDED;",
+        ),
+    ]
@@ -1,8 +1,9 @@
 """
 Accounts and places for campers coming in camps
 """
+import itertools
 import re
-from collections import defaultdict
+from collections import Counter, defaultdict
 from datetime import date, datetime, timedelta
 from decimal import Decimal
 from functools import lru_cache
@@ -12,8 +13,8 @@ from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
 from django.core.exceptions import ValidationError
-from django.db import models, transaction
-from django.db.models import Prefetch, Q, functions
+from django.db import connection, models, transaction
+from django.db.models import Q, functions
 from django.db.models.expressions import RawSQL
 from django.urls import reverse
 from django.utils import timezone
@@ -24,12 +25,12 @@ from django_countries.fields import CountryField
 from paypal.standard.ipn.models import PayPalIPN
 
 from cciw.cciwmain import common
-from cciw.cciwmain.models import Camp
+from cciw.cciwmain.models import Camp, PlacesLeft
 from cciw.documents.fields import DocumentField
 from cciw.documents.models import Document, DocumentManager, DocumentQuerySet
 from cciw.utils.models import AfterFetchQuerySetMixin
 
-from .email import send_booking_expiry_mail, send_places_confirmed_email
+from .email import send_booking_expiry_mails, send_places_confirmed_email
 
 # = Business rules =
 #
@@ -326,6 +327,63 @@ class BookingAccountQuerySet(models.QuerySet):
         # See also above
         return self._with_total_amount_due().exclude(total_amount_due=models.F("total_received"))
 
+    def include_in_mailings(self):
+        # See BookingAccount.include_in_mailings
+        return self.filter(Q(subscribe_to_mailings__isnull=True) | Q(subscribe_to_mailings=True))
+
+    def with_balances(self):
+        """
+        Annotates accounts with balances calculated in the database:
+
+        - `balance_full`
+        - `balance_due_now`
+        - `confirmed_balance`
+        - `confirmed_balance_due`
+
+        These match `BookingAccount.get_balance()` with the corresponding
+        `confirmed_only` and `allow_deposits` arguments.
+        """
+        # See also BookingAccount.get_balance(), which is the reference
+        # implementation, Booking.is_payable() and Booking.amount_now_due()
+
+        # Deposit prices are looked up first, so that the rest is a single
+        # aggregate query with no subqueries.
+        cutoff = date.today() + settings.BOOKING_FULL_PAYMENT_DUE
+        deposit_price = models.Case(
+            *[
+                models.When(bookings__camp__year=year, then=models.Value(price))
+                for year, price in Price.get_deposit_prices().items()
+            ],
+            default=None,
+            output_field=models.DecimalField(decimal_places=2, max_digits=10),
+        )
+        amount_now_due_with_deposits = models.Case(
+            models.When(
+                bookings__camp__start_date__gt=cutoff,
+                then=functions.Least(deposit_price, models.F("bookings__amount_due")),
+            ),
+            default=models.F("bookings__amount_due"),
+        )
+        cancelled_payable = Q(
+            bookings__state__in=[BookingState.CANCELLED_DEPOSIT_KEPT, BookingState.CANCELLED_HALF_REFUND]
+        )
+        booked = Q(bookings__state=BookingState.BOOKED)
+        confirmed = booked & Q(bookings__booking_expires__isnull=True)
+
+        def balance(amount, payable_filter):
+            return models.ExpressionWrapper(
+                functions.Coalesce(models.Sum(amount, filter=payable_filter), models.Value(Decimal(0)))
+                - models.F("total_received"),
+                output_field=models.DecimalField(decimal_places=2, max_digits=10),
+            )
+
+        return self.annotate(
+            balance_full=balance(models.F("bookings__amount_due"), cancelled_payable | booked),
+            balance_due_now=balance(amount_now_due_with_deposits, cancelled_payable | booked),
+            confirmed_balance=balance(models.F("bookings__amount_due"), cancelled_payable | confirmed),
+            confirmed_balance_due=balance(amount_now_due_with_deposits, cancelled_payable | confirmed),
+        )
+
 
 class BookingAccountManagerBase(models.Manager):
     def payments_due(self):
@@ -333,24 +391,9 @@ class BookingAccountManagerBase(models.Manager):
         Returns a list of accounts that owe money.
         Account objects are annotated with attribute 'confirmed_balance_due' as a Decimal
         """
-        # To limit the size of queries, we do a SQL query for people who might
-        # owe money.
-        potentials = self.get_queryset().non_zero_final_balance()
         # 'balance due now' can be less than 'final balance', because we accept
         # deposit as sufficient in some cases.
-        retval = []
-        price_checker = PriceChecker()
-        account: BookingAccount
-        for account in potentials:
-            confirmed_balance_due = account.get_balance(
-                confirmed_only=True,
-                allow_deposits=True,
-                price_checker=price_checker,
-            )
-            if confirmed_balance_due > 0:
-                account.confirmed_balance_due = confirmed_balance_due
-                retval.append(account)
-        return retval
+        return list(self.get_queryset().with_balances().filter(confirmed_balance_due__gt=0))
 
 
 BookingAccountManager = BookingAccountManagerBase.from_queryset(BookingAccountQuerySet)
@@ -488,8 +531,9 @@ class BookingAccount(models.Model):
     def receive_payment(self, amount):
         """
         Adds the amount to the account's total_received field.  This should only
-        ever be called by the 'process_all_payments' function. Client code
-        should use the 'send_payment' function.
+        ever be called by the 'process_all_payments' function, which may pass
+        the sum of several payments. Client code should use the 'send_payment'
+        function.
         """
         # See process_all_payments function for an explanation of the above
 
@@ -598,6 +642,7 @@ class BookingAccount(models.Model):
             places_confirmed_handler(bookings=confirmed_bookings)
 
     def get_pending_payment_total(self, now=None):
+        # See also get_pending_payment_totals()
         if now is None:
             now = timezone.now()
 
@@ -911,6 +956,53 @@ class Booking(models.Model):
     def __str__(self):
         return f"{self.name}, {self.camp.url_id}, {self.account}"
 
+    # Place counting.
+    #
+    # `CampPlacesBooked` stores denormalised counts of booked places, which
+    # must be kept in sync with every save/delete. To do this we read which
+    # place (if any) the booking occupies in the database, locking the row, and
+    # apply the difference when it is saved, in the same transaction. The row
+    # must be read, rather than remembered from when the instance was loaded,
+    # because another copy of the same booking (e.g. from a double submitted
+    # form) may have been saved since.
+    #
+    # Similarly, `BookingStatsYear` needs to know when a confirmed booking has
+    # changed in a way that affects booking statistics, so we read the
+    # `stats key` as well.
+
+    def get_saved_place_and_stats_key_for_update(self):
+        """
+        Returns the (camp_id, sex) place this booking occupies in the database,
+        or None, and the stats key for it, or None, locking the row until the
+        end of the transaction.
+        """
+        if self.id is None:
+            return None, None
+        values = Booking.objects.filter(id=self.id).select_for_update(of=("self",)).values(*STATS_KEY_FIELDS).first()
+        if values is None:
+            return None, None
+        return (
+            _get_counted_place(camp_id=values["camp_id"], sex=values["sex"], state=values["state"]),
+            _get_stats_key(**values),
+        )
+
+    def save(self, **kwargs):
+        update_fields = kwargs.get("update_fields", None)
+        if update_fields is not None and not ({"camp", "sex", "state"} | set(STATS_KEY_FIELDS)) & set(update_fields):
+            return super().save(**kwargs)
+
+        with transaction.atomic():
+            old_place, old_stats_key = self.get_saved_place_and_stats_key_for_update()
+            retval = super().save(**kwargs)
+            new_place = _get_counted_place(camp_id=self.camp_id, sex=self.sex, state=self.state)
+            CampPlacesBooked.objects.record_change(old_place=old_place, new_place=new_place)
+            new_stats_key = _get_stats_key(**{f: getattr(self, f) for f in STATS_KEY_FIELDS})
+            if old_stats_key != new_stats_key:
+                BookingStatsYear.objects.mark_stale_for_camps(
+                    [key[0] for key in [old_stats_key, new_stats_key] if key is not None]
+                )
+        return retval
+
     @property
     def name(self):
         return f"{self.first_name} {self.last_name}"
@@ -934,7 +1026,7 @@ class Booking(models.Model):
         self.save()
 
     def is_payable(self, *, confirmed_only: bool):
-        # See also BookingQuerySet.payable()
+        # See also BookingQuerySet.payable(), BookingAccountQuerySet.with_balances()
         return self.state in [BookingState.CANCELLED_DEPOSIT_KEPT, BookingState.CANCELLED_HALF_REFUND] or (
             self.is_confirmed if confirmed_only else self.is_booked
         )
@@ -947,22 +1039,27 @@ class Booking(models.Model):
     def is_confirmed(self):
         return self.is_booked and self.booking_expires is None
 
-    def expected_amount_due(self):
+    def expected_amount_due(self, *, price_checker: PriceChecker | None = None):
+        def get_price(price_type):
+            if price_checker is None:
+                return Price.objects.get(year=self.camp.year, price_type=price_type).price
+            return price_checker.get_price(self.camp.year, price_type)
+
         if self.price_type == PriceType.CUSTOM:
             return None
         if self.state == BookingState.CANCELLED_DEPOSIT_KEPT:
-            return Price.objects.get(year=self.camp.year, price_type=PriceType.DEPOSIT).price
+            return get_price(PriceType.DEPOSIT)
         elif self.state == BookingState.CANCELLED_FULL_REFUND:
             return Decimal("0.00")
         else:
-            amount = Price.objects.get(year=self.camp.year, price_type=self.price_type).price
+            amount = get_price(self.price_type)
             # For booking 2015 and later, this is not needed, but it kept in
             # case we need to query the expected amount due for older bookings.
             if self.south_wales_transport:
-                amount += Price.objects.get(price_type=PriceType.SOUTH_WALES_TRANSPORT, year=self.camp.year).price
+                amount += get_price(PriceType.SOUTH_WALES_TRANSPORT)
 
             if self.early_bird_discount:
-                amount -= Price.objects.get(price_type=PriceType.EARLY_BIRD_DISCOUNT, year=self.camp.year).price
+                amount -= get_price(PriceType.EARLY_BIRD_DISCOUNT)
 
             # For booking 2015 and later, there are no half refunds,
             # but this is kept in in case we need to query the expected amount due for older
@@ -972,8 +1069,8 @@ class Booking(models.Model):
 
             return amount
 
-    def auto_set_amount_due(self):
-        amount = self.expected_amount_due()
+    def auto_set_amount_due(self, *, price_checker: PriceChecker | None = None):
+        amount = self.expected_amount_due(price_checker=price_checker)
         if amount is None:
             # This happens for PriceType.CUSTOM
             if self.amount_due is None:
@@ -986,6 +1083,7 @@ class Booking(models.Model):
         # Amount due at this point of time. If allow_deposits=True, we take into
         # account the fact that only a deposit might be due. Otherwise we ignore
         # deposits (which means that the current date is also ignored)
+        # See also BookingAccountQuerySet.with_balances()
         cutoff = today + settings.BOOKING_FULL_PAYMENT_DUE
         if allow_deposits and self.camp.start_date > cutoff:
             deposit_price = price_checker.get_deposit_price(self.camp.year)
@@ -1068,6 +1166,7 @@ class Booking(models.Model):
         )
 
     def get_booking_errors(self, booking_sec=False, agreement_fetcher=None) -> list[str]:
+        # See also BasketValidator.get_booking_errors
         errors = []
         camp: Camp = self.camp
 
@@ -1188,16 +1287,6 @@ class Booking(models.Model):
         # want to display message about there being no places for boys etc.
         places_available = True
 
-        def no_places_available_message(msg):
-            # Add a common message to each different "no places available" message
-            return format_html(
-                """{0}
-                You can <a href="{1}" target="_new">contact the booking secretary</a>
-                to be put on a waiting list. """,
-                msg,
-                reverse("cciw-contact_us-send") + "?bookings",
-            )
-
         # Simple - no places left
         if places_left.total <= 0:
             errors.append(no_places_available_message("There are no places left on this camp."))
@@ -1265,13 +1354,7 @@ class Booking(models.Model):
         on_date = self.booked_at if self.is_booked and self.booked_at is not None else date.today()
 
         if not camp.open_for_bookings(on_date):
-            if on_date >= camp.end_date:
-                msg = "This camp has already finished."
-            elif on_date >= camp.start_date:
-                msg = "This camp is closed for bookings because it has already started."
-            else:
-                msg = "This camp is closed for bookings."
-            errors.append(msg)
+            errors.append(camp_closed_message(camp, on_date))
 
         missing_agreements = self.get_missing_agreements(agreement_fetcher=agreement_fetcher)
         for agreement in missing_agreements:
@@ -1280,17 +1363,14 @@ class Booking(models.Model):
         return errors
 
     def get_booking_warnings(self, booking_sec=False) -> list[str]:
+        # See also BasketValidator.get_booking_warnings
         camp: Camp = self.camp
         warnings = []
 
         if self.account.bookings.filter(first_name=self.first_name, last_name=self.last_name, camp=camp).exclude(
             id=self.id
         ):
-            warnings.append(
-                f"You have entered another set of place details for a camper "
-                f"called '{self.name}' on camp {camp.name}. Please ensure you don't book multiple "
-                f"places for the same camper!"
-            )
+            warnings.append(duplicate_camper_warning(self))
 
         relevant_bookings = self.account.bookings.for_year(camp.year).in_basket_or_booked()
 
@@ -1298,34 +1378,13 @@ class Booking(models.Model):
             full_pricers = relevant_bookings.filter(price_type=PriceType.FULL)
             names = sorted({b.name for b in full_pricers})
             if len(names) > 1:
-                pretty_names = ", ".join(names[1:]) + " and " + names[0]
-                warning = "You have multiple places at 'Full price'. "
-                if len(names) == 2:
-                    warning += (
-                        f"If {pretty_names} are from the same family, one is eligible for the 2nd child discount."
-                    )
-                else:
-                    warning += f"If {pretty_names} are from the same family, one or more is eligible for the 2nd or 3rd child discounts."
-
-                warnings.append(warning)
+                warnings.append(multiple_full_price_warning(names))
 
         if self.price_type == PriceType.SECOND_CHILD:
             second_childers = relevant_bookings.filter(price_type=PriceType.SECOND_CHILD)
             names = sorted({b.name for b in second_childers})
             if len(names) > 1:
-                pretty_names = ", ".join(names[1:]) + " and " + names[0]
-                warning = "You have multiple places at '2nd child discount'. "
-                if len(names) == 2:
-                    warning += (
-                        f"If {pretty_names} are from the same family, one is eligible " f"for the 3rd child discount."
-                    )
-                else:
-                    warning += (
-                        f"If {pretty_names} are from the same family, {len(names) - 1} are eligible "
-                        f"for the 3rd child discount."
-                    )
-
-                warnings.append(warning)
+                warnings.append(multiple_second_child_warning(names))
 
         return warnings
 
@@ -1334,6 +1393,7 @@ class Booking(models.Model):
         self.save()
 
     def expire(self):
+        # See also expire_bookings(), which does this in bulk
         self._unbook()
         self.save()
 
@@ -1342,7 +1402,7 @@ class Booking(models.Model):
         self.shelved = True
         self.save()
 
-    def _unbook(self):
+    def _unbook(self, *, price_checker: PriceChecker | None = None):
         self.booking_expires = None
         # Here we don't use BookingState.CANCELLED_FULL_REFUND,
         # because we assume the user might want to edit and book
@@ -1350,8 +1410,7 @@ class Booking(models.Model):
         self.state = BookingState.INFO_COMPLETE
         self.early_bird_discount = False
         self.booked_at = None
-        self.auto_set_amount_due()
-        self.save()
+        self.auto_set_amount_due(price_checker=price_checker)
 
     def is_user_editable(self):
         return self.state == BookingState.INFO_COMPLETE or self.state == BookingState.BOOKED and self.missing_agreements
@@ -1422,6 +1481,501 @@ class Booking(models.Model):
         )
 
 
+def no_places_available_message(msg):
+    # Add a common message to each different "no places available" message
+    return format_html(
+        """{0}
+                You can <a href="{1}" target="_new">contact the booking secretary</a>
+                to be put on a waiting list. """,
+        msg,
+        reverse("cciw-contact_us-send") + "?bookings",
+    )
+
+
+def camp_closed_message(camp: Camp, on_date: date) -> str:
+    if on_date >= camp.end_date:
+        return "This camp has already finished."
+    elif on_date >= camp.start_date:
+        return "This camp is closed for bookings because it has already started."
+    else:
+        return "This camp is closed for bookings."
+
+
+def duplicate_camper_warning(booking: Booking) -> str:
+    return (
+        f"You have entered another set of place details for a camper "
+        f"called '{booking.name}' on camp {booking.camp.name}. Please ensure you don't book multiple "
+        f"places for the same camper!"
+    )
+
+
+def multiple_full_price_warning(names: list[str]) -> str:
+    pretty_names = ", ".join(names[1:]) + " and " + names[0]
+    warning = "You have multiple places at 'Full price'. "
+    if len(names) == 2:
+        warning += f"If {pretty_names} are from the same family, one is eligible for the 2nd child discount."
+    else:
+        warning += (
+            f"If {pretty_names} are from the same family, one or more is eligible for the 2nd or 3rd child discounts."
+        )
+    return warning
+
+
+def multiple_second_child_warning(names: list[str]) -> str:
+    pretty_names = ", ".join(names[1:]) + " and " + names[0]
+    warning = "You have multiple places at '2nd child discount'. "
+    if len(names) == 2:
+        warning += f"If {pretty_names} are from the same family, one is eligible for the 3rd child discount."
+    else:
+        warning += (
+            f"If {pretty_names} are from the same family, {len(names) - 1} are eligible for the 3rd child discount."
+        )
+    return warning
+
+
+class BasketValidator:
+    """
+    Finds booking problems for bookings of a single account and year, loading
+    the data needed up front, instead of running queries for each booking.
+    """
+
+    # This must give exactly the same results as Booking.get_booking_problems(),
+    # which remains the reference implementation, and is used for cases this
+    # doesn't handle. If you change the business rules in one, change them in
+    # the other. Tests check that they agree.
+
+    def __init__(self, *, account: BookingAccount, year: int, agreement_fetcher: AgreementFetcher | None = None):
+        self.account = account
+        self.year = year
+        self.agreement_fetcher = agreement_fetcher or AgreementFetcher()
+        # Current state of the account's bookings, from the DB.
+        self.account_bookings: list[Booking] = list(
+            Booking.objects.filter(account=account).for_year(year).select_related("camp__camp_name")
+        )
+        self._places_left: dict[int, PlacesLeft] = {}
+
+    def _load_places_left(self, camps: list[Camp]):
+        camps = [camp for camp in camps if camp.id not in self._places_left]
+        if not camps:
+            return
+        counts = {
+            camp_id: (male, female)
+            for camp_id, male, female in CampPlacesBooked.objects.filter(
+                camp_id__in=[camp.id for camp in camps]
+            ).values_list("camp_id", "male", "female")
+        }
+        for camp in camps:
+            males_booked, females_booked = counts.get(camp.id, (0, 0))
+            self._places_left[camp.id] = camp.get_places_left_for_booked(
+                males_booked=males_booked, females_booked=females_booked
+            )
+
+    def get_places_left(self, camp: Camp) -> PlacesLeft:
+        self._load_places_left([camp] + [b.camp for b in self.account_bookings])
+        return self._places_left[camp.id]
+
+    def _can_handle(self, booking: Booking) -> bool:
+        return booking.account_id == self.account.id and booking.camp.year == self.year
+
+    def get_booking_problems(self, booking: Booking, booking_sec=False) -> tuple[list[str], list[str]]:
+        """
+        Returns a two tuple (errors, warnings), as per Booking.get_booking_problems()
+        """
+        if not self._can_handle(booking):
+            return booking.get_booking_problems(booking_sec=booking_sec, agreement_fetcher=self.agreement_fetcher)
+
+        if booking.state == BookingState.APPROVED and not booking_sec:
+            return ([], [])
+
+        return (
+            self.get_booking_errors(booking, booking_sec=booking_sec),
+            self.get_booking_warnings(booking, booking_sec=booking_sec),
+        )
+
+    def _relevant_bookings(self) -> list[Booking]:
+        # See BookingQuerySet.in_basket_or_booked()
+        return [b for b in self.account_bookings if _is_in_basket(b) or b.is_booked]
+
+    def get_booking_errors(self, booking: Booking, booking_sec=False) -> list[str]:
+        # See also Booking.get_booking_errors(), for more explanation of the rules.
+        if not self._can_handle(booking):
+            return booking.get_booking_errors(booking_sec=booking_sec, agreement_fetcher=self.agreement_fetcher)
+
+        errors = []
+        camp: Camp = booking.camp
+
+        # Custom price - not auto bookable
+        if booking.price_type == PriceType.CUSTOM:
+            errors.append("A custom discount needs to be arranged by the booking secretary")
+
+        relevant_bookings = self._relevant_bookings()
+        relevant_bookings_excluding_self = [
+            b
+            for b in relevant_bookings
+            if not (b.first_name == booking.first_name and b.last_name == booking.last_name)
+        ]
+        relevant_bookings_limited_to_self = [
+            b for b in relevant_bookings if b.first_name == booking.first_name and b.last_name == booking.last_name
+        ]
+
+        # 2nd/3rd child discounts
+        if booking.price_type == PriceType.SECOND_CHILD:
+            if not any(b.price_type == PriceType.FULL for b in relevant_bookings_excluding_self):
+                errors.append(
+                    "You cannot use a 2nd child discount unless you have "
+                    "another child at full price. Please edit the place details "
+                    "and choose an appropriate price type."
+                )
+
+        if booking.price_type == PriceType.THIRD_CHILD:
+            other_children = [
+                b for b in relevant_bookings_excluding_self if b.price_type in [PriceType.FULL, PriceType.SECOND_CHILD]
+            ]
+            if len(other_children) < 2:
+                errors.append(
+                    "You cannot use a 3rd child discount unless you have "
+                    "two other children without this discount. Please edit the "
+                    "place details and choose an appropriate price type."
+                )
+
+        if booking.price_type in [PriceType.SECOND_CHILD, PriceType.THIRD_CHILD]:
+            discounted = [
+                b
+                for b in relevant_bookings_limited_to_self
+                if b.price_type in [PriceType.SECOND_CHILD, PriceType.THIRD_CHILD]
+            ]
+            if len(discounted) > 1:
+                errors.append("If a camper goes on multiple camps, only one place may use a 2nd/3rd child discount.")
+
+        # serious illness
+        if booking.serious_illness:
+            errors.append("Must be approved by leader due to serious illness/condition")
+
+        # Check age.
+        camper_age = booking.age_on_camp()
+        age_base = booking.age_base_date().strftime("%e %B %Y")
+        if booking.is_too_young():
+            errors.append(
+                f"Camper will be {camper_age} which is below the minimum age ({camp.minimum_age}) on {age_base}"
+            )
+
+        if booking.is_too_old():
+            errors.append(
+                f"Camper will be {camper_age} which is above the maximum age ({camp.maximum_age}) on {age_base}"
+            )
+
+        # Check place availability
+        places_left = self.get_places_left(camp)
+        places_available = True
+
+        if places_left.total <= 0:
+            errors.append(no_places_available_message("There are no places left on this camp."))
+            places_available = False
+
+        SEXES = [
+            (Sex.MALE, "boys", places_left.male),
+            (Sex.FEMALE, "girls", places_left.female),
+        ]
+
+        if places_available:
+            for sex_const, sex_label, places_left_for_sex in SEXES:
+                if booking.sex == sex_const and places_left_for_sex <= 0:
+                    errors.append(
+                        no_places_available_message(f"There are no places left for {sex_label} on this camp.")
+                    )
+                    places_available = False
+                    break
+
+        if places_available:
+            same_camp_bookings = [b for b in self.account_bookings if b.camp_id == camp.id and _is_in_basket(b)]
+            places_to_be_booked = len(same_camp_bookings)
+
+            if places_left.total < places_to_be_booked:
+                errors.append(
+                    no_places_available_message(
+                        "There are not enough places left on this camp " "for the campers in this set of bookings."
+                    )
+                )
+                places_available = False
+
+            if places_available:
+                for sex_const, sex_label, places_left_for_sex in SEXES:
+                    if booking.sex == sex_const:
+                        places_to_be_booked_for_sex = len([b for b in same_camp_bookings if b.sex == sex_const])
+                        if places_left_for_sex < places_to_be_booked_for_sex:
+                            errors.append(
+                                no_places_available_message(
+                                    f"There are not enough places for {sex_label} left on this camp "
+                                    "for the campers in this set of bookings."
+                                )
+                            )
+                            places_available = False
+                            break
+
+        if booking.south_wales_transport and not camp.south_wales_transport_available:
+            errors.append(
+                "Transport from South Wales is not available for this camp, or all places have been taken already."
+            )
+
+        if booking_sec and booking.price_type != PriceType.CUSTOM:
+            expected_amount = booking.expected_amount_due()
+            if booking.amount_due != expected_amount:
+                errors.append(f"The 'amount due' is not the expected value of £{expected_amount}.")
+
+        if booking_sec and not booking.created_online:
+            if booking.early_bird_discount:
+                errors.append("The early bird discount is only allowed for bookings created online.")
+
+        on_date = booking.booked_at if booking.is_booked and booking.booked_at is not None else date.today()
+
+        if not camp.open_for_bookings(on_date):
+            errors.append(camp_closed_message(camp, on_date))
+
+        missing_agreements = booking.get_missing_agreements(agreement_fetcher=self.agreement_fetcher)
+        for agreement in missing_agreements:
+            errors.append(f'You need to confirm your agreement in section "{agreement.name}"')
+
+        return errors
+
+    def get_booking_warnings(self, booking: Booking, booking_sec=False) -> list[str]:
+        # See also Booking.get_booking_warnings()
+        if not self._can_handle(booking):
+            return booking.get_booking_warnings(booking_sec=booking_sec)
+
+        camp: Camp = booking.camp
+        warnings = []
+
+        if any(
+            b.first_name == booking.first_name
+            and b.last_name == booking.last_name
+            and b.camp_id == camp.id
+            and b.id != booking.id
+            for b in self.account_bookings
+        ):
+            warnings.append(duplicate_camper_warning(booking))
+
+        relevant_bookings = self._relevant_bookings()
+
+        if booking.price_type == PriceType.FULL:
+            names = sorted({b.name for b in relevant_bookings if b.price_type == PriceType.FULL})
+            if len(names) > 1:
+                warnings.append(multiple_full_price_warning(names))
+
+        if booking.price_type == PriceType.SECOND_CHILD:
+            names = sorted({b.name for b in relevant_bookings if b.price_type == PriceType.SECOND_CHILD})
+            if len(names) > 1:
+                warnings.append(multiple_second_child_warning(names))
+
+        return warnings
+
+
+def _is_in_basket(booking: Booking) -> bool:
+    # See BookingQuerySet.in_basket()
+    return not booking.shelved and booking.state in [BookingState.INFO_COMPLETE, BookingState.APPROVED]
+
+
+def _get_counted_place(*, camp_id, sex, state):
+    """
+    Returns (camp_id, sex) for a booking that takes a place on a camp, or None
+    """
+    # See also BookingQuerySet.booked()
+    if state == BookingState.BOOKED and camp_id is not None:
+        return (camp_id, sex)
+    return None
+
+
+STATS_KEY_FIELDS = ["camp_id", "state", "booking_expires", "booked_at", "created_at", "sex", "date_of_birth"]
+
+
+def _get_stats_key(*, camp_id, state, booking_expires, booked_at, created_at, sex, date_of_birth):
+    """
+    Returns a tuple of the details used by booking statistics, starting with
+    camp_id, for a booking that is counted, or None
+    """
+    # See BookingQuerySet.confirmed()
+    if state == BookingState.BOOKED and booking_expires is None and camp_id is not None:
+        return (camp_id, booked_at or created_at, sex, date_of_birth)
+    return None
+
+
+class CampPlacesBookedQuerySet(models.QuerySet):
+    def record_change(self, *, old_place, new_place):
+        """
+        Update counts for a booking that has changed from `old_place` to
+        `new_place`, where each is a (camp_id, sex) tuple or None
+        """
+        if old_place == new_place:
+            return
+        if old_place is not None:
+            self._adjust(*old_place, -1)
+        if new_place is not None:
+            self._adjust(*new_place, 1)
+
+    def record_removals(self, old_places):
+        """
+        Update counts for bookings that are no longer counted, where
+        `old_places` contains a (camp_id, sex) tuple for each booking
+        """
+        # Sorted, to lock rows in a consistent order
+        for (camp_id, sex), count in sorted(Counter(old_places).items()):
+            self._adjust(camp_id, sex, -count)
+
+    def _adjust(self, camp_id, sex, delta):
+        field = CampPlacesBooked.SEX_FIELDS[sex]
+        update = {field: models.F(field) + delta}
+        if not self.filter(camp_id=camp_id).update(**update):
+            # Missing row, possibly being created concurrently, so we use
+            # `ignore_conflicts` (INSERT ... ON CONFLICT DO NOTHING):
+            self.bulk_create([CampPlacesBooked(camp_id=camp_id)], ignore_conflicts=True)
+            self.filter(camp_id=camp_id).update(**update)
+
+
+CampPlacesBookedManager = models.Manager.from_queryset(CampPlacesBookedQuerySet)
+
+
+class CampPlacesBooked(models.Model):
+    """
+    Denormalised counts of booked places for a camp, kept up to date
+    by `Booking.save()` and a pre_delete hook, for `Camp.get_places_left()`.
+    """
+
+    # The `camp` primary key means a lookup is a single indexed read. Updates
+    # lock the row until the end of the transaction, which also serialises
+    # concurrent bookings on the same camp.
+    camp = models.OneToOneField(Camp, on_delete=models.CASCADE, primary_key=True, related_name="places_booked")
+    male = models.IntegerField(default=0)
+    female = models.IntegerField(default=0)
+
+    SEX_FIELDS = {
+        Sex.MALE: "male",
+        Sex.FEMALE: "female",
+    }
+
+    objects = CampPlacesBookedManager()
+
+    class Meta:
+        verbose_name_plural = "camp places booked"
+
+    def __str__(self):
+        return f"{self.camp_id}: {self.male} male, {self.female} female"
+
+    @property
+    def total(self):
+        return self.male + self.female
+
+
+# Class id for the advisory lock taken by lock_booking_stats_years(), with the
+# year as object id.
+BOOKING_STATS_LOCK_ID = 1
+
+
+def lock_booking_stats_years(years, *, shared: bool):
+    """
+    Lock the booking statistics for the given years until the end of the
+    transaction.
+
+    Changes to bookings take a shared lock, which doesn't block other changes,
+    and refreshing the statistics takes an exclusive lock. So a refresh waits
+    for changes that are in progress to be committed, and changes wait for a
+    refresh to finish, meaning every change is either included in the refresh,
+    or marks the year stale after it.
+    """
+    function = "pg_advisory_xact_lock_shared" if shared else "pg_advisory_xact_lock"
+    with connection.cursor() as cursor:
+        for year in sorted(set(years)):
+            cursor.execute(f"SELECT {function}(%s, %s)", [BOOKING_STATS_LOCK_ID, year])
+
+
+class BookingStatsYearQuerySet(models.QuerySet):
+    def mark_stale_for_camps(self, camp_ids):
+        """
+        Mark the statistics for the years of the given camps as needing refreshing.
+        Must be called within the transaction that changes the bookings.
+        """
+        years = set(
+            Camp.objects.select_related(None)
+            .prefetch_related(None)
+            .filter(id__in=camp_ids)
+            .values_list("year", flat=True)
+        )
+        lock_booking_stats_years(years, shared=True)
+        # Usually the year is already stale, and this doesn't touch the row.
+        self.filter(year__in=years, stale=False).update(stale=True)
+
+
+BookingStatsYearManager = models.Manager.from_queryset(BookingStatsYearQuerySet)
+
+
+class BookingStatsYear(models.Model):
+    """
+    Records when the BookingStatsCount rows for a year were built, and
+    whether bookings have changed since then. See cciw.bookings.stats
+    """
+
+    year = models.PositiveSmallIntegerField(primary_key=True)
+    built_at = models.DateTimeField(null=True, blank=True)
+    stale = models.BooleanField(default=True)
+
+    objects = BookingStatsYearManager()
+
+    class Meta:
+        verbose_name_plural = "booking stats years"
+
+    def __str__(self):
+        return f"Booking stats {self.year}"
+
+    def needs_refresh(self, now: datetime) -> bool:
+        if self.built_at is None:
+            return True
+        # For the current year, bookings change frequently, so we limit how
+        # often we rebuild.
+        return self.stale and self.built_at <= now - settings.BOOKING_STATS_REFRESH_INTERVAL
+
+
+class BookingStatsCount(models.Model):
+    """
+    Materialised counts of confirmed bookings, used for booking statistics
+    charts instead of the Booking table. See cciw.bookings.stats
+    """
+
+    camp = models.ForeignKey(Camp, on_delete=models.CASCADE, related_name="+")
+    booked_on = models.DateField()
+    sex = models.CharField(max_length=1, choices=Sex.choices)
+    age = models.SmallIntegerField(help_text="Age on camp")
+    count = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.camp_id}: {self.count} booked on {self.booked_on}"
+
+
+@transaction.atomic
+def rebuild_camp_places_booked():
+    """
+    Rebuilds all CampPlacesBooked records from the Booking table.
+    """
+    counts = {
+        row["camp_id"]: row
+        for row in Booking.objects.booked()
+        .order_by()
+        .values("camp_id")
+        .annotate(
+            male=models.Count("id", filter=Q(sex=Sex.MALE)),
+            female=models.Count("id", filter=Q(sex=Sex.FEMALE)),
+        )
+    }
+    CampPlacesBooked.objects.all().delete()
+    CampPlacesBooked.objects.bulk_create(
+        [
+            CampPlacesBooked(
+                camp_id=camp_id,
+                male=counts.get(camp_id, {}).get("male", 0),
+                female=counts.get(camp_id, {}).get("female", 0),
+            )
+            for camp_id in Camp.objects.values_list("id", flat=True)
+        ]
+    )
+
+
 # Attributes that the account holder is allowed to see
 BOOKING_PLACE_USER_VISIBLE_ATTRS = [
     "id",
@@ -1638,6 +2192,24 @@ class SupportingInformation(models.Model):
         verbose_name_plural = "supporting information records"
 
 
+def lock_camps_for_booking(camp_ids):
+    """
+    Lock the given camps for the rest of the transaction, so that only one
+    basket containing any of them can be booked at a time.
+    """
+    # Only the camps in the basket are locked, so baskets for different camps
+    # don't block each other. Locks are always taken in order of id so that
+    # two baskets with overlapping camps can't deadlock.
+    list(
+        Camp.objects.select_related(None)
+        .prefetch_related(None)
+        .filter(id__in=camp_ids)
+        .order_by("id")
+        .select_for_update()
+        .values_list("id", flat=True)
+    )
+
+
 @transaction.atomic
 def book_basket_now(bookings):
     """
@@ -1646,20 +2218,24 @@ def book_basket_now(bookings):
     """
     bookings = list(bookings)
 
-    now = timezone.now()
-    fetcher = AgreementFetcher()
-    for b in bookings:
-        if len(b.get_booking_problems(agreement_fetcher=fetcher)[0]) > 0:
-            return False
-
     years = {b.camp.year for b in bookings}
     if len(years) != 1:
         raise AssertionError(f"Expected 1 year in basket, found {years}")
 
-    # Serialize access to this function, to stop more places than available
-    # being booked:
-    year_bookings = Booking.objects.for_year(list(years)[0]).select_for_update()
-    list(year_bookings)  # evaluate query to apply lock, don't need the result
+    # Serialize access to this function for the camps involved, to stop more
+    # places than available being booked. This must happen before checking
+    # for problems, so that place availability is checked with the lock held.
+    lock_camps_for_booking({b.camp_id for b in bookings})
+
+    now = timezone.now()
+    year = list(years)[0]
+    fetcher = AgreementFetcher()
+    validators = {}
+    for b in bookings:
+        if b.account_id not in validators:
+            validators[b.account_id] = BasketValidator(account=b.account, year=year, agreement_fetcher=fetcher)
+        if len(validators[b.account_id].get_booking_problems(b)[0]) > 0:
+            return False
 
     for b in bookings:
         b.booked_at = now
@@ -1716,19 +2292,19 @@ def is_booking_open_thisyear():
 def booking_report_by_camp(year):
     """
     Returns list of camps with annotations:
-      confirmed_bookings
-      confirmed_bookings_boys
-      confirmed_bookings_girls
+      booked_places_count
+      confirmed_bookings_count
+      confirmed_bookings_boys_count
+      confirmed_bookings_girls_count
     """
-    camps = Camp.objects.filter(year=year).prefetch_related(
-        Prefetch("bookings", queryset=Booking.objects.booked(), to_attr="booked_places")
+    booked = Q(bookings__state=BookingState.BOOKED)
+    confirmed = booked & Q(bookings__booking_expires__isnull=True)
+    return Camp.objects.filter(year=year).annotate(
+        booked_places_count=models.Count("bookings", filter=booked),
+        confirmed_bookings_count=models.Count("bookings", filter=confirmed),
+        confirmed_bookings_boys_count=models.Count("bookings", filter=confirmed & Q(bookings__sex=Sex.MALE)),
+        confirmed_bookings_girls_count=models.Count("bookings", filter=confirmed & Q(bookings__sex=Sex.FEMALE)),
     )
-    # Do some filtering in Python to avoid multiple db hits
-    for c in camps:
-        c.confirmed_bookings = [b for b in c.booked_places if b.is_confirmed]
-        c.confirmed_bookings_boys = [b for b in c.confirmed_bookings if b.sex == Sex.MALE]
-        c.confirmed_bookings_girls = [b for b in c.confirmed_bookings if b.sex == Sex.FEMALE]
-    return camps
 
 
 def outstanding_bookings_with_fees(year):
@@ -1752,29 +2328,31 @@ def outstanding_bookings_with_fees(year):
     #
     # People in group 2b) possibly need to be chased. They are not highlighted here - TODO
 
+    # Balances are found first, so that we only load bookings for accounts
+    # that need attention, which is usually a small fraction.
+    balances = {
+        account.id: account
+        for account in BookingAccount.objects.filter(id__in=bookings.values("account_id")).with_balances().only("id")
+    }
+    outstanding_account_ids = [
+        account.id
+        for account in balances.values()
+        if account.confirmed_balance_due > 0 or account.confirmed_balance < 0
+    ]
+    bookings = bookings.filter(account_id__in=outstanding_account_ids)
     bookings = bookings.order_by("account__name", "account__id", "first_name", "last_name")
-    bookings = list(bookings.select_related("camp__camp_name", "account").prefetch_related("account__bookings__camp"))
+    bookings = list(bookings.select_related("camp__camp_name", "account"))
 
     counts = defaultdict(int)
     for b in bookings:
         counts[b.account_id] += 1
 
-    price_checker = PriceChecker(expected_years=[b.camp.year for b in bookings])
-    outstanding = []
     for b in bookings:
         b.count_for_account = counts[b.account_id]
-        if not hasattr(b.account, "calculated_balance"):
-            b.account.calculated_balance = b.account.get_balance(
-                confirmed_only=True, allow_deposits=False, price_checker=price_checker
-            )
-            b.account.calculated_balance_due = b.account.get_balance(
-                confirmed_only=True, allow_deposits=True, price_checker=price_checker
-            )
+        b.account.calculated_balance = balances[b.account_id].confirmed_balance
+        b.account.calculated_balance_due = balances[b.account_id].confirmed_balance_due
 
-            if b.account.calculated_balance_due > 0 or b.account.calculated_balance < 0:
-                outstanding.append(b)
-
-    return outstanding
+    return bookings
 
 
 # --- Payments ---
@@ -2003,7 +2581,7 @@ def credit_account(amount: Decimal, to_account: BookingAccount, from_obj: Paymen
     Payment.objects.create(
         amount=amount, account=to_account, source_instance=from_obj, processed=None, created_at=timezone.now()
     )
-    process_all_payments()
+    process_all_payments(batch_size=settings.PAYMENT_PROCESSING_BATCH_SIZE)
 
 
 def build_paypal_custom_field(account):
@@ -2021,6 +2599,35 @@ def parse_paypal_custom_field(custom: str) -> BookingAccount | None:
         return None
 
 
+def get_pending_payment_totals(accounts: list[BookingAccount], now=None) -> dict[int, Decimal]:
+    """
+    Returns a dictionary of account ID to pending payment total, for the
+    accounts that have pending payments, using a single query.
+    """
+    # See also BookingAccount.get_pending_payment_total()
+    if now is None:
+        now = timezone.now()
+
+    account_ids_by_custom = {build_paypal_custom_field(account): account.id for account in accounts}
+    completed_payments = PayPalIPN.objects.filter(
+        custom=models.OuterRef("custom"),
+        txn_id=models.OuterRef("txn_id"),
+        payment_status="Completed",
+    )
+    uncompleted_pending_payments = (
+        PayPalIPN.objects.filter(
+            custom__in=account_ids_by_custom.keys(),
+            payment_status="Pending",
+            payment_date__gt=now - timedelta(days=3 * 30),  # old ones don't count
+        )
+        .exclude(models.Exists(completed_payments))
+        .order_by()
+        .values("custom")
+        .annotate(total=models.Sum("mc_gross"))
+    )
+    return {account_ids_by_custom[row["custom"]]: row["total"] for row in uncompleted_pending_payments}
+
+
 def expire_bookings(now=None):
     if now is None:
         now = timezone.now()
@@ -2031,37 +2638,81 @@ def expire_bookings(now=None):
     nowplus12h = now + timedelta(0, 3600 * 12)
     nowplus13h = now + timedelta(0, 3600 * 13)
 
-    unconfirmed = Booking.objects.unconfirmed().order_by("account")
-    to_warn = unconfirmed.filter(booking_expires__lte=nowplus13h, booking_expires__gte=nowplus12h)
-    to_expire = unconfirmed.filter(booking_expires__lte=now)
+    # Everything needed for the emails is fetched up front.
+    unconfirmed = (
+        Booking.objects.unconfirmed()
+        .order_by("account")
+        .select_related("camp__camp_name", "camp__chaplain")
+        .prefetch_related("camp__leaders")
+    )
+    to_warn = list(unconfirmed.filter(booking_expires__lte=nowplus13h, booking_expires__gte=nowplus12h))
+    to_expire = list(unconfirmed.filter(booking_expires__lte=now))
 
+    pending_payment_totals = get_pending_payment_totals(
+        list({b.account_id: b.account for b in to_expire + to_warn}.values()), now=now
+    )
+
+    expiry_mails = []
     for booking_set, expired in [(to_expire, True), (to_warn, False)]:
-        groups = []
-        last_account_id = None
-        for b in booking_set:
-            if last_account_id is None or b.account_id != last_account_id:
-                group = []
-                groups.append(group)
-            group.append(b)
-            last_account_id = b.account_id
-
-        for group in groups:
-            account = group[0].account
-            if account.get_pending_payment_total(now=now) > Decimal("0.00"):
+        for account_id, group in itertools.groupby(booking_set, key=lambda b: b.account_id):
+            if pending_payment_totals.get(account_id, Decimal("0.00")) > Decimal("0.00"):
                 continue
+            group = list(group)
+            expiry_mails.append((group[0].account, group, expired))
 
-            if expired:
-                for b in group:
-                    b.expire()
-            send_booking_expiry_mail(account, group, expired)
+    expired_ids = _expire_bookings_now(
+        [b for account, group, expired in expiry_mails if expired for b in group], now=now
+    )
+    # Bookings that were confirmed, or expired by another run, since we
+    # fetched them are left alone, and don't get an expiry mail.
+    expiry_mails = [
+        (account, [b for b in group if b.id in expired_ids] if expired else group, expired)
+        for account, group, expired in expiry_mails
+    ]
+    send_booking_expiry_mails([(account, group, expired) for account, group, expired in expiry_mails if group])
 
 
 @transaction.atomic
-def process_one_payment(payment: Payment):
-    payment.account.receive_payment(payment.amount)
-    payment.processed = timezone.now()
-    # Payment.processed is ignored in Payment.save, so do update
-    Payment.objects.filter(id=payment.id).update(processed=payment.processed)
+def _expire_bookings_now(bookings: list[Booking], *, now: datetime) -> set[int]:
+    """
+    Equivalent to calling Booking.expire() on each booking that is still due to
+    expire, but with a single UPDATE query. Returns the ids of the bookings that
+    were expired.
+    """
+    if not bookings:
+        return set()
+    # The rows are locked and re-read, so that we use their current values,
+    # and skip bookings that have changed since they were fetched.
+    bookings = list(
+        Booking.objects.unconfirmed()
+        .filter(id__in=[b.id for b in bookings], booking_expires__lte=now)
+        .select_related(None)
+        .select_related("camp")
+        .select_for_update(of=("self",))
+    )
+    if not bookings:
+        return set()
+    price_checker = PriceChecker(expected_years=[b.camp.year for b in bookings])
+    old_places = [_get_counted_place(camp_id=b.camp_id, sex=b.sex, state=b.state) for b in bookings]
+    ids_by_amount_due = defaultdict(list)
+    for booking in bookings:
+        booking._unbook(price_checker=price_checker)
+        ids_by_amount_due[booking.amount_due].append(booking.id)
+
+    Booking.objects.filter(id__in=[b.id for b in bookings]).update(
+        booking_expires=None,
+        state=BookingState.INFO_COMPLETE,
+        early_bird_discount=False,
+        booked_at=None,
+        amount_due=models.Case(
+            *[models.When(id__in=ids, then=models.Value(amount_due)) for amount_due, ids in ids_by_amount_due.items()],
+            output_field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+    )
+    # QuerySet.update() bypasses Booking.save(), so we have to update the
+    # place counts ourselves.
+    CampPlacesBooked.objects.record_removals([place for place in old_places if place is not None])
+    return {b.id for b in bookings}
 
 
 # When processing payments, we need to alter the BookingAccount.total_received
@@ -2077,13 +2728,56 @@ def process_one_payment(payment: Payment):
 # later processing, rather than calling BookingAccount.receive_payment directly.
 
 
+def process_all_payments(*, batch_size: int | None = None):
+    """
+    Processes all unprocessed Payment objects, crediting the amounts to the
+    accounts.
+
+    If batch_size is None, everything is done in a single transaction
+    (or the caller's transaction). Otherwise payments are processed in
+    batches of at most batch_size, each in its own transaction.
+    """
+    while True:
+        processed_count = _process_payments_batch(batch_size=batch_size)
+        if batch_size is None or processed_count < batch_size:
+            return
+
+
 @transaction.atomic
-def process_all_payments():
-    # Use select_for_update to serialize usages of this function.
-    for payment in (
-        Payment.objects.select_related(None).select_for_update().filter(processed__isnull=True).order_by("created_at")
-    ):
-        process_one_payment(payment)
+def _process_payments_batch(*, batch_size: int | None) -> int:
+    # Payment rows are locked with SKIP LOCKED, so concurrent callers can share
+    # the queue, instead of serialising behind a single lock. Payments that
+    # another caller has locked will be processed by that caller.
+    #
+    # Ordering by account means that a batch covers as few accounts as
+    # possible, so that we get the most out of grouping by account below.
+    payments = (
+        Payment.objects.select_related(None)
+        .select_for_update(skip_locked=True)
+        .filter(processed__isnull=True)
+        .order_by("account_id", "created_at")
+        .values_list("id", "account_id", "amount")
+    )
+    if batch_size is not None:
+        payments = payments[:batch_size]
+    payments = list(payments)
+    if not payments:
+        return 0
+
+    amounts = defaultdict(Decimal)
+    for payment_id, account_id, amount in payments:
+        amounts[account_id] += amount
+
+    # Only the affected accounts are locked, always in the same order to avoid
+    # deadlocks. This serialises updates to BookingAccount.total_received for
+    # each account.
+    accounts = BookingAccount.objects.select_for_update().filter(id__in=amounts.keys()).order_by("id")
+    for account in accounts:
+        account.receive_payment(amounts[account.id])
+
+    # Payment.processed is ignored in Payment.save, so do update
+    Payment.objects.filter(id__in=[payment_id for payment_id, _, _ in payments]).update(processed=timezone.now())
+    return len(payments)
 
 
 def most_recent_booking_year():
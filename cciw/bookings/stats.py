@@ -1,81 +1,202 @@
-from datetime import timedelta
-
-import datedelta
+"""
+Booking statistics.
+
+Statistics are calculated from BookingStatsCount, which stores counts of
+confirmed bookings by camp, booking date, sex and age. These rows are built for
+a year the first time they are needed.
+
+Changes to bookings are not applied to the counts. Instead they mark the
+BookingStatsYear as stale, and the whole year is rebuilt (deleted and counted
+again) the next time the statistics are viewed, at most every
+settings.BOOKING_STATS_REFRESH_INTERVAL. This happens synchronously, within
+the request for the statistics page. For past years nothing changes, so they
+are only built once.
+"""
+from datetime import datetime, timezone
+
+import attr
 import pandas as pd
-from django.db import models
-
-from cciw.utils.stats import accumulate, accumulate_dates, counts
-
-from .models import Booking
+from django.db import models, transaction
+from django.db.models import functions
+from django.utils import timezone as django_timezone
+
+from cciw.cciwmain.models import Camp
+from cciw.utils.stats import counts
+
+from .models import Booking, BookingStatsCount, BookingStatsYear, lock_booking_stats_years
+
+
+@attr.s(auto_attribs=True)
+class BookingStatsFreshness:
+    built_at: datetime | None
+    pending_changes: bool
+
+
+def refresh_booking_stats(year: int, *, now: datetime = None) -> None:
+    """
+    Rebuild all the BookingStatsCount rows for a year.
+    """
+    if now is None:
+        now = django_timezone.now()
+    with transaction.atomic():
+        # This serialises refreshes of the same year, and means that every
+        # change to bookings is either counted, or marks the year stale again
+        # after we finish. See lock_booking_stats_years
+        lock_booking_stats_years([year], shared=False)
+        BookingStatsYear.objects.bulk_create([BookingStatsYear(year=year)], ignore_conflicts=True)
+        stats_year = BookingStatsYear.objects.get(year=year)
+        BookingStatsCount.objects.filter(camp__year=year).delete()
+        BookingStatsCount.objects.bulk_create(
+            [
+                BookingStatsCount(**row)
+                for row in Booking.objects.confirmed()
+                .filter(camp__year=year)
+                .order_by()
+                .values(
+                    "camp_id",
+                    "sex",
+                    # prefer 'booked_at' to 'created_at'
+                    booked_on=functions.TruncDate(functions.Coalesce("booked_at", "created_at"), tzinfo=timezone.utc),
+                    # See Booking.age_on_camp() and Booking.age_base_date()
+                    age=models.ExpressionWrapper(
+                        models.F("camp__year")
+                        - functions.ExtractYear("date_of_birth")
+                        - models.Case(
+                            models.When(date_of_birth__month__gt=8, then=models.Value(1)), default=models.Value(0)
+                        ),
+                        output_field=models.SmallIntegerField(),
+                    ),
+                )
+                .annotate(count=models.Count("id"))
+            ]
+        )
+        stats_year.built_at = now
+        stats_year.stale = False
+        stats_year.save()
+
+
+def rebuild_booking_stats() -> None:
+    """
+    Rebuild the booking statistics for all years.
+    """
+    BookingStatsYear.objects.all().delete()
+    for year in Camp.objects.order_by("year").values_list("year", flat=True).distinct():
+        refresh_booking_stats(year)
+
+
+def ensure_booking_stats(years, *, now: datetime = None) -> None:
+    """
+    Ensure that booking statistics are built, and fresh enough, for the given years.
+
+    Years that have never been built, or are stale and were built more than
+    BOOKING_STATS_REFRESH_INTERVAL ago, are fully rebuilt, within the caller's
+    request.
+    """
+    if now is None:
+        now = django_timezone.now()
+    stats_years = {stats_year.year: stats_year for stats_year in BookingStatsYear.objects.filter(year__in=years)}
+    for year in sorted(set(years)):
+        stats_year = stats_years.get(year)
+        if stats_year is None or stats_year.needs_refresh(now):
+            refresh_booking_stats(year, now=now)
+
+
+def get_booking_stats_freshness(years) -> BookingStatsFreshness:
+    """
+    Returns information about when the statistics for the given years were calculated.
+    """
+    stats_years = list(BookingStatsYear.objects.filter(year__in=years))
+    return BookingStatsFreshness(
+        built_at=min((y.built_at for y in stats_years if y.built_at is not None), default=None),
+        pending_changes=any(y.stale for y in stats_years),
+    )
 
 
 def get_booking_progress_stats(start_year=None, end_year=None, camps=None, overlay_years=False):
+    qs, group_field, labels = _get_stats_counts_and_labels(start_year=start_year, end_year=end_year, camps=camps)
+    last_year = max(c.year for c in camps) if camps else end_year
+    df = _to_frame(
+        qs.values_list(group_field, "booked_on", "camp__start_date", "count"),
+        ["group", "booked_on", "start_date", "count"],
+    )
+    df["label"] = df["group"].map(labels)
+    booked_on = pd.to_datetime(df["booked_on"])
+    start_date = pd.to_datetime(df["start_date"])
+    if overlay_years:
+        df["date"] = _add_years(booked_on, last_year - start_date.dt.year)
+    else:
+        df["date"] = booked_on
+    df["rel_days"] = (booked_on - start_date).dt.days
+
     data_dates = {}
     data_rel_days = {}
-    if camps:
-        items = camps
-        query_filter = lambda qs, camp: qs.filter(camp=camp)
-        labeller = lambda camp: str(camp.url_id)
-        last_year = max(c.year for c in camps)
-    else:
-        items = range(start_year, end_year + 1)
-        query_filter = lambda qs, year: qs.filter(camp__year=year)
-        labeller = str
-        last_year = end_year
-
-    for item in items:
-        qs = Booking.objects.confirmed()
-        rows = query_filter(qs, item).select_related("camp").values_list("booked_at", "created_at", "camp__start_date")
-        rows2 = [[r[0] if r[0] else r[1], r[2]] for r in rows]  # prefer 'booked_at' to 'created_at'
-        if rows2:
-            if overlay_years:
-                dates = [d1.date() + datedelta.datedelta(years=last_year - d2.year) for d1, d2 in rows2]
-            else:
-                dates = [d1.date() for d1, d2 in rows2]
-            label = labeller(item)
-            data_dates[label] = _fill_gaps(accumulate_dates(dates))
-            data_rel_days[label] = _fill_gaps(accumulate([(r[0].date() - r[1]).days for r in rows2]))
+    rows_by_label = dict(list(df.groupby("label")))
+    for label in labels.values():
+        if label not in rows_by_label:
+            continue
+        rows = rows_by_label[label]
+        data_dates[label] = _accumulate_filled(
+            rows, "date", lambda s: pd.date_range(s.index.min(), s.index.max(), name=s.index.name)
+        )
+        data_rel_days[label] = _accumulate_filled(
+            rows, "rel_days", lambda s: pd.RangeIndex(s.index.min(), s.index.max() + 1, name=s.index.name)
+        )
 
     df1 = pd.DataFrame(data=data_dates)
     df2 = pd.DataFrame(data=data_rel_days)
     return df1, df2
 
 
-def _fill_gaps(series):
-    # pandas 'fillna' method not good enough for us - we want the current year
-    # not to be filled until the end of the chart, just missing in-between values
-    # to be filled.
-    last_idx = None
-    last_val = None
-    extra = []
-    for idx in series.index:
-        if last_idx is not None:
-            if isinstance(idx, pd.Timestamp):
-                current_dt = idx.date()
-                last_dt = last_idx.date()
-                missing_dates = [last_dt + timedelta(days=days) for days in range(1, (current_dt - last_dt).days)]
-                extra.extend((pd.Timestamp(dt), last_val) for dt in missing_dates)
-            else:
-                missing_days = [last_idx + days for days in range(1, idx - last_idx)]
-                extra.extend((day, last_val) for day in missing_days)
-
-        last_idx = idx
-        last_val = series[idx]
-
-    for idx, val in extra:
-        series[idx] = val
-    series = series.sort_index()
-    return series
+def _get_stats_counts_and_labels(*, start_year, end_year, camps) -> tuple[models.QuerySet, str, dict]:
+    """
+    Returns a QuerySet for the BookingStatsCount rows for all the years/camps,
+    the field to group rows by, and an (ordered) dictionary mapping values of
+    that field to labels.
+    """
+    if camps:
+        ensure_booking_stats({camp.year for camp in camps})
+        qs = BookingStatsCount.objects.filter(camp__in=camps)
+        return qs, "camp_id", {camp.id: str(camp.url_id) for camp in camps}
+    years = range(start_year, end_year + 1)
+    ensure_booking_stats(years)
+    qs = BookingStatsCount.objects.filter(camp__year__gte=start_year, camp__year__lte=end_year)
+    return qs, "camp__year", {year: str(year) for year in years}
+
+
+def _to_frame(rows, columns: list[str]) -> pd.DataFrame:
+    return pd.DataFrame.from_records(list(rows), columns=columns)
+
+
+def _accumulate_filled(rows: pd.DataFrame, column: str, make_full_index) -> pd.Series:
+    # Cumulative counts against the values in `column`, with any gaps between
+    # the first and last values filled with the previous value. We don't fill
+    # beyond the last value, so that for the current year the data doesn't
+    # extend to the end of the chart.
+    accumulated = rows.groupby(column)["count"].sum().sort_index().cumsum()
+    accumulated = accumulated.reindex(make_full_index(accumulated)).ffill().astype(accumulated.dtype)
+    return accumulated.rename_axis(None).rename(None)
+
+
+def _add_years(dates: pd.Series, years: pd.Series) -> pd.Series:
+    """
+    Adds a (varying) number of years to a Series of dates. Like
+    datedelta, 29th February moves to 1st March in non-leap years.
+    """
+    year = dates.dt.year + years
+    month = dates.dt.month
+    day = dates.dt.day
+    leap_day_moved = (month == 2) & (day == 29) & ~((year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0)))
+    shifted = pd.to_datetime(pd.DataFrame({"year": year, "month": month, "day": day.mask(leap_day_moved, 28)}))
+    return shifted + pd.to_timedelta(leap_day_moved.astype(int), unit="D")
 
 
 def get_booking_summary_stats(start_year, end_year) -> pd.DataFrame:
+    ensure_booking_stats(range(start_year, end_year + 1))
     rows = (
-        Booking.objects.confirmed()
-        .select_related("camp")
-        .filter(camp__year__gte=start_year, camp__year__lte=end_year)
+        BookingStatsCount.objects.filter(camp__year__gte=start_year, camp__year__lte=end_year)
         .values_list("camp__year", "sex")
         .order_by("camp__year", "sex")
-        .annotate(count=models.Count("sex"))
+        .annotate(count=models.Sum("count"))
     )
     years = sorted(list({year for year, s, c in rows}))
     counts = {(year, sex): count for year, sex, count in rows}
@@ -93,21 +214,15 @@ def get_booking_summary_stats(start_year, end_year) -> pd.DataFrame:
 
 
 def get_booking_ages_stats(start_year=None, end_year=None, camps=None, include_total=True) -> pd.DataFrame:
-    if camps:
-        items = camps
-        query_filter = lambda qs, camp: qs.filter(camp=camp)
-        labeller = lambda camp: str(camp.url_id)
-    else:
-        items = range(start_year, end_year + 1)
-        query_filter = lambda qs, year: qs.filter(camp__year=year)
-        labeller = str
-
-    data = {}
-    for item in items:
-        qs = Booking.objects.confirmed().select_related(None).select_related("camp").only("date_of_birth", "camp")
-        objs = query_filter(qs, item)
-        vals = [b.age_on_camp() for b in objs]
-        data[labeller(item)] = counts(vals)
+    qs, group_field, labels = _get_stats_counts_and_labels(start_year=start_year, end_year=end_year, camps=camps)
+    df = _to_frame(qs.values_list(group_field, "age", "count"), ["group", "age", "count"])
+    df["label"] = df["group"].map(labels)
+
+    counts_by_label = {
+        label: rows.groupby("age")["count"].sum().sort_index().rename_axis(None).rename(None)
+        for label, rows in df.groupby("label")
+    }
+    data = {label: counts_by_label.get(label, counts([])) for label in labels.values()}
     df = pd.DataFrame(data=data).fillna(0)
     if include_total:
         df["Total"] = sum(df[col] for col in data)
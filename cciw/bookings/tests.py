@@ -1,33 +1,58 @@
+import copy
 import io
+import itertools
 import json
+import random
+import re
+import threading
 from datetime import date, datetime, timedelta
 from decimal import Decimal
+from smtplib import SMTPException
 from unittest import mock
 
+import hypothesis
 import openpyxl
+import pandas as pd
 import pytest
 import vcr
 from django.conf import settings
 from django.core import mail, signing
-from django.db import models
-from django.test.utils import override_settings
+from django.db import connection, models, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from django_functest import FuncBaseMixin, Upload
 from hypothesis import example, given
 from hypothesis import strategies as st
 
-from cciw.bookings.email import EmailVerifyTokenGenerator, VerifyExpired, VerifyFailed, send_payment_reminder_emails
+from cciw.bookings import models as bookings_models
+from cciw.bookings.email import (
+    EmailVerifyTokenGenerator,
+    VerifyExpired,
+    VerifyFailed,
+    send_booking_expiry_mails,
+    send_payment_reminder_emails,
+)
 from cciw.bookings.hooks import paypal_payment_received, unrecognised_payment
 from cciw.bookings.mailchimp import get_status
 from cciw.bookings.management.commands.expire_bookings import Command as ExpireBookingsCommand
+from cciw.bookings.management.commands.payment_reminder_emails import Command as PaymentReminderEmailsCommand
+from cciw.bookings.management.commands.rebuild_booking_stats import Command as RebuildBookingStatsCommand
+from cciw.bookings.management.commands.rebuild_camp_places_booked import Command as RebuildCampPlacesBookedCommand
 from cciw.bookings.middleware import BOOKING_COOKIE_SALT
 from cciw.bookings.models import (
+    BOOKING_PLACE_PRICE_TYPES,
     AccountTransferPayment,
     AgreementFetcher,
+    BasketValidator,
     Booking,
     BookingAccount,
     BookingState,
+    BookingStatsCount,
+    BookingStatsYear,
+    CampPlacesBooked,
+    CustomAgreement,
     ManualPayment,
     ManualPaymentType,
     Payment,
@@ -37,17 +62,34 @@ from cciw.bookings.models import (
     PriceType,
     RefundPayment,
     book_basket_now,
+    booking_report_by_camp,
     build_paypal_custom_field,
+    credit_account,
     expire_bookings,
+    outstanding_bookings_with_fees,
+    process_all_payments,
+)
+from cciw.bookings.stats import (
+    get_booking_ages_stats,
+    get_booking_progress_stats,
+    get_booking_stats_freshness,
+    get_booking_summary_stats,
+    refresh_booking_stats,
 )
-from cciw.bookings.utils import camp_bookings_to_spreadsheet, payments_to_spreadsheet
+from cciw.bookings.utils import (
+    _mailing_list_rows,
+    addresses_for_mailing_list,
+    camp_bookings_to_spreadsheet,
+    payments_to_spreadsheet,
+)
+from cciw.cciwmain import common
 from cciw.cciwmain.models import Camp
 from cciw.cciwmain.tests import factories as camps_factories
 from cciw.cciwmain.tests.mailhelpers import path_and_query_to_url, read_email_url
 from cciw.mail.tests import send_queued_mail
 from cciw.officers.tests import factories as officers_factories
 from cciw.sitecontent.models import HtmlChunk
-from cciw.utils.tests.base import AtomicChecksMixin, TestBase, disable_logging
+from cciw.utils.tests.base import AtomicChecksMixin, TestBase, TestBaseMixin, disable_logging
 from cciw.utils.tests.db import refresh
 from cciw.utils.tests.factories import Auto
 from cciw.utils.tests.webtest import SeleniumBase, WebTestBase
@@ -629,6 +671,65 @@ class TestPaymentReminderEmails(BookingBaseMixin, WebTestBase):
         self.get_literal_url(path_and_query_to_url(path2, querydata2))
         self.assertUrlsEqual(reverse("cciw-bookings-pay"))
 
+    def test_payment_reminder_email_not_repeated(self):
+        booking = self._create_booking()
+        mail.outbox = []
+        report = send_payment_reminder_emails()
+        assert report.accounts == [booking.account]
+        account = BookingAccount.objects.get(id=booking.account_id)
+        assert account.last_payment_reminder is not None
+
+        report = send_payment_reminder_emails()
+        assert len(mail.outbox) == 1
+        assert report.accounts == []
+        assert report.skipped_recently_reminded == 1
+
+        send_payment_reminder_emails(now=timezone.now() + settings.BOOKING_EMAIL_REMINDER_FREQUENCY)
+        assert len(mail.outbox) == 2
+
+    def test_payment_reminder_emails_batched(self):
+        bookings = [factories.create_booking() for i in range(3)]
+        book_basket_now(bookings)
+        for booking in Booking.objects.filter(id__in=[b.id for b in bookings]):
+            booking.confirm()
+        accounts = [booking.account for booking in bookings]
+        mail.outbox = []
+        with mock.patch("cciw.bookings.email.PAYMENT_REMINDER_BATCH_SIZE", 2), CaptureQueriesContext(
+            connection
+        ) as queries:
+            report = send_payment_reminder_emails()
+        assert len(mail.outbox) == 3
+        assert sorted(m.to[0] for m in mail.outbox) == sorted(account.email for account in accounts)
+        assert report.accounts_due == len(report.accounts) == 3
+        # Prices and balances for payments_due, the Site for the domain, and an UPDATE per batch:
+        assert len(queries) <= 5
+
+    def test_payment_reminder_emails_send_error(self):
+        bookings = [factories.create_booking() for i in range(3)]
+        book_basket_now(bookings)
+        for booking in Booking.objects.filter(id__in=[b.id for b in bookings]):
+            booking.confirm()
+        with mock.patch("cciw.bookings.email.PAYMENT_REMINDER_BATCH_SIZE", 1), mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=[1, SMTPException()]
+        ):
+            with pytest.raises(SMTPException):
+                send_payment_reminder_emails()
+        # The batch that failed is marked, but not the one that wasn't attempted:
+        reminded = BookingAccount.objects.filter(
+            id__in=[booking.account_id for booking in bookings], last_payment_reminder__isnull=False
+        )
+        assert reminded.count() == 2
+
+    def test_payment_reminder_dry_run(self):
+        booking = self._create_booking()
+        mail.outbox = []
+        stdout = io.StringIO()
+        PaymentReminderEmailsCommand(stdout=stdout).handle(dry_run=True)
+        assert len(mail.outbox) == 0
+        assert booking.account.email in stdout.getvalue()
+        assert "Would send:" in stdout.getvalue()
+        assert BookingAccount.objects.get(id=booking.account_id).last_payment_reminder is None
+
 
 class AccountDetailsBase(BookingBaseMixin, BookingLogInMixin, FuncBaseMixin):
     urlname = "cciw-bookings-account_details"
@@ -2442,6 +2543,133 @@ class TestExpireBookingsCommand(TestBase):
             assert b.booking_expires is None
             assert b.state == BookingState.INFO_COMPLETE
 
+    def test_confirmed_during_run(self):
+        booking = factories.create_booking()
+        book_basket_now([booking])
+        Booking.objects.filter(id=booking.id).update(booking_expires=timezone.now() - timedelta(1))
+        expire_bookings_now = bookings_models._expire_bookings_now
+
+        def confirm_then_expire(bookings, **kwargs):
+            # e.g. payment arrived after the bookings to expire were fetched
+            Booking.objects.get(id=booking.id).confirm()
+            return expire_bookings_now(bookings, **kwargs)
+
+        mail.outbox = []
+        with mock.patch("cciw.bookings.models._expire_bookings_now", confirm_then_expire):
+            expire_bookings()
+        assert len(mail.outbox) == 0
+        booking.refresh_from_db()
+        assert booking.state == BookingState.BOOKED
+        assert booking.camp.get_places_left().total == booking.camp.max_campers - 1
+
+    def test_overlapping_runs(self):
+        booking = factories.create_booking()
+        book_basket_now([booking])
+        Booking.objects.filter(id=booking.id).update(booking_expires=timezone.now() - timedelta(1))
+        stale_bookings = list(Booking.objects.filter(id=booking.id))
+        now = timezone.now()
+        assert bookings_models._expire_bookings_now(stale_bookings, now=now) == {booking.id}
+        assert bookings_models._expire_bookings_now(stale_bookings, now=now) == set()
+        assert CampPlacesBooked.objects.get(camp_id=booking.camp_id).total == 0
+
+    def create_expiry_scenario(self, rng):
+        camps = [camps_factories.create_camp(future=True) for i in range(2)]
+        Price.objects.get_or_create(
+            year=camps[0].year, price_type=PriceType.SOUTH_WALES_TRANSPORT, defaults={"price": 10}
+        )
+        for i in range(10):
+            account = factories.create_booking_account()
+            for j in range(rng.randint(1, 3)):
+                booking = factories.create_booking(
+                    account=account,
+                    camp=rng.choice(camps),
+                    sex=rng.choice("mf"),
+                    first_name=f"Child{j}",
+                    price_type=rng.choice([PriceType.FULL, PriceType.SECOND_CHILD, PriceType.CUSTOM]),
+                    state=BookingState.BOOKED,
+                )
+                booking.booked_at = timezone.now() - timedelta(days=1)
+                booking.booking_expires = timezone.now() + rng.choice(
+                    [timedelta(days=-2), timedelta(hours=-1), timedelta(hours=12.5), timedelta(hours=20)]
+                )
+                booking.early_bird_discount = rng.random() < 0.3
+                booking.south_wales_transport = rng.random() < 0.2
+                booking.save()
+            if rng.random() < 0.4:
+                factories.create_ipn(
+                    account=account, txn_id=f"TXN{i}", mc_gross=Decimal("1.00"), payment_status="Pending"
+                )
+                if rng.random() < 0.5:
+                    # Pending payment that has since completed, so doesn't count
+                    factories.create_ipn(account=account, txn_id=f"TXN{i}", mc_gross=Decimal("1.00"))
+
+    def get_expiry_outputs(self):
+        return (
+            list(
+                Booking.objects.order_by("id").values_list(
+                    "id", "state", "booking_expires", "early_bird_discount", "booked_at", "amount_due"
+                )
+            ),
+            list(CampPlacesBooked.objects.order_by("camp_id").values_list("camp_id", "male", "female")),
+            # Tokens include a timestamp, so are excluded
+            [(m.subject, m.to, re.sub(r"bt=\S+", "", m.body)) for m in mail.outbox],
+        )
+
+    def test_bulk_expire_matches_one_at_a_time(self):
+        def expire_bookings_one_at_a_time(now):
+            # The original implementation, for comparison
+            unconfirmed = Booking.objects.unconfirmed().order_by("account")
+            to_warn = unconfirmed.filter(
+                booking_expires__lte=now + timedelta(hours=13), booking_expires__gte=now + timedelta(hours=12)
+            )
+            to_expire = unconfirmed.filter(booking_expires__lte=now)
+            for booking_set, expired in [(to_expire, True), (to_warn, False)]:
+                for account_id, group in itertools.groupby(booking_set, key=lambda b: b.account_id):
+                    group = list(group)
+                    account = group[0].account
+                    if account.get_pending_payment_total(now=now) > Decimal("0.00"):
+                        continue
+                    if expired:
+                        for b in group:
+                            b.expire()
+                    send_booking_expiry_mails([(account, group, expired)])
+
+        for seed in range(5):
+            with transaction.atomic():
+                self.create_expiry_scenario(random.Random(seed))
+                now = timezone.now()
+                outputs = []
+                for expire in [expire_bookings_one_at_a_time, expire_bookings]:
+                    with transaction.atomic():
+                        mail.outbox = []
+                        expire(now=now)
+                        outputs.append(self.get_expiry_outputs())
+                        transaction.set_rollback(True)
+                old_outputs, new_outputs = outputs
+                assert old_outputs[2], "Scenario should produce some emails"
+                assert new_outputs == old_outputs, f"Mismatch for seed {seed}"
+                transaction.set_rollback(True)
+
+    def test_query_count(self):
+        # The number of queries should not depend on the number of accounts
+        def create_expired_bookings(count):
+            for i in range(count):
+                booking = factories.create_booking()
+                book_basket_now([booking])
+                booking.refresh_from_db()
+                booking.booking_expires = timezone.now() - timedelta(hours=1)
+                booking.save()
+
+        common.get_current_domain()  # Cached, so shouldn't count
+        create_expired_bookings(2)
+        with CaptureQueriesContext(connection) as few_accounts:
+            expire_bookings()
+        create_expired_bookings(6)
+        with CaptureQueriesContext(connection) as many_accounts:
+            expire_bookings()
+        assert len(few_accounts) == len(many_accounts)
+        assert len(mail.outbox) == 8
+
 
 class TestManualPayment(TestBase):
     def test_create(self):
@@ -2675,6 +2903,142 @@ class TestExportPaymentData(TestBase):
         assert ["Joe Bloggs", "joe@foo.com", -1.23, "ManualPayment (deleted)"] not in data2
 
 
+class TestAddressesForMailingList(TestBase):
+    def create_data(self, rng: random.Random, *, accounts: int):
+        camps = [camps_factories.create_camp(year=2000) for i in range(3)]
+        template_booking = factories.create_booking(camp=camps[0])
+        addresses = [("", ""), ("1 The Street", "AB1 2CD"), ("1 The Street", "AB1 3CD"), ("2 The Road", "AB1 2CD")]
+        churches = ["", " ", "St Mary's", "  Grace Chapel ", "Bethel"]
+        now = timezone.now()
+        booking_accounts = BookingAccount.objects.bulk_create(
+            [
+                BookingAccount(
+                    name=rng.choice(["Joe Bloggs", "Mary Muddle", "Anne Other", ""]),
+                    email=f"account_{i}@example.com",
+                    address_line1=rng.choice(["", "", " ", "10 Account Street"]),
+                    address_city="Town",
+                    address_country=rng.choice(["GB", "FR", None]),
+                    address_post_code="XY1 2ZW",
+                    subscribe_to_mailings=rng.choice([None, True, False]),
+                    created_at=now,
+                )
+                for i in range(accounts)
+            ]
+        )
+        bookings = []
+        for account in booking_accounts:
+            shared_address = rng.choice(addresses)
+            for i in range(rng.randint(1, 4)):
+                booking = copy.copy(template_booking)
+                booking.id = None
+                booking.account = account
+                booking.camp = rng.choice(camps)
+                booking.first_name = rng.choice(["Peter", "Jane"])
+                booking.email = rng.choice(["", "camper@example.com"])
+                booking.church = rng.choice(churches)
+                booking.address_line1, booking.address_post_code = (
+                    shared_address if rng.random() < 0.7 else rng.choice(addresses)
+                )
+                booking.address_country = rng.choice(["GB", "IE"])
+                bookings.append(booking)
+        Booking.objects.bulk_create(bookings)
+
+    def test_matches_previous_implementation(self):
+        self.create_data(random.Random(1), accounts=2000)
+        rows = list(_mailing_list_rows(2001))
+        assert len(rows) > 1000
+        assert sorted(rows) == sorted(_legacy_mailing_list_rows(2001))
+
+    def test_spreadsheet(self):
+        account = factories.create_booking_account(name="Joe Bloggs", address_line1="1 The Street")
+        factories.create_booking(account=account, camp=camps_factories.create_camp(year=2000))
+        wkbk = openpyxl.load_workbook(io.BytesIO(addresses_for_mailing_list(2001).to_bytes()))
+        data = [[c.value for c in r] for r in wkbk["Addresses"].rows]
+        assert data[0][0:2] == ["Name", "Address line 1"]
+        assert data[1][0:2] == ["Joe Bloggs", "1 The Street"]
+        url = f"https://example.com/admin/bookings/bookingaccount/{account.id}/change/"
+        assert data[1][-2:] == [1, f'=HYPERLINK("{url}"; "{url}")']
+
+
+def _legacy_mailing_list_rows(year: int):
+    # Previous implementation of addresses_for_mailing_list, for comparison. This
+    # is unchanged except for defining the order of bookings within an account.
+    from itertools import groupby
+
+    from django.contrib.sites.shortcuts import get_current_site
+
+    bookings = Booking.objects.filter(camp__year=year - 1).order_by("account", "id").select_related("account")
+    rows = []
+    domain = get_current_site(None).domain
+    link_start = f"https://{domain}"
+
+    for account, acc_bookings in groupby(bookings, lambda b: b.account):
+        if not account.include_in_mailings:
+            continue
+
+        acc_bookings = list(acc_bookings)
+        if account.address_line1.strip() != "":
+            churches = [b.church.strip() for b in acc_bookings if b.church.strip()]
+            church = churches[0] if churches else ""
+            rows.append(
+                [
+                    account.name,
+                    account.address_line1,
+                    account.address_line2,
+                    account.address_city,
+                    account.address_county,
+                    str(account.address_country.name),
+                    account.address_post_code,
+                    account.email,
+                    church,
+                    len(acc_bookings),
+                    link_start + reverse("admin:bookings_bookingaccount_change", args=[account.id]),
+                ]
+            )
+        else:
+            first_booking = acc_bookings[0]
+            if all(
+                b.address_line1 == first_booking.address_line1
+                and b.address_post_code == first_booking.address_post_code
+                and b.address_line1 != ""
+                for b in acc_bookings
+            ):
+                rows.append(
+                    [
+                        account.name,
+                        first_booking.address_line1,
+                        first_booking.address_line2,
+                        first_booking.address_city,
+                        first_booking.address_county,
+                        str(first_booking.address_country.name),
+                        first_booking.address_post_code,
+                        account.email,
+                        first_booking.church,
+                        len(acc_bookings),
+                        link_start + reverse("admin:bookings_booking_change", args=[first_booking.id]),
+                    ]
+                )
+            else:
+                for b in acc_bookings:
+                    if b.address_line1 != "":
+                        rows.append(
+                            [
+                                b.name,
+                                b.address_line1,
+                                b.address_line2,
+                                b.address_city,
+                                b.address_county,
+                                str(b.address_country.name),
+                                b.address_post_code,
+                                b.get_contact_email(),
+                                b.church,
+                                1,
+                                link_start + reverse("admin:bookings_booking_change", args=[b.id]),
+                            ]
+                        )
+    return rows
+
+
 class TestBookingModel(TestBase):
     def test_need_approving(self):
         factories.create_booking()
@@ -2690,6 +3054,280 @@ class TestBookingModel(TestBase):
         assert Booking.objects.get().approval_reasons() == ["Too old"]
 
 
+class TestBasketValidator(TestBase):
+    NAMES = ["Alice Smith", "Bob Smith", "Carol Jones", "Dave Jones"]
+
+    def create_scenario(self, rng):
+        camps = [camps_factories.create_camp(future=True) for i in range(2)]
+        year = camps[0].year
+        for camp in camps:
+            camp.max_campers = rng.randint(1, 6)
+            camp.max_male_campers = rng.randint(1, 4)
+            camp.max_female_campers = rng.randint(1, 4)
+            camp.save()
+        # Places taken by other accounts:
+        for i in range(rng.randint(0, 3)):
+            factories.create_booking(camp=rng.choice(camps), sex=rng.choice("mf"), state=BookingState.BOOKED)
+        if rng.random() < 0.3:
+            factories.create_custom_agreement(year=year, name="COVID-19")
+        Price.objects.get_or_create(year=year, price_type=PriceType.SOUTH_WALES_TRANSPORT, defaults={"price": 10})
+
+        account = factories.create_booking_account()
+        # Another year, which should be ignored:
+        factories.create_booking(
+            account=account,
+            camp=camps_factories.create_camp(year=year - 1),
+            name=rng.choice(self.NAMES),
+            state=BookingState.BOOKED,
+        )
+        for i in range(rng.randint(1, 7)):
+            camp = rng.choice(camps)
+            booking = factories.create_booking(
+                account=account,
+                camp=camp,
+                name=rng.choice(self.NAMES),
+                sex=rng.choice("mf"),
+                price_type=rng.choice(BOOKING_PLACE_PRICE_TYPES),
+                state=rng.choice(BookingState.values),
+                serious_illness=rng.random() < 0.1,
+                date_of_birth=date(camp.year - rng.randint(camp.minimum_age - 1, camp.maximum_age + 1), 6, 1),
+            )
+            booking.shelved = rng.random() < 0.2
+            booking.south_wales_transport = rng.random() < 0.1
+            booking.save()
+        return account, year
+
+    def test_matches_booking_get_booking_problems(self):
+        for seed in range(40):
+            rng = random.Random(seed)
+            account, year = self.create_scenario(rng)
+            validator = BasketValidator(account=account, year=year)
+            for booking in account.bookings.all():
+                for booking_sec in [False, True]:
+                    assert validator.get_booking_problems(
+                        booking, booking_sec=booking_sec
+                    ) == booking.get_booking_problems(booking_sec=booking_sec), f"Mismatch for seed {seed}"
+            Booking.objects.all().delete()
+            Camp.objects.all().delete()
+            CustomAgreement.objects.all().delete()
+
+    def test_unsaved_changes(self):
+        # The booking being checked is used as is, other bookings are read from the DB.
+        account = factories.create_booking_account()
+        camp = camps_factories.create_camp(future=True)
+        factories.create_booking(account=account, camp=camp, name="Alice Smith")
+        booking = factories.create_booking(account=account, camp=camp, name="Bob Smith")
+        booking.price_type = PriceType.THIRD_CHILD
+        booking.first_name = "Alice"
+        validator = BasketValidator(account=account, year=camp.year)
+        assert validator.get_booking_problems(booking) == booking.get_booking_problems()
+
+    def test_query_count(self):
+        account = factories.create_booking_account()
+        camps = [camps_factories.create_camp(future=True) for i in range(2)]
+        for i, name in enumerate(self.NAMES):
+            factories.create_booking(
+                account=account,
+                camp=camps[i % 2],
+                name=name,
+                price_type=PriceType.SECOND_CHILD if i % 2 else PriceType.FULL,
+            )
+        bookings = list(account.bookings.all())
+        with self.assertNumQueries(3):
+            validator = BasketValidator(account=account, year=camps[0].year)
+            for booking in bookings:
+                validator.get_booking_problems(booking)
+
+
+class TestCampPlacesBooked(TestBase):
+    def assert_places_left(self, camp, *, total, male, female):
+        places_left = camp.get_places_left()
+        assert (places_left.total, places_left.male, places_left.female) == (total, male, female)
+
+    def test_state_changes(self):
+        camp = camps_factories.create_camp(future=True)
+        camp.max_campers, camp.max_male_campers, camp.max_female_campers = 10, 6, 6
+        camp.save()
+        self.assert_places_left(camp, total=10, male=6, female=6)
+
+        booking = factories.create_booking(camp=camp, sex="m")
+        self.assert_places_left(camp, total=10, male=6, female=6)
+
+        book_basket_now([booking])
+        self.assert_places_left(camp, total=9, male=5, female=6)
+
+        booking.confirm()
+        self.assert_places_left(camp, total=9, male=5, female=6)
+
+        # Admin edits via a fresh instance
+        booking = Booking.objects.get(id=booking.id)
+        booking.sex = "f"
+        booking.save()
+        self.assert_places_left(camp, total=9, male=6, female=5)
+
+        booking.expire()
+        self.assert_places_left(camp, total=10, male=6, female=6)
+
+        booking.state = BookingState.BOOKED
+        booking.save()
+        booking.cancel_and_move_to_shelf()
+        self.assert_places_left(camp, total=10, male=6, female=6)
+
+    def test_change_camp(self):
+        camp1 = camps_factories.create_camp()
+        camp2 = camps_factories.create_camp()
+        booking = factories.create_booking(camp=camp1, state=BookingState.BOOKED)
+        assert CampPlacesBooked.objects.get(camp=camp1).total == 1
+
+        booking.camp = camp2
+        booking.save()
+        assert CampPlacesBooked.objects.get(camp=camp1).total == 0
+        assert CampPlacesBooked.objects.get(camp=camp2).total == 1
+
+    def test_delete(self):
+        booking = factories.create_booking(state=BookingState.BOOKED)
+        factories.create_booking(camp=booking.camp, account=booking.account, state=BookingState.BOOKED)
+        assert CampPlacesBooked.objects.get(camp_id=booking.camp_id).total == 2
+        booking.delete()
+        assert CampPlacesBooked.objects.get(camp_id=booking.camp_id).total == 1
+        Booking.objects.all().delete()
+        assert CampPlacesBooked.objects.get(camp_id=booking.camp_id).total == 0
+
+    def test_stale_copies(self):
+        # e.g. a double submitted form, or concurrent admin edits
+        booking = factories.create_booking()
+        copy1 = Booking.objects.get(id=booking.id)
+        copy2 = Booking.objects.get(id=booking.id)
+        for copy_ in [copy1, copy2]:
+            copy_.state = BookingState.BOOKED
+            copy_.save()
+        assert CampPlacesBooked.objects.get(camp_id=booking.camp_id).total == 1
+
+        copy1.delete()
+        copy2.delete()
+        assert CampPlacesBooked.objects.get(camp_id=booking.camp_id).total == 0
+
+    def test_get_places_left_single_query(self):
+        camp = camps_factories.create_camp()
+        factories.create_booking(camp=camp, state=BookingState.BOOKED)
+        with self.assertNumQueries(1):
+            camp.get_places_left()
+
+    def test_rebuild(self):
+        camp = camps_factories.create_camp()
+        factories.create_booking(camp=camp, state=BookingState.BOOKED, sex="m")
+        factories.create_booking(camp=camp, state=BookingState.BOOKED, sex="f")
+        factories.create_booking(camp=camp, state=BookingState.INFO_COMPLETE, sex="f")
+        # Simulate counts getting out of sync, e.g. due to QuerySet.update()
+        Booking.objects.update(state=BookingState.BOOKED)
+        CampPlacesBooked.objects.all().delete()
+        RebuildCampPlacesBookedCommand().handle()
+        places_booked = CampPlacesBooked.objects.get(camp=camp)
+        assert (places_booked.male, places_booked.female) == (1, 2)
+
+
+class TestAccountBalances(TestBase):
+    BALANCE_ARGS = {
+        "balance_full": dict(confirmed_only=False, allow_deposits=False),
+        "balance_due_now": dict(confirmed_only=False, allow_deposits=True),
+        "confirmed_balance": dict(confirmed_only=True, allow_deposits=False),
+        "confirmed_balance_due": dict(confirmed_only=True, allow_deposits=True),
+    }
+
+    def test_with_balances_matches_get_balance(self):
+        # Camps in the past, inside and outside the deposit-only period, and
+        # in different years with different deposit prices.
+        camps = [
+            camps_factories.create_camp(start_date=date.today() + timedelta(days=days))
+            for days in [-400, -30, 10, 100, 400]
+        ]
+        for i, year in enumerate(sorted({camp.year for camp in camps})):
+            factories.create_prices(year=year, deposit=20 + i * 10)
+        accounts = [factories.create_booking_account() for i in range(2)]
+
+        @hypothesis.settings(max_examples=50, deadline=None)
+        @given(
+            bookings=st.lists(
+                st.tuples(
+                    st.sampled_from(accounts),
+                    st.sampled_from(camps),
+                    st.sampled_from(BookingState.values),
+                    st.booleans(),
+                    st.decimals(min_value=0, max_value=200, places=2),
+                ),
+                max_size=8,
+            ),
+            total_received=st.decimals(min_value=0, max_value=300, places=2),
+        )
+        def check(bookings, total_received):
+            with transaction.atomic():
+                BookingAccount.objects.filter(id=accounts[0].id).update(total_received=total_received)
+                for account, camp, state, confirmed, amount_due in bookings:
+                    booking = factories.create_booking(account=account, camp=camp, state=state, amount_due=amount_due)
+                    if state == BookingState.BOOKED and not confirmed:
+                        booking.booking_expires = timezone.now() + timedelta(days=1)
+                        booking.save()
+
+                price_checker = PriceChecker()
+                annotated = BookingAccount.objects.filter(id__in=[a.id for a in accounts]).with_balances()
+                for account in annotated:
+                    for attr, kwargs in self.BALANCE_ARGS.items():
+                        assert getattr(account, attr) == account.get_balance(price_checker=price_checker, **kwargs)
+
+                payments_due = BookingAccount.objects.payments_due()
+                assert {a.id for a in payments_due} == {
+                    a.id
+                    for a in annotated
+                    if a.get_balance(price_checker=price_checker, **self.BALANCE_ARGS["confirmed_balance_due"]) > 0
+                }
+                transaction.set_rollback(True)
+
+        check()
+
+    def test_payments_due_query_count(self):
+        for i in range(3):
+            booking = factories.create_booking(state=BookingState.BOOKED)
+            booking.confirm()
+        with self.assertNumQueries(2):
+            payments_due = BookingAccount.objects.payments_due()
+        assert len(payments_due) == 3
+        assert all(account.confirmed_balance_due == Decimal(100) for account in payments_due)
+
+    def test_outstanding_bookings_with_fees(self):
+        camp = camps_factories.create_camp()
+        paid = factories.create_booking(camp=camp, state=BookingState.BOOKED)
+        paid.confirm()
+        paid.account.receive_payment(paid.amount_due)
+        unpaid = factories.create_booking(camp=camp, state=BookingState.BOOKED)
+        unpaid.confirm()
+        # Overpaid, with a cancelled booking:
+        overpaid = factories.create_booking(camp=camp, state=BookingState.CANCELLED_FULL_REFUND)
+        overpaid.account.receive_payment(Decimal(50))
+
+        with self.assertNumQueries(3):
+            outstanding = outstanding_bookings_with_fees(camp.year)
+        assert outstanding == [unpaid, overpaid]
+        assert [(b.account.calculated_balance, b.account.calculated_balance_due) for b in outstanding] == [
+            (Decimal(100), Decimal(100)),
+            (Decimal(-50), Decimal(-50)),
+        ]
+
+    def test_booking_report_by_camp(self):
+        camp = camps_factories.create_camp()
+        bookings = [factories.create_booking(camp=camp, sex=sex) for sex in ["m", "m", "f", "f"]]
+        book_basket_now(bookings)
+        for booking in Booking.objects.filter(id__in=[b.id for b in bookings[:3]]):
+            booking.confirm()
+        factories.create_booking(camp=camp, sex="f", state=BookingState.CANCELLED_FULL_REFUND)
+        # Camps and their leaders:
+        with self.assertNumQueries(2):
+            [report] = list(booking_report_by_camp(camp.year))
+        assert report.booked_places_count == 4
+        assert report.confirmed_bookings_count == 3
+        assert report.confirmed_bookings_boys_count == 2
+        assert report.confirmed_bookings_girls_count == 1
+
+
 class TestPaymentModels(TestBase):
     def test_payment_source_save_bad(self):
         manual = factories.create_manual_payment()
@@ -2716,6 +3354,65 @@ class TestPaymentModels(TestBase):
 
         assert account.get_balance_full() == 0
 
+    def _create_unprocessed_payments(self, amounts_by_account):
+        for account, amounts in amounts_by_account.items():
+            for amount in amounts:
+                Payment.objects.create(
+                    account=account, amount=Decimal(amount), processed=None, created_at=timezone.now()
+                )
+
+    def test_process_all_payments_by_account(self):
+        account1 = factories.create_booking_account()
+        account2 = factories.create_booking_account()
+        booking = factories.create_booking(account=account1)
+        book_basket_now([booking])
+        self._create_unprocessed_payments({account1: [50, 30, 20], account2: [10, -5]})
+
+        with mock.patch.object(
+            BookingAccount, "distribute_balance", autospec=True, side_effect=BookingAccount.distribute_balance
+        ) as distribute_balance:
+            process_all_payments()
+        # Once per account, not once per payment
+        assert distribute_balance.call_count == 2
+
+        account1.refresh_from_db()
+        account2.refresh_from_db()
+        assert account1.total_received == Decimal(100)
+        assert account2.total_received == Decimal(5)
+        assert not Payment.objects.filter(processed__isnull=True).exists()
+        booking.refresh_from_db()
+        assert booking.is_confirmed
+
+    def test_process_all_payments_batch_size(self):
+        accounts = [factories.create_booking_account() for i in range(3)]
+        self._create_unprocessed_payments({account: [1, 2, 3] for account in accounts})
+        process_all_payments(batch_size=2)
+        assert not Payment.objects.filter(processed__isnull=True).exists()
+        assert [refresh(account).total_received for account in accounts] == [Decimal(6)] * 3
+
+    @override_settings(PAYMENT_PROCESSING_BATCH_SIZE=2)
+    def test_credit_account_processes_in_batches(self):
+        accounts = [factories.create_booking_account() for i in range(3)]
+        self._create_unprocessed_payments({account: [1, 2] for account in accounts})
+        with mock.patch(
+            "cciw.bookings.models._process_payments_batch", wraps=bookings_models._process_payments_batch
+        ) as process_payments_batch:
+            credit_account(Decimal(4), accounts[0], None)
+        assert all(call.kwargs == {"batch_size": 2} for call in process_payments_batch.call_args_list)
+        assert not Payment.objects.filter(processed__isnull=True).exists()
+        assert [refresh(account).total_received for account in accounts] == [Decimal(7), Decimal(3), Decimal(3)]
+
+    def test_process_all_payments_query_count(self):
+        # The number of queries depends on the number of accounts, not payments
+        account = factories.create_booking_account()
+        self._create_unprocessed_payments({account: [1] * 2})
+        with CaptureQueriesContext(connection) as few_payments:
+            process_all_payments()
+        self._create_unprocessed_payments({account: [1] * 20})
+        with CaptureQueriesContext(connection) as many_payments:
+            process_all_payments()
+        assert len(few_payments) == len(many_payments)
+
 
 class SupportingInformationAdminBase(fix_autocomplete_fields("booking"), FuncBaseMixin):
     def test_separate_supporting_information_admin(self):
@@ -2866,6 +3563,90 @@ class DocumentDownloadView(WebTestBase):
         assert response.status_code == 200
 
 
+class TestDocumentDownloadStreaming(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.info = factories.create_supporting_information(
+            document_filename="temp.txt",
+            document_content=b"Hello world",
+            document_mimetype="text/plain",
+        )
+        self.url = self.info.document.url
+        self.client.force_login(officers_factories.create_booking_secretary())
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def test_full(self):
+        response, content = self.get()
+        assert response.status_code == 200
+        assert content == b"Hello world"
+        assert response["Content-Length"] == "11"
+        assert response["Content-Type"] == "text/plain"
+        assert response["Accept-Ranges"] == "bytes"
+        assert response["Content-Disposition"] == 'attachment; filename="temp.txt"'
+
+    def test_not_modified(self):
+        response, _ = self.get()
+        response2, content = self.get(if_none_match=response["ETag"])
+        assert response2.status_code == 304
+        assert content == b""
+        assert response2["ETag"] == response["ETag"]
+
+        response3, _ = self.get(if_modified_since=response["Last-Modified"])
+        assert response3.status_code == 304
+
+        response4, _ = self.get(if_none_match='"something-else"')
+        assert response4.status_code == 200
+
+    def test_ranges(self):
+        for range_header, expected_content, expected_content_range in [
+            ("bytes=0-4", b"Hello", "bytes 0-4/11"),
+            ("bytes=6-", b"world", "bytes 6-10/11"),
+            ("bytes=6-100", b"world", "bytes 6-10/11"),
+            ("bytes=-3", b"rld", "bytes 8-10/11"),
+            ("bytes=-100", b"Hello world", "bytes 0-10/11"),
+        ]:
+            response, content = self.get(range=range_header)
+            assert response.status_code == 206, range_header
+            assert content == expected_content
+            assert response["Content-Range"] == expected_content_range
+            assert response["Content-Length"] == str(len(expected_content))
+
+    def test_range_ignored(self):
+        for range_header in ["bytes=4-2", "bytes=0-1,4-5", "lines=1-2", "bytes=-"]:
+            response, content = self.get(range=range_header)
+            assert response.status_code == 200, range_header
+            assert content == b"Hello world"
+
+    def test_range_not_satisfiable(self):
+        for range_header in ["bytes=11-", "bytes=-0"]:
+            response, _ = self.get(range=range_header)
+            assert response.status_code == 416, range_header
+            assert response["Content-Range"] == "bytes */11"
+
+    def test_if_range(self):
+        etag = self.get()[0]["ETag"]
+        response, content = self.get(range="bytes=0-4", if_range=etag)
+        assert response.status_code == 206
+        response, content = self.get(range="bytes=0-4", if_range='"old"')
+        assert response.status_code == 200
+        assert content == b"Hello world"
+
+    def test_not_gzipped(self):
+        response, content = self.get(accept_encoding="gzip")
+        assert "Content-Encoding" not in response
+        assert content == b"Hello world"
+
+    def test_iter_content_chunks(self):
+        document = self.info.document
+        assert list(document.iter_content(chunk_size=4)) == [b"Hell", b"o wo", b"rld"]
+        assert list(document.iter_content(2, 9, chunk_size=4)) == [b"llo ", b"wor"]
+        assert list(document.iter_content(11)) == []
+
+
 @given(st.emails())
 def test_decode_inverts_encode(email):
     v = EmailVerifyTokenGenerator()
@@ -2897,3 +3678,179 @@ def test_tolerate_truncated_trailing_equals(email):
         return s.rstrip("=")
 
         assert v.email_from_token(remove_equals(v.token_for_email(email))) == email
+
+
+class TestBookingStats(TestBase):
+    def create_booking(self, camp, *, booked_at, date_of_birth=Auto):
+        booking = factories.create_booking(camp=camp, state=BookingState.BOOKED, date_of_birth=date_of_birth)
+        Booking.objects.filter(id=booking.id).update(booked_at=booked_at)
+        return booking
+
+    def test_progress_stats(self):
+        camp_2019 = camps_factories.create_camp(start_date=date(2019, 7, 1))
+        camp_2020 = camps_factories.create_camp(start_date=date(2020, 7, 1))
+        self.create_booking(camp_2019, booked_at=datetime(2019, 3, 1, 12, tzinfo=timezone.get_default_timezone()))
+        self.create_booking(camp_2019, booked_at=datetime(2019, 3, 4, 12, tzinfo=timezone.get_default_timezone()))
+        self.create_booking(camp_2020, booked_at=datetime(2020, 2, 29, 12, tzinfo=timezone.get_default_timezone()))
+
+        data_dates, data_rel_days = get_booking_progress_stats(start_year=2018, end_year=2020)
+        assert list(data_dates.columns) == ["2019", "2020"]
+        # Gaps between dates are filled
+        assert data_dates["2019"].dropna().to_dict() == {
+            pd.Timestamp(2019, 3, 1): 1,
+            pd.Timestamp(2019, 3, 2): 1,
+            pd.Timestamp(2019, 3, 3): 1,
+            pd.Timestamp(2019, 3, 4): 2,
+        }
+        assert data_rel_days["2019"].dropna().to_dict() == {-122: 1, -121: 1, -120: 1, -119: 2}
+
+        # Overlaid years, with leap day moving like datedelta.
+        data_dates, data_rel_days = get_booking_progress_stats(camps=[camp_2020, camp_2019], overlay_years=True)
+        assert list(data_dates.columns) == [str(camp_2020.url_id), str(camp_2019.url_id)]
+        assert data_dates[str(camp_2019.url_id)].dropna().index[0] == pd.Timestamp(2020, 3, 1)
+
+    def test_ages_stats(self):
+        camp = camps_factories.create_camp(start_date=date(2020, 7, 1))
+        birth_dates = [date(2008, 8, 31), date(2008, 9, 1), date(2007, 1, 1)]
+        bookings = [
+            self.create_booking(camp, booked_at=timezone.now(), date_of_birth=birth_date) for birth_date in birth_dates
+        ]
+        data = get_booking_ages_stats(start_year=2019, end_year=2020)
+        assert data["2020"].to_dict() == {11: 1, 12: 1, 13: 1}
+        assert data["2019"].to_dict() == {11: 0, 12: 0, 13: 0}
+        assert data["Total"].to_dict() == {11: 1, 12: 1, 13: 1}
+        assert sorted(data["2020"].index) == sorted(refresh(b).age_on_camp() for b in bookings)
+
+
+class TestBookingStatsStore(TestBase):
+    def total_stored(self, year):
+        return sum(BookingStatsCount.objects.filter(camp__year=year).values_list("count", flat=True))
+
+    def test_built_on_demand(self):
+        camp = camps_factories.create_camp(start_date=date(2020, 7, 1))
+        factories.create_booking(camp=camp, state=BookingState.BOOKED, sex="m")
+        factories.create_booking(camp=camp, state=BookingState.INFO_COMPLETE, sex="f")
+        assert not BookingStatsYear.objects.exists()
+
+        data = get_booking_summary_stats(2020, 2020)
+        assert data.loc[2020].to_dict() == {"Male": 1, "Female": 0, "Total": 1}
+        stats_year = BookingStatsYear.objects.get(year=2020)
+        assert stats_year.built_at is not None
+        assert not stats_year.stale
+        assert self.total_stored(2020) == 1
+
+    def test_closed_year_not_rebuilt(self):
+        camp = camps_factories.create_camp(start_date=date(2020, 7, 1))
+        factories.create_booking(camp=camp, state=BookingState.BOOKED)
+        get_booking_summary_stats(2020, 2020)
+        with CaptureQueriesContext(connection) as queries:
+            get_booking_summary_stats(2020, 2020)
+        assert not any("bookings_bookingstatscount" in q["sql"] and "DELETE" in q["sql"] for q in queries)
+
+    def test_changes_mark_year_stale(self):
+        camp = camps_factories.create_camp(start_date=date(2020, 7, 1))
+        booking = factories.create_booking(camp=camp, state=BookingState.BOOKED, sex="m")
+        get_booking_summary_stats(2020, 2020)
+
+        # Non-confirmed bookings don't affect anything
+        other_booking = factories.create_booking(camp=camp)
+        other_booking.state = BookingState.BOOKED
+        other_booking.booking_expires = timezone.now() + timedelta(days=1)
+        other_booking.save()
+        assert not BookingStatsYear.objects.get(year=2020).stale
+
+        # Confirming does
+        other_booking.confirm()
+        assert BookingStatsYear.objects.get(year=2020).stale
+        get_booking_summary_stats(2020, 2020)
+        assert self.total_stored(2020) == 2
+
+        # Changing relevant fields does
+        booking = Booking.objects.get(id=booking.id)
+        booking.sex = "f"
+        booking.save()
+        assert BookingStatsYear.objects.get(year=2020).stale
+        data = get_booking_summary_stats(2020, 2020)
+        assert data.loc[2020].to_dict() == {"Male": 1, "Female": 1, "Total": 2}
+
+        # Deleting does
+        booking.delete()
+        assert BookingStatsYear.objects.get(year=2020).stale
+        get_booking_summary_stats(2020, 2020)
+        assert self.total_stored(2020) == 1
+
+    def test_refresh_interval(self):
+        camp = camps_factories.create_camp(start_date=date(2020, 7, 1))
+        factories.create_booking(camp=camp, state=BookingState.BOOKED)
+        with override_settings(BOOKING_STATS_REFRESH_INTERVAL=timedelta(minutes=10)):
+            get_booking_summary_stats(2020, 2020)
+            factories.create_booking(camp=camp, state=BookingState.BOOKED)
+            data = get_booking_summary_stats(2020, 2020)
+            # Not rebuilt yet:
+            assert data.loc[2020, "Total"] == 1
+            freshness = get_booking_stats_freshness([2020])
+            assert freshness.pending_changes
+
+            BookingStatsYear.objects.update(built_at=timezone.now() - timedelta(minutes=11))
+            data = get_booking_summary_stats(2020, 2020)
+            assert data.loc[2020, "Total"] == 2
+            assert not get_booking_stats_freshness([2020]).pending_changes
+
+    def test_rebuild_command(self):
+        camp = camps_factories.create_camp(start_date=date(2020, 7, 1))
+        factories.create_booking(camp=camp, state=BookingState.BOOKED)
+        get_booking_summary_stats(2020, 2020)
+        # Simulate getting out of sync, e.g. due to QuerySet.update()
+        Booking.objects.update(sex="f")
+        RebuildBookingStatsCommand().handle()
+        assert list(BookingStatsCount.objects.values_list("sex", "count")) == [("f", 1)]
+        assert not BookingStatsYear.objects.get(year=2020).stale
+
+
+class TestBookingStatsRefreshConcurrency(TestBaseMixin, TransactionTestCase):
+    def test_change_during_refresh(self):
+        camp = camps_factories.create_camp(start_date=date(2020, 7, 1))
+        factories.create_booking(camp=camp, state=BookingState.BOOKED)
+        booking = factories.create_booking(camp=camp)
+        booking.state = BookingState.BOOKED
+        booking.booking_expires = timezone.now() + timedelta(days=1)
+        booking.save()
+        get_booking_summary_stats(2020, 2020)
+        BookingStatsYear.objects.update(stale=True)
+
+        counted = threading.Event()
+        finish = threading.Event()
+        original_bulk_create = BookingStatsCount.objects.bulk_create
+
+        def bulk_create(objs, **kwargs):
+            # Counts have been done, but not committed
+            counted.set()
+            finish.wait(timeout=10)
+            return original_bulk_create(objs, **kwargs)
+
+        def run_in_thread(func):
+            def target():
+                try:
+                    func()
+                finally:
+                    connection.close()
+
+            thread = threading.Thread(target=target)
+            thread.start()
+            return thread
+
+        with mock.patch.object(BookingStatsCount.objects, "bulk_create", bulk_create):
+            refresh_thread = run_in_thread(lambda: refresh_booking_stats(2020))
+            assert counted.wait(timeout=10)
+            confirm_thread = run_in_thread(lambda: Booking.objects.get(id=booking.id).confirm())
+            # The change waits for the refresh to finish:
+            confirm_thread.join(timeout=0.5)
+            assert confirm_thread.is_alive()
+            finish.set()
+            refresh_thread.join()
+            confirm_thread.join()
+
+        # The confirmed booking wasn't counted, so the year is stale:
+        assert get_booking_stats_freshness([2020]).pending_changes
+        data = get_booking_summary_stats(2020, 2020)
+        assert data.loc[2020, "Total"] == 2
@@ -1,9 +1,14 @@
+from collections.abc import Callable, Iterable
 from datetime import date, timedelta
-from itertools import groupby
 
 from dateutil.relativedelta import relativedelta
+from django.contrib.postgres.aggregates import ArrayAgg
 from django.contrib.sites.shortcuts import get_current_site
+from django.db.models import Count, Min, Q, Value
+from django.db.models.functions import Trim
+from django.db.models.lookups import Exact
 from django.urls import reverse
+from django_countries.fields import Country
 
 from cciw.cciwmain.models import Camp
 from cciw.officers.applications import applications_for_camp
@@ -11,6 +16,8 @@ from cciw.utils.spreadsheet import ExcelSimpleBuilder
 
 from .models import Booking, BookingAccount, Payment
 
+MAILING_LIST_CHUNK_SIZE = 2000
+
 
 def format_address(*args):
     return "\n".join(arg.strip() for arg in args)
@@ -35,7 +42,7 @@ def camp_bookings_to_spreadsheet(camp: Camp) -> ExcelSimpleBuilder:
     ]
 
     spreadsheet.add_sheet_with_header_row(
-        "Summary", [n for n, f in columns], [[f(b) for n, f in columns] for b in bookings]
+        "Summary", [n for n, f in columns], ([f(b) for n, f in columns] for b in bookings)
     )
 
     everything_columns = [
@@ -63,7 +70,7 @@ def camp_bookings_to_spreadsheet(camp: Camp) -> ExcelSimpleBuilder:
     ]
 
     spreadsheet.add_sheet_with_header_row(
-        "Everything", [n for n, f in everything_columns], [[f(b) for n, f in everything_columns] for b in bookings]
+        "Everything", [n for n, f in everything_columns], ([f(b) for n, f in everything_columns] for b in bookings)
     )
 
     def get_birthday(born):
@@ -149,7 +156,7 @@ def year_bookings_to_spreadsheet(year: int) -> ExcelSimpleBuilder:
     ]
 
     spreadsheet.add_sheet_with_header_row(
-        "All bookings", [n for n, f in columns], [[f(b) for n, f in columns] for b in bookings]
+        "All bookings", [n for n, f in columns], ([f(b) for n, f in columns] for b in bookings.iterator())
     )
     return spreadsheet
 
@@ -166,6 +173,7 @@ def payments_to_spreadsheet(date_start: date, date_end: date) -> ExcelSimpleBuil
         # cancel out anyway:
         source__isnull=False,
     ).order_by("created_at")
+    payments = payments.select_related("account")
 
     columns = [
         ("Account name", lambda p: p.account.name),
@@ -176,21 +184,13 @@ def payments_to_spreadsheet(date_start: date, date_end: date) -> ExcelSimpleBuil
     ]
 
     spreadsheet.add_sheet_with_header_row(
-        "Payments", [n for n, f in columns], [[f(p) for n, f in columns] for p in payments]
+        "Payments", [n for n, f in columns], ([f(p) for n, f in columns] for p in payments.iterator())
     )
     return spreadsheet
 
 
 def addresses_for_mailing_list(year: int) -> ExcelSimpleBuilder:
     spreadsheet = ExcelSimpleBuilder()
-    # We get the postal addresses that we have for the *previous* year
-    # to generate the mailing list for the given year.
-    bookings = (
-        Booking.objects.filter(camp__year=year - 1)
-        .order_by("account")  # for easy duplicate elimination
-        .select_related("account")
-    )
-
     headers = [
         "Name",
         "Address line 1",
@@ -204,84 +204,173 @@ def addresses_for_mailing_list(year: int) -> ExcelSimpleBuilder:
         "# bookings",
         "URL",
     ]
-    rows = []
-    domain = get_current_site(None).domain
-
-    link_start = f"https://{domain}"
+    rows = list(_mailing_list_rows(year))
+    rows.sort()  # first column (Name) alphabetical
 
-    for account, acc_bookings in groupby(bookings, lambda b: b.account):
-        if not account.include_in_mailings:
-            continue
+    spreadsheet.add_sheet_with_header_row("Addresses", headers, rows)
+    return spreadsheet
 
-        acc_bookings = list(acc_bookings)
-        if account.address_line1.strip() != "":
-            # Account has postal address
 
+def _mailing_list_rows(year: int) -> Iterable[list]:
+    # We get the postal addresses that we have for the *previous* year
+    # to generate the mailing list for the given year.
+    #
+    # For each account, we use the account address if there is one. Otherwise
+    # we use booking addresses, collapsed into a single row if all bookings have
+    # the same address. The collapsing is done in the database, and only the
+    # bookings whose addresses we need are then fetched.
+    bookings = Booking.objects.filter(camp__year=year - 1)
+    accounts = (
+        BookingAccount.objects.include_in_mailings()
+        .filter(bookings__camp__year=year - 1)
+        .annotate(
+            booking_count=Count("bookings"),
+            first_booking_id=Min("bookings__id"),
             # Use booking data for church. It isn't important to be accurate,
             # this is just used to adjust mailing lists if a church is known to
             # already receive enough brochures.
-            churches = [b.church.strip() for b in acc_bookings if b.church.strip()]
-            church = churches[0] if churches else ""
-            rows.append(
-                [
-                    account.name,
-                    account.address_line1,
-                    account.address_line2,
-                    account.address_city,
-                    account.address_county,
-                    str(account.address_country.name),
-                    account.address_post_code,
-                    account.email,
-                    church,
-                    len(acc_bookings),
-                    link_start + reverse("admin:bookings_bookingaccount_change", args=[account.id]),
-                ]
-            )
+            churches=ArrayAgg(
+                Trim("bookings__church"),
+                filter=~Q(Exact(Trim("bookings__church"), Value(""))),
+                ordering="bookings__id",
+                default=Value([]),
+            ),
+            address_line1_count=Count("bookings__address_line1", distinct=True),
+            address_post_code_count=Count("bookings__address_post_code", distinct=True),
+        )
+        .order_by()
+        .values_list(
+            "id",
+            "name",
+            "address_line1",
+            "address_line2",
+            "address_city",
+            "address_county",
+            "address_country",
+            "address_post_code",
+            "email",
+            "booking_count",
+            "first_booking_id",
+            "churches",
+            "address_line1_count",
+            "address_post_code_count",
+        )
+    )
+
+    account_url = _make_admin_url_function("bookingaccount")
+    booking_url = _make_admin_url_function("booking")
+    country_name = _make_country_name_function()
+
+    collapsed_booking_counts = {}  # first booking id: booking count
+    expanded_account_ids = []
+    for (
+        account_id,
+        name,
+        address_line1,
+        address_line2,
+        address_city,
+        address_county,
+        address_country,
+        address_post_code,
+        email,
+        booking_count,
+        first_booking_id,
+        churches,
+        address_line1_count,
+        address_post_code_count,
+    ) in accounts.iterator(chunk_size=MAILING_LIST_CHUNK_SIZE):
+        if address_line1.strip() != "":
+            # Account has postal address
+            yield [
+                name,
+                address_line1,
+                address_line2,
+                address_city,
+                address_county,
+                country_name(address_country),
+                address_post_code,
+                email,
+                churches[0] if churches else "",
+                booking_count,
+                account_url(account_id),
+            ]
+        elif address_line1_count == 1 and address_post_code_count == 1:
+            # All bookings have the same address (which may be blank), so collapse
+            collapsed_booking_counts[first_booking_id] = booking_count
         else:
-            # Use bookings for address
-
-            # If they all have the same address, collapse
-            first_booking = acc_bookings[0]
-            if all(
-                b.address_line1 == first_booking.address_line1
-                and b.address_post_code == first_booking.address_post_code
-                and b.address_line1 != ""
-                for b in acc_bookings
-            ):
-                rows.append(
-                    [
-                        account.name,
-                        first_booking.address_line1,
-                        first_booking.address_line2,
-                        first_booking.address_city,
-                        first_booking.address_county,
-                        str(first_booking.address_country.name),
-                        first_booking.address_post_code,
-                        account.email,
-                        first_booking.church,
-                        len(acc_bookings),
-                        link_start + reverse("admin:bookings_booking_change", args=[first_booking.id]),
-                    ]
-                )
-            else:
-                for b in acc_bookings:
-                    if b.address_line1 != "":
-                        rows.append(
-                            [
-                                b.name,
-                                b.address_line1,
-                                b.address_line2,
-                                b.address_city,
-                                b.address_county,
-                                str(b.address_country.name),
-                                b.address_post_code,
-                                b.get_contact_email(),
-                                b.church,
-                                1,
-                                link_start + reverse("admin:bookings_booking_change", args=[b.id]),
-                            ]
-                        )
-    rows.sort()  # first column (Name) alphabetical
+            expanded_account_ids.append(account_id)
+
+    booking_rows = (
+        bookings.filter(Q(id__in=collapsed_booking_counts.keys()) | Q(account_id__in=expanded_account_ids))
+        .exclude(address_line1="")
+        .order_by()
+        .values_list(
+            "id",
+            "first_name",
+            "last_name",
+            "address_line1",
+            "address_line2",
+            "address_city",
+            "address_county",
+            "address_country",
+            "address_post_code",
+            "email",
+            "church",
+            "account__name",
+            "account__email",
+        )
+    )
+    for (
+        booking_id,
+        first_name,
+        last_name,
+        address_line1,
+        address_line2,
+        address_city,
+        address_county,
+        address_country,
+        address_post_code,
+        email,
+        church,
+        account_name,
+        account_email,
+    ) in booking_rows.iterator(chunk_size=MAILING_LIST_CHUNK_SIZE):
+        address = [
+            address_line1,
+            address_line2,
+            address_city,
+            address_county,
+            country_name(address_country),
+            address_post_code,
+        ]
+        if booking_id in collapsed_booking_counts:
+            yield [
+                account_name,
+                *address,
+                account_email,
+                church,
+                collapsed_booking_counts[booking_id],
+                booking_url(booking_id),
+            ]
+        else:
+            # See Booking.name and Booking.get_contact_email
+            yield [f"{first_name} {last_name}", *address, email or account_email, church, 1, booking_url(booking_id)]
 
-    spreadsheet.add_sheet_with_header_row("Addresses", headers, rows)
-    return spreadsheet
+
+def _make_admin_url_function(model_name: str) -> Callable[[int], str]:
+    # reverse() is relatively slow, so we call it once and fill in the id
+    domain = get_current_site(None).domain
+    url = reverse(f"admin:bookings_{model_name}_change", args=[0])
+    start, end = url.split("/0/")
+    return lambda id: f"https://{domain}{start}/{id}/{end}"
+
+
+def _make_country_name_function() -> Callable[[str | None], str]:
+    names = {}
+
+    def country_name(code: str | None) -> str:
+        if code not in names:
+            names[code] = str(Country(code=code).name)
+        return names[code]
+
+    return country_name
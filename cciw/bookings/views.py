@@ -31,6 +31,7 @@ from cciw.bookings.models import (
     BOOKING_PLACE_CONTACT_ADDRESS_DETAILS,
     BOOKING_PLACE_GP_DETAILS,
     AgreementFetcher,
+    BasketValidator,
     Booking,
     BookingAccount,
     BookingState,
@@ -485,11 +486,11 @@ def _list_bookings(request):
     total = Decimal("0.00")
     all_bookable = True
     all_unbookable = True
-    agreement_fetcher = AgreementFetcher()
+    basket_validator = BasketValidator(account=request.booking_account, year=year)
     for booking_list in basket_bookings, shelf_bookings:
         for b in booking_list:
             # decorate object with some attributes to make it easier in template
-            b.booking_problems, b.booking_warnings = b.get_booking_problems(agreement_fetcher=agreement_fetcher)
+            b.booking_problems, b.booking_warnings = basket_validator.get_booking_problems(b)
             b.bookable = len(b.booking_problems) == 0
             b.manually_approved = b.state == BookingState.APPROVED
 
@@ -124,7 +124,7 @@ class CampAdmin(admin.ModelAdmin):
         if request.user.has_perm("cciwmain.change_camp"):
             return qs
         else:
-            return qs.filter(id__in=[c.id for c in request.user.viewable_camps])
+            return qs.filter(id__in=request.user.capabilities.camp_ids)
 
     def get_readonly_fields(self, request, obj=None):
         readonly_fields = list(super().get_readonly_fields(request, obj))
@@ -8,6 +8,7 @@ from functools import wraps
 import attr
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.http import HttpResponse
 from django.utils import timezone
 from django.utils.html import format_html_join
@@ -51,8 +52,7 @@ def htmx_form_validate(*, form_class: type):
     return decorator
 
 
-_thisyear = None
-_thisyear_timestamp = None
+THISYEAR_CACHE_KEY = "cciw.cciwmain.thisyear"
 
 
 def get_thisyear():
@@ -63,20 +63,36 @@ def get_thisyear():
     (30 days, to give a leaders the chance to access the leader
     area after their camp is finished).
     """
-    global _thisyear, _thisyear_timestamp
-    if _thisyear is None or _thisyear_timestamp is None or (timezone.now() - _thisyear_timestamp).seconds > 3600:
-        from cciw.cciwmain.models import Camp
-
-        try:
-            lastcamp = Camp.objects.prefetch_related(None).order_by("-end_date")[0]
-        except IndexError:
-            return timezone.now().year
-        if lastcamp.end_date + timedelta(days=30) <= date.today():
-            _thisyear = lastcamp.year + 1
-        else:
-            _thisyear = lastcamp.year
-        _thisyear_timestamp = timezone.now()
-    return _thisyear
+    # This is needed for almost every page, so it is stored in the shared
+    # cache, along with the date until which it is valid, and cleared when
+    # camps are changed (see hooks.py).
+    today = date.today()
+    cached = cache.get(THISYEAR_CACHE_KEY)
+    if cached is not None:
+        thisyear, valid_until = cached
+        if today < valid_until:
+            return thisyear
+
+    thisyear, valid_until = _calculate_thisyear(today)
+    cache.set(THISYEAR_CACHE_KEY, (thisyear, valid_until), timeout=None)
+    return thisyear
+
+
+def _calculate_thisyear(today: date) -> tuple[int, date]:
+    from cciw.cciwmain.models import Camp
+
+    lastcamp = Camp.objects.prefetch_related(None).order_by("-end_date").first()
+    if lastcamp is None:
+        return timezone.now().year, today + timedelta(days=1)
+    rollover_date = lastcamp.end_date + timedelta(days=30)
+    if rollover_date <= today:
+        return lastcamp.year + 1, date.max
+    else:
+        return lastcamp.year, rollover_date
+
+
+def clear_thisyear_cache():
+    cache.delete(THISYEAR_CACHE_KEY)
 
 
 def standard_subs(value):
@@ -109,6 +125,7 @@ def standard_processor(request):
         # instances.
         return context
 
+    from cciw.cciwmain.pagecache import get_or_render
     from cciw.sitecontent.models import MenuLink
 
     thisyear = get_thisyear()
@@ -132,7 +149,9 @@ def standard_processor(request):
         if len(links_cache) > 0:
             return links_cache
         else:
-            for link in MenuLink.objects.filter(parent_item__isnull=True, visible=True):
+            for link in get_or_render(
+                request, "menulinks", [], lambda: list(MenuLink.objects.filter(parent_item__isnull=True, visible=True))
+            ):
                 link.title = standard_subs(link.title)
                 link.is_current_page = False
                 link.is_current_section = False
@@ -1,8 +1,10 @@
 from django.conf import settings
 from django.core.signals import request_started
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
-from cciw.cciwmain.models import Camp, CampName, generate_colors_scss
+from cciw.cciwmain import common, pagecache
+from cciw.cciwmain.models import Camp, CampName, Person, Site, generate_colors_scss
+from cciw.utils.cache import clear_cache_now_and_on_commit
 
 
 def generate_colors_scss_w(sender, **kwargs):
@@ -27,6 +29,9 @@ def server_startup(sender, **kwargs):
         # when attempting to access the site
         generate_colors_scss(update_existing=False)
 
+        # Precompute values needed on every page
+        common.get_thisyear()
+
     _FIRST_REQUEST_HANDLED = True
     request_started.disconnect(server_startup)
 
@@ -44,3 +49,21 @@ def recreate_ses_routes_for_camp_creation(sender, created=None, **kwargs):
 
 
 post_save.connect(recreate_ses_routes_for_camp_creation, sender=Camp)
+
+
+def camp_changed(sender, **kwargs):
+    clear_cache_now_and_on_commit(common.clear_thisyear_cache)
+
+
+post_save.connect(camp_changed, sender=Camp)
+post_delete.connect(camp_changed, sender=Camp)
+
+
+def public_pages_changed(sender, **kwargs):
+    clear_cache_now_and_on_commit(pagecache.clear_page_cache)
+
+
+for model in [Camp, CampName, Site, Person]:
+    post_save.connect(public_pages_changed, sender=model)
+    post_delete.connect(public_pages_changed, sender=model)
+m2m_changed.connect(public_pages_changed, sender=Camp.leaders.through)
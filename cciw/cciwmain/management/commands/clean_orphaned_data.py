@@ -1,8 +1,15 @@
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 
 from cciw.bookings.models import SupportingInformationDocument
+from cciw.mail.incoming import delete_old_incoming_mail
+from cciw.officers.exports import delete_expired_export_jobs, fail_stalled_export_jobs
 
 
 class Command(BaseCommand):
     def handle(self, *args, **options):
         SupportingInformationDocument.objects.orphaned().old().delete()
+        now = timezone.now()
+        fail_stalled_export_jobs(now)
+        delete_expired_export_jobs(now)
+        delete_old_incoming_mail(now)
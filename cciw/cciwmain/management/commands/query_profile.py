@@ -0,0 +1,52 @@
+import texttable
+from django.core.management.base import BaseCommand
+
+from cciw.query_profiler import ORDERINGS, get_query_profiles, reset_query_profiles
+
+
+class Command(BaseCommand):
+    help = "Show the views with the worst query profiles, as recorded by cciw.query_profiler"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--order-by", choices=list(ORDERINGS), default="duplicates")
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--detailed", action="store_true", help="Show duplicate queries for each view")
+        parser.add_argument("--reset", action="store_true", help="Clear the recorded data")
+
+    def handle(self, *args, order_by, limit, detailed, reset, **options):
+        if reset:
+            reset_query_profiles()
+            return
+        profiles = get_query_profiles(order_by=order_by)[:limit]
+        if not profiles:
+            self.stdout.write("No requests have been recorded.")
+            return
+        table = texttable.Texttable(max_width=0)
+        table.set_deco(texttable.Texttable.HEADER)
+        table.set_cols_dtype(["t", "i", "f", "f", "i", "f", "f"])
+        table.add_row(
+            ["URL name", "Requests", "Mean queries", "Mean duplicates", "Max queries", "Mean DB time", "Total DB time"]
+        )
+        for profile in profiles:
+            table.add_row(
+                [
+                    profile.url_name,
+                    profile.requests,
+                    profile.mean_queries,
+                    profile.mean_duplicates,
+                    profile.max_queries,
+                    profile.mean_db_time,
+                    profile.db_time,
+                ]
+            )
+        self.stdout.write(table.draw())
+
+        if detailed:
+            for profile in profiles:
+                if not profile.duplicate_groups:
+                    continue
+                self.stdout.write(f"\n=== {profile.url_name}: {profile.max_queries} queries ===")
+                for group in profile.duplicate_groups:
+                    self.stdout.write(f"\n{group.count} times, {group.db_time:.4f}s:\n  {group.sql}")
+                    if group.stacktrace:
+                        self.stdout.write(group.stacktrace)
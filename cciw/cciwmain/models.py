@@ -259,16 +259,17 @@ class Camp(models.Model):
         Return the number of places left total and for male/female campers.
         Note that the first isn't necessarily the sum of 2nd and 3rd.
         """
-        from cciw.bookings.models import Sex
-
-        females_booked = 0
-        males_booked = 0
-        q = self.bookings.booked().values_list("sex").annotate(count=models.Count("id")).order_by()
-        for s, c in q:
-            if s == Sex.MALE:
-                males_booked = c
-            elif s == Sex.FEMALE:
-                females_booked = c
+        from cciw.bookings.models import CampPlacesBooked
+
+        # Denormalised counts, see CampPlacesBooked
+        counts = CampPlacesBooked.objects.filter(camp_id=self.id).values_list("male", "female").first()
+        males_booked, females_booked = counts if counts is not None else (0, 0)
+        return self.get_places_left_for_booked(males_booked=males_booked, females_booked=females_booked)
+
+    def get_places_left_for_booked(self, *, males_booked: int, females_booked: int) -> PlacesLeft:
+        """
+        Return the places left given the number of booked places.
+        """
         total_booked = males_booked + females_booked
         # negative numbers of places available is confusing for our purposes, so use max
         return PlacesLeft(
@@ -0,0 +1,100 @@
+"""
+Caching of rendered content on public pages.
+
+Content is only cached for anonymous users, and all of it is invalidated
+together when any of the data it is built from changes (see the hooks modules
+of cciwmain and sitecontent), by changing the 'generation' that is part of
+every key.
+
+Things that vary per request or per user (CSRF tokens, messages, "Edit" links
+for staff etc.) must be kept outside cached content.
+"""
+import threading
+import uuid
+from collections.abc import Callable
+from typing import TypeVar
+
+import attr
+from django.core.cache import cache
+
+from cciw.cciwmain import common
+
+T = TypeVar("T")
+
+PAGE_CACHE_GENERATION_CACHE_KEY = "cciw.pagecache.generation"
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+@attr.s(auto_attribs=True)
+class PageCacheStats:
+    """
+    Counts of hits and misses for the page cache, for this process.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    lock: threading.Lock = attr.ib(factory=threading.Lock, init=False, repr=False, eq=False)
+
+    def record(self, hit: bool):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def reset(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+stats = PageCacheStats()
+
+_MISSING = object()
+
+
+def use_page_cache(request) -> bool:
+    user = getattr(request, "user", None)
+    return request.method in ("GET", "HEAD") and user is not None and not user.is_authenticated
+
+
+def get_or_render(request, name: str, vary_on: list, render: Callable[[], T]) -> T:
+    """
+    Returns the cached value for fragment `name` and `vary_on`, or calls
+    `render` to create and store it. The current year is always included in the
+    key.
+
+    For users who are logged in, the cache is not used.
+    """
+    if not use_page_cache(request):
+        return render()
+    key = ":".join(
+        ["cciw.pagecache", _get_generation(request), name, str(common.get_thisyear())] + [str(v) for v in vary_on]
+    )
+    value = cache.get(key, _MISSING)
+    stats.record(hit=value is not _MISSING)
+    if value is _MISSING:
+        value = render()
+        cache.set(key, value, timeout=PAGE_CACHE_TIMEOUT)
+    return value
+
+
+def _get_generation(request) -> str:
+    # A page can have several cached fragments, so we store the generation on
+    # the request to avoid fetching it repeatedly.
+    if not hasattr(request, "_page_cache_generation"):
+        generation = cache.get(PAGE_CACHE_GENERATION_CACHE_KEY)
+        if generation is None:
+            cache.add(PAGE_CACHE_GENERATION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+            generation = cache.get(PAGE_CACHE_GENERATION_CACHE_KEY)
+        request._page_cache_generation = generation
+    return request._page_cache_generation
+
+
+def clear_page_cache():
+    cache.set(PAGE_CACHE_GENERATION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
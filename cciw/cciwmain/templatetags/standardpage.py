@@ -1,6 +1,7 @@
 from django import template
 
 from cciw.cciwmain.common import standard_subs
+from cciw.cciwmain.pagecache import get_or_render
 from cciw.sitecontent.models import HtmlChunk
 
 register = template.Library()
@@ -9,12 +10,48 @@ register.filter(standard_subs)
 
 @register.simple_tag(takes_context=True)
 def htmlchunk(context, name, ignore_missing=False):
-    try:
-        chunk = HtmlChunk.objects.get(name=name)
-    except HtmlChunk.DoesNotExist:
-        if not ignore_missing:
-            raise
-        chunk = None
-    if chunk is None:
-        return ""
-    return chunk.render(context["request"])
+    request = context["request"]
+
+    def render():
+        try:
+            chunk = HtmlChunk.objects.get(name=name)
+        except HtmlChunk.DoesNotExist:
+            if not ignore_missing:
+                raise
+            chunk = None
+        if chunk is None:
+            return ""
+        return chunk.render(request)
+
+    return get_or_render(request, "htmlchunk", [name], render)
+
+
+class PageCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        return get_or_render(context["request"], self.fragment_name, vary_on, lambda: self.nodelist.render(context))
+
+
+@register.tag
+def pagecache(parser, token):
+    """
+    Caches the enclosed content for anonymous users, using cciw.cciwmain.pagecache.
+
+    Usage:
+
+        {% pagecache "fragment_name" [var1] [var2] ... %}
+          ...
+        {% endpagecache %}
+    """
+    nodelist = parser.parse(("endpagecache",))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires at least 1 argument.")
+    fragment_name = bits[1].strip("\"'")
+    return PageCacheNode(nodelist, fragment_name, [parser.compile_filter(bit) for bit in bits[2:]])
@@ -1,7 +1,12 @@
+from datetime import date, timedelta
+
+import time_machine
 from django.urls import reverse
 
+from cciw.cciwmain import common, pagecache
 from cciw.cciwmain.models import Camp
 from cciw.cciwmain.tests.utils import FuzzyInt, init_query_caches
+from cciw.officers.tests import factories as officer_factories
 from cciw.sitecontent.models import HtmlChunk
 from cciw.utils.tests.base import TestBase
 
@@ -34,6 +39,34 @@ class CampModel(TestBase):
         assert camp_2.previous_camp == camp
 
 
+class GetThisyear(TestBase):
+    def test_no_camps(self):
+        assert common.get_thisyear() == date.today().year
+
+    def test_rollover(self):
+        camp = factories.create_camp(end_date=date.today() - timedelta(days=10))
+        assert common.get_thisyear() == camp.year
+        with time_machine.travel(date.today() + timedelta(days=25)):
+            assert common.get_thisyear() == camp.year + 1
+
+    def test_cached(self):
+        factories.create_camp()
+        common.get_thisyear()
+        with self.assertNumQueries(0):
+            common.get_thisyear()
+
+    def test_cleared_by_camp_changes(self):
+        camp = factories.create_camp(end_date=date.today() - timedelta(days=100))
+        assert common.get_thisyear() == camp.year + 1
+
+        camp.end_date = date.today()
+        camp.save()
+        assert common.get_thisyear() == camp.year
+
+        camp.delete()
+        assert common.get_thisyear() == date.today().year
+
+
 class ThisyearPage(TestBase):
     def setUp(self):
         super().setUp()
@@ -71,3 +104,63 @@ class DetailPage(TestBase):
         resp = self.client.get(reverse("cciw-cciwmain-camps_detail", kwargs=dict(year=camp.year, slug=camp.slug_name)))
         self.assertContains(resp, leader_name)
         self.assertContains(resp, camp.camp_name.name)
+
+
+class PageCaching(TestBase):
+    def setUp(self):
+        super().setUp()
+        HtmlChunk.objects.create(name="camp_dates_intro_text", html="<p>Intro text</p>")
+        HtmlChunk.objects.create(name="camp_dates_outro_text")
+        pagecache.stats.reset()
+
+    def test_cached_for_anonymous(self):
+        init_query_caches()
+        for i in range(0, 5):
+            factories.create_camp(leader=factories.get_any_camp_leader(), future=True)
+        url = reverse("cciw-cciwmain-thisyear")
+        self.client.get(url)
+        assert pagecache.stats.hits == 0
+        with self.assertNumQueries(0):
+            resp = self.client.get(url)
+        assert pagecache.stats.hits > 0
+        for c in Camp.objects.all():
+            self.assertContains(resp, c.get_absolute_url())
+
+    def test_not_cached_for_logged_in(self):
+        camp = factories.create_camp(future=True)
+        self.client.force_login(officer_factories.create_site_editor())
+        url = reverse("cciw-cciwmain-thisyear")
+        self.client.get(url)
+        resp = self.client.get(url)
+        assert pagecache.stats.hits == pagecache.stats.misses == 0
+        self.assertContains(resp, camp.get_absolute_url())
+        self.assertContains(resp, "Edit camp_dates_intro_text")
+
+    def test_invalidation(self):
+        camp = factories.create_camp(leader=factories.create_person(name="Joe Bloggs"), future=True)
+        new_leader = factories.create_person(name="Jane Doe")
+        detail_url = reverse("cciw-cciwmain-camps_detail", kwargs=dict(year=camp.year, slug=camp.slug_name))
+        thisyear_url = reverse("cciw-cciwmain-thisyear")
+        self.assertContains(self.client.get(detail_url), "Joe Bloggs")
+        self.assertContains(self.client.get(thisyear_url), "Intro text")
+
+        # Leader change
+        camp.leaders.set([new_leader])
+        self.assertContains(self.client.get(detail_url), "Jane Doe")
+
+        # Person change
+        person = camp.leaders.get()
+        person.name = "Jane Smith"
+        person.save()
+        self.assertContains(self.client.get(detail_url), "Jane Smith")
+
+        # Camp change
+        camp.special_info_html = "<p>Bring wellies</p>"
+        camp.save()
+        self.assertContains(self.client.get(detail_url), "Bring wellies")
+
+        # HtmlChunk change
+        chunk = HtmlChunk.objects.get(name="camp_dates_intro_text")
+        chunk.html = "<p>Changed intro text</p>"
+        chunk.save()
+        self.assertContains(self.client.get(thisyear_url), "Changed intro text")
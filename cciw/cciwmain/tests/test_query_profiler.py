@@ -0,0 +1,88 @@
+import io
+
+from django.core.management import call_command
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from cciw.cciwmain.tests import factories as camps_factories
+from cciw.db_debug import QueryInfo
+from cciw.officers.tests import factories as officers_factories
+from cciw.query_profiler import get_query_profiles, record_query_profile, reset_query_profiles
+from cciw.utils.tests.base import TestBase
+from cciw.utils.tests.webtest import WebTestBase
+
+
+def make_query(sql, duration=0.001):
+    return QueryInfo(sql=sql, params=(), many=False, stacktrace="", duration=duration)
+
+
+class TestQueryProfiler(TestBase):
+    def setUp(self):
+        super().setUp()
+        reset_query_profiles()
+
+    def test_record(self):
+        n_plus_one = "SELECT * FROM camp WHERE id = %s"
+        record_query_profile("view-a", [make_query("SELECT 1")] + [make_query(n_plus_one)] * 5)
+        record_query_profile("view-a", [make_query("SELECT 1")] + [make_query(n_plus_one)] * 3)
+        record_query_profile("view-b", [make_query("SELECT 1"), make_query("SELECT 2")])
+
+        profile_a, profile_b = get_query_profiles()
+        assert profile_a.url_name == "view-a"
+        assert profile_a.requests == 2
+        assert profile_a.queries == 10
+        assert profile_a.duplicates == 6
+        assert profile_a.mean_duplicates == 3
+        assert profile_a.max_queries == 6
+        assert [(g.sql, g.count) for g in profile_a.duplicate_groups] == [(n_plus_one, 5)]
+        assert round(profile_a.db_time, 6) == 0.01
+
+        assert profile_b.url_name == "view-b"
+        assert profile_b.duplicates == 0
+        assert profile_b.duplicate_groups == []
+
+        assert [p.url_name for p in get_query_profiles(order_by="queries")] == ["view-a", "view-b"]
+
+        reset_query_profiles()
+        assert get_query_profiles() == []
+
+    def test_middleware_sampling(self):
+        camps_factories.create_camp()
+        url = reverse("cciw-cciwmain-camps_index")
+        with override_settings(QUERY_PROFILER_SAMPLE_RATE=1):
+            self.client.get(url)
+        with override_settings(QUERY_PROFILER_SAMPLE_RATE=0):
+            self.client.get(url)
+        profiles = {p.url_name: p for p in get_query_profiles()}
+        assert profiles["cciw-cciwmain-camps_index"].requests == 1
+        assert profiles["cciw-cciwmain-camps_index"].queries > 0
+        assert list(profiles) == ["cciw-cciwmain-camps_index"]
+
+    def test_command(self):
+        record_query_profile("view-a", [make_query("SELECT 1")] * 2)
+        out = io.StringIO()
+        call_command("query_profile", "--detailed", stdout=out)
+        output = out.getvalue()
+        assert "view-a" in output
+        assert "2 times" in output
+
+        call_command("query_profile", "--reset", stdout=out)
+        assert get_query_profiles() == []
+
+
+class TestQueryProfilePage(WebTestBase):
+    def setUp(self):
+        super().setUp()
+        reset_query_profiles()
+
+    def test_page(self):
+        record_query_profile("view-a", [make_query("SELECT 1")] * 2)
+        self.shortcut_login(officers_factories.create_webmaster())
+        self.get_url("cciw-officers-query_profile")
+        self.assertTextPresent("view-a")
+        self.submit("[type=submit]")
+        self.assertTextPresent("No requests have been recorded")
+
+    def test_webmaster_only(self):
+        self.shortcut_login(officers_factories.create_officer())
+        self.get_literal_url(reverse("cciw-officers-query_profile"), expect_errors=[403])
@@ -0,0 +1,77 @@
+from datetime import date, datetime, timedelta, timezone
+
+import openpyxl
+
+from cciw.utils import xl
+from cciw.utils.spreadsheet import ExcelSimpleBuilder
+
+
+def _build(rows):
+    builder = ExcelSimpleBuilder()
+    builder.add_sheet_with_header_row("Data", ["Name", "Date", "Notes", "Link"], (row for row in rows))
+    return xl.workbook_from_bytes(builder.to_bytes())
+
+
+def test_cell_formatting():
+    wkbk = _build(
+        [
+            ["Joe", date(2020, 1, 2), "Line 1\r\nLine 2\nLine 3", "https://www.example.com/"],
+            ["Jane", datetime(2020, 6, 1, 12, 30, tzinfo=timezone(timedelta(hours=1))), "", None],
+        ]
+    )
+    wksh = wkbk["Data"]
+
+    # Header
+    assert [c.value for c in wksh[1]] == ["Name", "Date", "Notes", "Link"]
+    assert wksh.cell(1, 1).font == xl.header_font
+    assert wksh.cell(1, 1).border == xl.border
+
+    # Normal
+    name = wksh.cell(2, 1)
+    assert name.value == "Joe"
+    assert name.font == xl.default_font
+    assert name.border == xl.border
+    assert name.alignment == xl.alignment
+
+    # Dates
+    assert wksh.cell(2, 2).value == datetime(2020, 1, 2)
+    assert wksh.cell(2, 2).number_format == xl.date_format
+    assert wksh.cell(3, 2).value == datetime(2020, 6, 1, 11, 30)  # Converted to UTC
+    assert wksh.cell(3, 2).number_format == xl.date_format
+
+    # Multiline
+    notes = wksh.cell(2, 3)
+    assert notes.value == "Line 1\nLine 2\nLine 3"
+    assert notes.alignment == xl.wrapped_alignment
+    assert wksh.row_dimensions[2].height == xl.font_size * 3
+    assert wksh.row_dimensions[3].height is None
+
+    # URLs
+    link = wksh.cell(2, 4)
+    assert link.value == '=HYPERLINK("https://www.example.com/"; "https://www.example.com/")'
+    assert link.font == xl.url_font
+    assert wksh.cell(3, 4).value is None
+
+
+def test_notice_sheet():
+    builder = ExcelSimpleBuilder()
+    builder.add_sheet_with_header_row("Data", ["Name"], [["Joe"]])
+    builder.add_notice_sheet("Notice:", ["Line 1", "Line 2"])
+    wkbk: openpyxl.Workbook = xl.workbook_from_bytes(builder.to_bytes())
+    assert wkbk.sheetnames == ["Notice", "Data"]
+    notice = wkbk["Notice"]
+    assert [[c.value for c in row] for row in notice.rows] == [["Notice:"], [None], ["Line 1"], ["Line 2"]]
+    assert notice.cell(1, 1).font == xl.header_font
+    assert notice.column_dimensions["A"].width == 100
+
+
+def test_to_bytes_repeated():
+    builder = ExcelSimpleBuilder()
+    builder.add_sheet_with_header_row("Data", ["Name"], [["Joe"]])
+    assert builder.to_bytes() == builder.to_bytes()
+
+
+def test_named_styles():
+    wkbk = _build([["Joe", None, "", ""]] * 100)
+    # All cells use a few named styles, rather than having styles of their own
+    assert {c.style for row in wkbk["Data"].iter_rows(min_row=2) for c in row} == {xl.DEFAULT_STYLE}
@@ -8,6 +8,7 @@ from django.utils.html import format_html
 
 from cciw.cciwmain import common
 from cciw.cciwmain.models import Camp
+from cciw.cciwmain.pagecache import get_or_render
 
 
 def index(request, year: int | None = None):
@@ -17,7 +18,8 @@ def index(request, year: int | None = None):
     camps = Camp.objects.order_by("-year", "start_date")
     if year is not None:
         camps = camps.filter(year=year)
-        if len(camps) == 0:
+        # The camp list itself is only needed if the page isn't cached:
+        if not camps.exists():
             raise Http404
 
     return TemplateResponse(
@@ -44,7 +46,10 @@ def detail(request, year: int, slug: str):
         {
             "camp": camp,
             "title": camp.nice_name + camp.bracketted_old_name,
-            "is_booking_open": is_booking_open(camp.year),
+            # Callable, so it is only evaluated if needed:
+            "is_booking_open": lambda: get_or_render(
+                request, "is_booking_open", [camp.year], lambda: is_booking_open(camp.year)
+            ),
             "today": date.today(),
             "breadcrumb": common.create_breadcrumb(
                 [format_html('<a href="{0}">See all camps</a>', reverse("cciw-cciwmain-camps_index"))]
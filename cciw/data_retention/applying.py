@@ -37,7 +37,7 @@ from cciw.bookings.models import (
     SupportingInformationDocument,
 )
 from cciw.contact_us.models import Message
-from cciw.officers.models import Application
+from cciw.officers.models import Application, ExportDocument, ExportJob
 
 from .datatypes import ErasureMethod, ForeverType, Group, ModelDetail
 
@@ -378,6 +378,8 @@ NOT_IN_USE_METHODS = {
     User: lambda now: User.objects.not_in_use(now),
     SupportingInformation: lambda now: SupportingInformation.objects.not_in_use(now),
     SupportingInformationDocument: lambda now: SupportingInformationDocument.objects.not_in_use(now),
+    ExportJob: lambda now: ExportJob.objects.not_in_use(now),
+    ExportDocument: lambda now: ExportDocument.objects.not_in_use(now),
     # 3rd party models: (that's why they don't have their own `not_in_use()` QuerySet method)
     #
     # If a message hasn't been sent for more than a month of being on the queue, assume
@@ -397,6 +399,8 @@ OLDER_THAN_METHODS = {
     User: lambda qs, before_datetime: qs.older_than(before_datetime),
     SupportingInformation: lambda qs, before_datetime: qs.older_than(before_datetime),
     SupportingInformationDocument: lambda qs, before_datetime: qs.older_than(before_datetime),
+    ExportJob: lambda qs, before_datetime: qs.older_than(before_datetime),
+    ExportDocument: lambda qs, before_datetime: qs.older_than(before_datetime),
     # 3rd party:
     mailer_models.Message: lambda qs, before_datetime: qs.filter(when_added__lt=before_datetime),
     mailer_models.MessageLog: lambda qs, before_datetime: qs.filter(when_added__lt=before_datetime),
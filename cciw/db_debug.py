@@ -81,7 +81,10 @@ def db_debug_middleware(get_response):
 
 
 class QueryRecorder:
-    def __init__(self):
+    def __init__(self, *, stacktraces=True):
+        # Formatting stacktraces is by far the most expensive part of recording,
+        # so can be turned off (queries are then grouped by SQL only).
+        self.stacktraces = stacktraces
         self.queries: list[QueryInfo] = []
 
     def __call__(self, execute, sql, params, many, context):
@@ -89,7 +92,7 @@ class QueryRecorder:
             sql=sql,
             params=params,
             many=many,
-            stacktrace=fancy_format_stack(sys._getframe(1)),
+            stacktrace=fancy_format_stack(sys._getframe(1)) if self.stacktraces else "",
             original_order=len(self.queries),
         )
         start = time.time()
@@ -42,6 +42,11 @@ from django.utils.html import format_html
 #   that is storing data, just text reference.
 
 
+# Documents are streamed from the database in chunks of this size, so that large
+# ones are not loaded into memory all at once:
+DOCUMENT_CHUNK_SIZE = 1024 * 1024
+
+
 class DocumentQuerySet(models.QuerySet):
     def older_than(self, before_datetime):
         return self.filter(created_at__lt=before_datetime)
@@ -134,6 +139,31 @@ class Document(models.Model):
         self.size = len(self.content)
         super().save(**kwargs)
 
+    def iter_content(self, start: int = 0, end: int = None, *, chunk_size: int = DOCUMENT_CHUNK_SIZE):
+        """
+        Yields the content, or the bytes from `start` up to (not including)
+        `end`, in chunks that are each read from the database separately.
+        """
+        if end is None:
+            end = self.size
+        documents = self.__class__._base_manager.filter(id=self.id)
+        for offset in range(start, end, chunk_size):
+            chunk = (
+                documents.annotate(
+                    # SUBSTR counts from 1
+                    chunk=models.Func(
+                        "content",
+                        models.Value(offset + 1),
+                        models.Value(min(chunk_size, end - offset)),
+                        function="SUBSTR",
+                        output_field=models.BinaryField(),
+                    )
+                )
+                .values_list("chunk", flat=True)
+                .get()
+            )
+            yield bytes(chunk)
+
 
 class DocumentModelFile(File):
     """
@@ -1,8 +1,15 @@
 from django.apps import apps
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.regex_helper import _lazy_re_compile
 
 from .models import Document
 
+# We only support a single range, which is all that browsers and download
+# managers use for resuming or seeking. Anything else gets the whole document.
+RANGE_RE = _lazy_re_compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$")
+
 
 def not_found():
     return Http404("Document not found, or insufficient privileges to view it.")
@@ -23,8 +30,75 @@ def download(request, app_label: str, model_name: str, id: int):
 
     obj = model.objects.get(id=id)
 
-    return HttpResponse(
-        content=obj.content,
-        content_type=obj.mimetype,
-        headers={"Content-Length": obj.size, "Content-Disposition": f'attachment; filename="{obj.filename}"'},
-    )
+    return document_response(request, obj)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def document_response(request, document: Document):
+    """
+    Returns a response that streams the content of a Document from the
+    database, with support for conditional GET and byte ranges.
+    """
+    # Documents are never changed once saved.
+    etag = f'"{document.id}-{document.created_at.timestamp():.6f}-{document.size}"'
+    last_modified = int(document.created_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        try:
+            byte_range = get_byte_range(request, size=document.size, etag=etag, last_modified=last_modified)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416, headers={"Content-Range": f"bytes */{document.size}"})
+        else:
+            if byte_range is None:
+                start, end = 0, document.size
+                response = StreamingHttpResponse(document.iter_content(start, end))
+            else:
+                start, end = byte_range
+                response = StreamingHttpResponse(document.iter_content(start, end), status=206)
+                response["Content-Range"] = f"bytes {start}-{end - 1}/{document.size}"
+            response["Content-Type"] = document.mimetype
+            response["Content-Length"] = end - start
+            response["Content-Disposition"] = f'attachment; filename="{document.filename}"'
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # Browsers may keep a copy, but must check with us (and our permission
+    # checks) before using it.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def get_byte_range(request, *, size: int, etag: str, last_modified: int) -> tuple[int, int] | None:
+    """
+    Returns the (start, end) of the bytes requested by a Range header, with
+    `end` exclusive, or None if the whole document should be sent.
+    Raises RangeNotSatisfiable if the range is outside the document.
+    """
+    range_header = request.META.get("HTTP_RANGE")
+    if not range_header:
+        return None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        # The client's copy is out of date, so it needs the whole document.
+        return None
+    match = RANGE_RE.match(range_header)
+    if not match:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            # Invalid, so ignored
+            return None
+        end = min(int(last) + 1, size) if last else size
+    elif last:
+        # Suffix range, e.g. 'bytes=-500' for the last 500 bytes
+        start, end = max(size - int(last), 0), size
+    else:
+        return None
+    if start >= end:
+        raise RangeNotSatisfiable()
+    return start, end
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+
+from cciw.accounts.models import Role
+from cciw.cciwmain.models import Camp, CampName
+from cciw.utils.cache import clear_cache_now_and_on_commit
+
+
+def email_lists_changed(sender, **kwargs):
+    from .lists import clear_list_index_cache
+
+    clear_cache_now_and_on_commit(clear_list_index_cache)
+
+
+# Email lists are generated from roles and camps (see cciw.mail.lists):
+post_save.connect(email_lists_changed, sender=Role)
+post_delete.connect(email_lists_changed, sender=Role)
+post_save.connect(email_lists_changed, sender=Camp)
+post_delete.connect(email_lists_changed, sender=Camp)
+post_save.connect(email_lists_changed, sender=CampName)
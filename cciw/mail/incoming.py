@@ -0,0 +1,165 @@
+"""
+Queue and worker for handling incoming mail.
+
+SES notifies us of incoming mail (see cciw.mail.views), and we add the message
+id to the IncomingMail table, which also dedupes repeated notifications. A long
+running worker process (`manage.py run_incoming_mail_worker`, managed by
+supervisor) handles the messages using a fixed pool of threads, each of which
+claims messages using SELECT ... FOR UPDATE SKIP LOCKED, so that they can work
+concurrently without handling the same message twice.
+
+The worker is woken by NOTIFY when a message is added, and also polls every
+INCOMING_MAIL_POLL_INTERVAL. See cciw.utils.worker
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import attr
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from cciw.utils.worker import run_worker
+
+from .lists import handle_mail_from_s3
+from .models import INCOMING_MAIL_CHANNEL, IncomingMail, IncomingMailState
+
+logger = logging.getLogger(__name__)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class IncomingMailQueueMetrics:
+    pending: int
+    processing: int
+    oldest_pending_age: timedelta | None
+    # For messages finished within the window:
+    window: timedelta
+    processed: int
+    failed: int
+    mean_latency: timedelta | None
+    max_latency: timedelta | None
+
+    def as_rows(self) -> list[tuple[str, object]]:
+        return [
+            ("Pending", self.pending),
+            ("Processing", self.processing),
+            ("Oldest pending", _format_duration(self.oldest_pending_age)),
+            (f"Processed (last {_format_duration(self.window)})", self.processed),
+            (f"Failed (last {_format_duration(self.window)})", self.failed),
+            ("Mean latency", _format_duration(self.mean_latency)),
+            ("Max latency", _format_duration(self.max_latency)),
+        ]
+
+
+def _format_duration(value: timedelta | None) -> str:
+    if value is None:
+        return "-"
+    return f"{value.total_seconds():.1f}s"
+
+
+def get_incoming_mail_queue_metrics(now: datetime = None, *, window: timedelta = timedelta(hours=1)):
+    if now is None:
+        now = timezone.now()
+    recent = models.Q(finished_at__gte=now - window)
+    latency = models.ExpressionWrapper(
+        models.F("finished_at") - models.F("received_at"), output_field=models.DurationField()
+    )
+    values = IncomingMail.objects.aggregate(
+        pending=models.Count("id", filter=models.Q(state=IncomingMailState.PENDING)),
+        processing=models.Count("id", filter=models.Q(state=IncomingMailState.PROCESSING)),
+        oldest_pending=models.Min("received_at", filter=models.Q(state=IncomingMailState.PENDING)),
+        processed=models.Count("id", filter=recent),
+        failed=models.Count("id", filter=recent & models.Q(state=IncomingMailState.FAILED)),
+        mean_latency=models.Avg(latency, filter=recent),
+        max_latency=models.Max(latency, filter=recent),
+    )
+    oldest_pending = values.pop("oldest_pending")
+    return IncomingMailQueueMetrics(
+        oldest_pending_age=None if oldest_pending is None else now - oldest_pending,
+        window=window,
+        **values,
+    )
+
+
+def log_incoming_mail_queue_metrics() -> None:
+    metrics = get_incoming_mail_queue_metrics()
+    logger.info("Incoming mail queue: %s", ", ".join(f"{name}: {value}" for name, value in metrics.as_rows()))
+
+
+# --- Processing ---
+
+
+def claim_incoming_mail(limit: int, *, now: datetime = None) -> list[int]:
+    """
+    Claims up to `limit` messages for processing by this worker, returning their ids.
+    """
+    if now is None:
+        now = timezone.now()
+    ready = IncomingMail.objects.ready(now, processing_timeout=settings.INCOMING_MAIL_PROCESSING_TIMEOUT)
+    with transaction.atomic():
+        # Messages whose worker died too many times are probably causing the
+        # problem, so we give up on them:
+        ready.filter(attempts__gte=settings.INCOMING_MAIL_MAX_ATTEMPTS).update(
+            state=IncomingMailState.FAILED, finished_at=now, error="Processing did not complete"
+        )
+        ids = list(
+            ready.filter(attempts__lt=settings.INCOMING_MAIL_MAX_ATTEMPTS)
+            .order_by("received_at")
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)[:limit]
+        )
+        if ids:
+            IncomingMail.objects.filter(id__in=ids).update(
+                state=IncomingMailState.PROCESSING, started_at=now, attempts=models.F("attempts") + 1
+            )
+    return ids
+
+
+def process_incoming_mail(incoming_mail_id: int) -> None:
+    incoming_mail = IncomingMail.objects.get(id=incoming_mail_id)
+    try:
+        handle_mail_from_s3(incoming_mail.message_id)
+    except Exception as e:
+        # Sending may have partially succeeded, so we don't retry, which could
+        # send duplicates. The exception goes to Sentry via logging.
+        logger.exception("Error handling incoming mail %s", incoming_mail.message_id)
+        state, error = IncomingMailState.FAILED, type(e).__name__
+    else:
+        state, error = IncomingMailState.DONE, ""
+    IncomingMail.objects.filter(id=incoming_mail_id).update(state=state, error=error, finished_at=timezone.now())
+
+
+def process_next_incoming_mail() -> bool:
+    """
+    Processes the next message on the queue, returning False if there wasn't one.
+    """
+    ids = claim_incoming_mail(1)
+    for incoming_mail_id in ids:
+        process_incoming_mail(incoming_mail_id)
+    return bool(ids)
+
+
+def delete_old_incoming_mail(now: datetime) -> None:
+    IncomingMail.objects.filter(state__in=[IncomingMailState.DONE, IncomingMailState.FAILED]).older_than(
+        now - settings.INCOMING_MAIL_KEEP_FOR
+    ).delete()
+
+
+# --- Worker ---
+
+
+def run_incoming_mail_worker(*, threads: int, stop: threading.Event) -> None:
+    """
+    Runs the incoming mail worker until `stop` is set.
+    """
+    run_worker(
+        name="Incoming mail",
+        channel=INCOMING_MAIL_CHANNEL,
+        process_next=process_next_incoming_mail,
+        threads=threads,
+        poll_interval=settings.INCOMING_MAIL_POLL_INTERVAL,
+        stop=stop,
+        periodic=log_incoming_mail_queue_metrics,
+        periodic_interval=settings.INCOMING_MAIL_METRICS_INTERVAL,
+    )
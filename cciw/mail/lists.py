@@ -7,16 +7,14 @@
 
 import email
 import email.policy
-import fcntl
 import itertools
 import logging
-import os
 import re
-import tempfile
 from collections.abc import Callable, Iterable, Iterator
 
 import attr
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import make_msgid, send_mail
 from django.utils.encoding import force_bytes
 
@@ -35,8 +33,9 @@ from cciw.officers.email_utils import formatted_email
 from cciw.officers.models import Application
 from cciw.officers.utils import camp_officer_list, camp_slacker_list
 
+from .models import IncomingMail
 from .ses import download_ses_message_from_s3
-from .smtp import send_mime_message
+from .smtp import send_mime_messages
 
 logger = logging.getLogger(__name__)
 
@@ -52,14 +51,22 @@ logger = logging.getLogger(__name__)
 #  - with methods to check whether an incoming email matches the list and can
 #    send to it.
 #
+# EmailListFactory
+#  - a lightweight reference to an EmailList, which can be stored in the cache,
+#    and used to create the EmailList when needed.
+#
 # generators:
 #
-# - A callable object that will generate a sequence of EmailList objects. It is
-#   needed because the groups that exist depend on an unknown number of records
-#   from the DB.
+# - A callable object that will generate a sequence of EmailListFactory
+#   objects. It is needed because the groups that exist depend on an unknown
+#   number of records from the DB.
 #
 #   We pass 'current_camps' into these generators as an optimization to
 #   stop them having to do lots of the same DB queries over and over.
+#
+# For routing incoming mail, we use an index from local address to
+# EmailListFactory, which is cached and cleared when the records it is built
+# from change (see hooks), so that we only need to create the matching list.
 
 
 @attr.s(auto_attribs=True)
@@ -95,20 +102,75 @@ class EmailList:
         return True
 
 
+@attr.s(auto_attribs=True, frozen=True)
+class EmailListFactory:
+    local_address: str
+    # Must be a module level function, so that we can be pickled:
+    make_list: Callable[..., EmailList]
+    args: tuple
+
+    def __call__(self) -> EmailList:
+        return self.make_list(*self.args)
+
+
+def list_factory(make_list: Callable[..., EmailList], *args) -> EmailListFactory:
+    # Creating an EmailList doesn't do any queries, so we can do it
+    # to get the address.
+    return EmailListFactory(local_address=make_list(*args).local_address, make_list=make_list, args=args)
+
+
 # Externally used functions:
 def find_list(address, from_addr) -> EmailList:
-    for email_list in get_all_lists():
-        if email_list.matches(address, from_addr):
-            return email_list
-    raise NoSuchList()
+    local_address, _, domain = address.rpartition("@")
+    if domain != settings.INCOMING_MAIL_DOMAIN:
+        raise NoSuchList()
+    factory = get_list_index().get(local_address)
+    if factory is None:
+        raise NoSuchList()
+    email_list = factory()
+    if not email_list.matches(address, from_addr):
+        raise NoSuchList()
+    return email_list
 
 
 def get_all_lists() -> Iterator[EmailList]:
+    for factory in get_all_list_factories():
+        yield factory()
+
+
+def get_all_list_factories() -> Iterator[EmailListFactory]:
     current_camps = Camp.objects.all().filter(year__gte=common.get_thisyear() - 1)
     for generator in GENERATORS:
         yield from generator(current_camps)
 
 
+LIST_INDEX_CACHE_KEY = "cciw.mail.list_index"
+
+
+def get_list_index() -> dict[str, EmailListFactory]:
+    """
+    Returns a dictionary of local address to EmailListFactory, for all lists.
+    """
+    # The lists depend on the current year, so we store that with the index.
+    thisyear = common.get_thisyear()
+    cached = cache.get(LIST_INDEX_CACHE_KEY)
+    if cached is not None:
+        index_year, index = cached
+        if index_year == thisyear:
+            return index
+
+    index = {}
+    for factory in get_all_list_factories():
+        # If there are duplicates, the first one wins, as with get_all_lists()
+        index.setdefault(factory.local_address, factory)
+    cache.set(LIST_INDEX_CACHE_KEY, (thisyear, index), timeout=None)
+    return index
+
+
+def clear_list_index_cache():
+    cache.delete(LIST_INDEX_CACHE_KEY)
+
+
 def address_for_camp_officers(camp: Camp) -> str:
     return make_camp_officers_list(camp).address
 
@@ -143,9 +205,9 @@ class MailAccessDenied(ValueError):
 # Definitions of EmailLists
 
 
-def camp_officers_list_generator(current_camps: list[Camp]):
+def camp_officers_list_generator(current_camps: list[Camp]) -> Iterator[EmailListFactory]:
     for camp in current_camps:
-        yield make_camp_officers_list(camp)
+        yield list_factory(make_camp_officers_list, camp)
 
 
 def make_camp_officers_list(camp) -> EmailList:
@@ -163,9 +225,9 @@ def make_camp_officers_list(camp) -> EmailList:
     )
 
 
-def camp_slackers_list_generator(current_camps):
+def camp_slackers_list_generator(current_camps: list[Camp]) -> Iterator[EmailListFactory]:
     for camp in current_camps:
-        yield make_camp_slackers_list(camp)
+        yield list_factory(make_camp_slackers_list, camp)
 
 
 def make_camp_slackers_list(camp):
@@ -183,9 +245,9 @@ def make_camp_slackers_list(camp):
     )
 
 
-def camp_leaders_list_generator(current_camps):
+def camp_leaders_list_generator(current_camps: list[Camp]) -> Iterator[EmailListFactory]:
     for camp in current_camps:
-        yield make_camp_leaders_list(camp)
+        yield list_factory(make_camp_leaders_list, camp)
 
 
 def make_camp_leaders_list(camp):
@@ -203,11 +265,11 @@ def make_camp_leaders_list(camp):
     )
 
 
-def camp_leaders_for_year_list_generator(current_camps: list[Camp]) -> Iterator[EmailList]:
+def camp_leaders_for_year_list_generator(current_camps: list[Camp]) -> Iterator[EmailListFactory]:
     get_year = lambda camp: camp.year
     for year, camps in itertools.groupby(sorted(current_camps, key=get_year), key=get_year):
         camps2 = list(camps)
-        yield make_camp_leaders_for_year_list(year, camps2)
+        yield list_factory(make_camp_leaders_for_year_list, year, camps2)
 
 
 def make_camp_leaders_for_year_list(year, camps) -> EmailList:
@@ -228,26 +290,29 @@ def make_camp_leaders_for_year_list(year, camps) -> EmailList:
     )
 
 
-def roles_list_generator(current_camps):
+def roles_list_generator(current_camps: list[Camp]) -> Iterator[EmailListFactory]:
     for role in Role.objects.with_address():
         local_address, domain = role.email.rsplit("@", 1)
         if domain != settings.INCOMING_MAIL_DOMAIN:
             continue
+        yield list_factory(make_role_list, role)
 
-        def has_permission(email_address, role=role):
-            if role.allow_emails_from_public:
-                return True
-            else:
-                return get_role_email_recipients(role.name).filter(
-                    email__iexact=email_address
-                ).exists() or is_superuser(email_address)
-
-        yield EmailList(
-            local_address=local_address,
-            get_members=lambda role=role: role.email_recipients.all(),
-            has_permission=has_permission,
-            list_reply=not role.allow_emails_from_public,
-        )
+
+def make_role_list(role) -> EmailList:
+    def has_permission(email_address):
+        if role.allow_emails_from_public:
+            return True
+        else:
+            return get_role_email_recipients(role.name).filter(email__iexact=email_address).exists() or is_superuser(
+                email_address
+            )
+
+    return EmailList(
+        local_address=role.email.rsplit("@", 1)[0],
+        get_members=lambda: role.email_recipients.all(),
+        has_permission=has_permission,
+        list_reply=not role.allow_emails_from_public,
+    )
 
 
 GENERATORS = [
@@ -381,36 +446,42 @@ def forward_email_to_list(mail, email_list: EmailList):
     # we reduce the possibility of having sent some of the emails
     # but not others.
 
+    # The message is the same for every recipient apart from the headers
+    # below, so we serialise it once and add those per recipient.
+    for header in ["To", "Message-ID"]:
+        del mail[header]
+    try:
+        mail_as_bytes = force_bytes(mail.as_string())
+    except UnicodeEncodeError:
+        # Can happen for bad mail, usually spammers
+        return
+    from_address = mail["From"]
+
     messages_to_send = []
     for user in email_list.get_members():
         addr = formatted_email(user)
-        _set_mail_header(mail, "To", addr)
-        # Need new message ID, or some mail servers will only send one
-        _set_mail_header(mail, "Message-ID", make_msgid())
         try:
-            mail_as_bytes = force_bytes(mail.as_string())
+            recipient_headers = force_bytes(
+                _fold_mail_header(mail, "To", addr)
+                # Need new message ID, or some mail servers will only send one
+                + _fold_mail_header(mail, "Message-ID", make_msgid())
+            )
         except UnicodeEncodeError:
-            # Can happen for bad mail, usually spammers
             continue
-        from_address = mail["From"]
-        messages_to_send.append((addr, from_address, mail_as_bytes))
+        messages_to_send.append((addr, from_address, recipient_headers + mail_as_bytes))
 
     if len(messages_to_send) == 0:
         return
 
-    errors = []
-    for to_addr, from_address, mail_as_bytes in messages_to_send:
-        try:
-            logger.info(
-                "Forwarding msg %s from %s to email list %s address %s",
-                orig_msg_id,
-                orig_from_addr,
-                email_list.address,
-                to_addr,
-            )
-            send_mime_message(to_addr, from_address, mail_as_bytes)
-        except Exception as e:
-            errors.append((addr, e))
+    for to_addr, _, _ in messages_to_send:
+        logger.info(
+            "Forwarding msg %s from %s to email list %s address %s",
+            orig_msg_id,
+            orig_from_addr,
+            email_list.address,
+            to_addr,
+        )
+    errors = send_mime_messages(messages_to_send)
 
     if len(errors) == len(messages_to_send):
         # Probably a temporary network error, but possibly something more
@@ -443,50 +514,28 @@ There were problems with the following addresses:
         )
 
 
+def _fold_mail_header(mail, header, value):
+    """
+    Returns the header as it would be serialised in the email
+    """
+    return mail.policy.fold(*mail.policy.header_store_parse(header, value))
+
+
 def mangle_from_address(address):
     address = address.replace("@", "(at)").replace("<", "").replace(">", "").replace('"', "")
     address = f'"{address}" <noreply@cciw.co.uk>'
     return address
 
 
-INCOMING_MAIL_TEMPFILE_PREFIX = "mail-incoming-"
-
-
 def handle_mail_from_s3_async(message_id):
-    manage_py_path = os.path.join(settings.PROJECT_ROOT, "manage.py")
-    # Poor man's async - use spawnlp which returns instantly.
-    # Indirectly calls handle_mail_from_s3 below.
-    os.spawnlp(os.P_NOWAIT, "nohup", "nohup", manage_py_path, "handle_message", message_id)
+    # Adds to the queue for the incoming mail worker, which calls
+    # handle_mail_from_s3 below. See cciw.mail.incoming
+    IncomingMail.objects.enqueue(message_id)
 
 
 def handle_mail_from_s3(message_id):
-    # There is the possibility of this getting called multiple times with the
-    # same message_id, perhaps due to our endpoint not returning quickly enough
-    # to SNS, triggering a timeout and re-attempt. So, we dedupe using a
-    # filesystem based lock.
-
-    filename = tempfile.gettempdir() + "/" + INCOMING_MAIL_TEMPFILE_PREFIX + message_id
-    if os.path.exists(filename):
-        logger.info("Aborting mail handling, file %s already exists", filename)
-        return
-
-    # We have a potential race condition between checking for the file existing
-    # above, and opening it below. So after opening it we do a lock as well.
-    with open(filename, "wb") as f:
-        try:
-            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
-        except BlockingIOError:
-            logger.info("Aborting mail handling, lock on file %s already exists", filename)
-            return
-
-        data = download_ses_message_from_s3(message_id)
-        # We don't technically need to write the data here, but it helps
-        # debugging later.
-        f.write(data)
-        handle_mail(data)
-
-    # We leave the file behind (to be cleaned by a cron job), so that later
-    # calls with the same message_id will see the file already exists and abort.
+    data = download_ses_message_from_s3(message_id)
+    handle_mail(data)
 
 
 def handle_mail(data):
@@ -1,12 +1,17 @@
 from django.core.management.base import BaseCommand
 
-from cciw.mail.lists import handle_mail_from_s3
+from cciw.mail.models import IncomingMail
 
 
 class Command(BaseCommand):
+    help = "Add an incoming message, stored in S3, to the queue for the incoming mail worker"
+
     def add_arguments(self, parser):
         # Positional arguments
         parser.add_argument("message_id", type=str)
 
     def handle(self, message_id, **options):
-        handle_mail_from_s3(message_id)
+        if IncomingMail.objects.enqueue(message_id):
+            self.stdout.write(f"Queued {message_id}")
+        else:
+            self.stdout.write(f"{message_id} has already been queued")
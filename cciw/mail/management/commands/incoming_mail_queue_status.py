@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from cciw.mail.incoming import get_incoming_mail_queue_metrics
+
+
+class Command(BaseCommand):
+    help = "Show the depth and latency of the incoming mail queue"
+
+    def handle(self, *args, **options):
+        for name, value in get_incoming_mail_queue_metrics().as_rows():
+            self.stdout.write(f"{name + ':':<30} {value}")
@@ -0,0 +1,24 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cciw.mail.incoming import run_incoming_mail_worker
+
+
+class Command(BaseCommand):
+    help = "Run the worker that handles incoming mail. See cciw.mail.incoming"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=settings.INCOMING_MAIL_WORKER_THREADS)
+
+    def handle(self, *args, threads, **options):
+        stop = threading.Event()
+
+        def stop_handler(signum, frame):
+            stop.set()
+
+        signal.signal(signal.SIGTERM, stop_handler)
+        signal.signal(signal.SIGINT, stop_handler)
+        run_incoming_mail_worker(threads=threads, stop=stop)
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.3 on 2026-10-18 23:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("mail", "0001_initial_squashed_0007_delete_emailforward"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IncomingMail",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("message_id", models.CharField(max_length=255, unique=True)),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("processing", "Processing"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("received_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("started_at", models.DateTimeField(blank=True, default=None, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, default=None, null=True)),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("error", models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                "verbose_name_plural": "incoming mail",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("state__in", ["pending", "processing"])),
+                        fields=["received_at"],
+                        name="mail_incomingmail_queue_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+from django.db import models
+from django.db.models import TextChoices
+from django.utils import timezone
+
+from cciw.utils.worker import notify
+
+# Channel for NOTIFY, so that the worker can pick up new mail without waiting
+# for the next poll. See cciw.mail.incoming
+INCOMING_MAIL_CHANNEL = "cciw_incoming_mail"
+
+
+class IncomingMailState(TextChoices):
+    PENDING = "pending", "Pending"
+    PROCESSING = "processing", "Processing"
+    DONE = "done", "Done"
+    FAILED = "failed", "Failed"
+
+
+class IncomingMailQuerySet(models.QuerySet):
+    def enqueue(self, message_id: str) -> bool:
+        """
+        Adds an incoming message to the queue, returning False if it was
+        already there.
+        """
+        # We can get the same message_id multiple times, perhaps due to our
+        # endpoint not returning quickly enough to SNS, triggering a timeout and
+        # re-attempt. The unique constraint on message_id dedupes these.
+        _, created = self.get_or_create(message_id=message_id)
+        if created:
+            notify(INCOMING_MAIL_CHANNEL, message_id)
+        return created
+
+    def ready(self, now: datetime, *, processing_timeout: timedelta):
+        """
+        Messages that are waiting to be processed, including those that were
+        being processed by a worker that died.
+        """
+        return self.filter(
+            models.Q(state=IncomingMailState.PENDING)
+            | models.Q(state=IncomingMailState.PROCESSING, started_at__lt=now - processing_timeout)
+        )
+
+    def older_than(self, before_datetime: datetime):
+        return self.filter(received_at__lt=before_datetime)
+
+
+class IncomingMailManager(models.Manager.from_queryset(IncomingMailQuerySet)):
+    pass
+
+
+class IncomingMail(models.Model):
+    """
+    Queue of incoming mail to handle, populated from SES notifications.
+    See cciw.mail.incoming
+    """
+
+    message_id = models.CharField(max_length=255, unique=True)
+    state = models.CharField(max_length=20, choices=IncomingMailState.choices, default=IncomingMailState.PENDING)
+    received_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True, default=None)
+    finished_at = models.DateTimeField(null=True, blank=True, default=None)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True)
+
+    objects = IncomingMailManager()
+
+    class Meta:
+        verbose_name_plural = "incoming mail"
+        indexes = [
+            models.Index(
+                fields=["received_at"],
+                condition=models.Q(state__in=[IncomingMailState.PENDING, IncomingMailState.PROCESSING]),
+                name="mail_incomingmail_queue_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Incoming mail {self.message_id}, {self.get_state_display()}"
+
+    @property
+    def latency(self) -> timedelta | None:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.received_at
+
+
+from . import hooks  # noqa isort:skip
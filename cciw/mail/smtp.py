@@ -1,6 +1,9 @@
+import contextlib
 import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
 
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMessage, get_connection
 
 logger = logging.getLogger("cciw.mail.smtp")
 
@@ -30,7 +33,56 @@ class RawBytes:
         return None
 
 
-def send_mime_message(to_address, from_address, mime_message):
+def send_mime_message(to_address, from_address, mime_message, connection=None):
     logger.info("send_mime_message to=%s message=%s...", to_address, mime_message[0:50])
-    email = RawEmailMessage(to=[to_address], from_email=from_address, mime_data=mime_message)
+    email = RawEmailMessage(to=[to_address], from_email=from_address, mime_data=mime_message, connection=connection)
     email.send()
+
+
+# Maximum number of SMTP connections used at once by send_mime_messages
+MAX_CONNECTIONS = 4
+
+
+def send_mime_messages(messages, *, max_connections=MAX_CONNECTIONS) -> list[tuple[str, Exception]]:
+    """
+    Send a list of (to_address, from_address, mime_message) tuples, using up to
+    `max_connections` persistent connections concurrently.
+
+    Returns a list of (to_address, exception) for messages that failed.
+    """
+    if not messages:
+        return []
+    pending = queue.SimpleQueue()
+    for message in messages:
+        pending.put(message)
+
+    worker_count = min(max_connections, len(messages))
+    if worker_count == 1:
+        return _send_pending_messages(pending)
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        results = [executor.submit(_send_pending_messages, pending) for i in range(worker_count)]
+        return [error for result in results for error in result.result()]
+
+
+def _send_pending_messages(pending: queue.SimpleQueue) -> list[tuple[str, Exception]]:
+    errors = []
+    connection = get_connection()
+    try:
+        while True:
+            try:
+                to_address, from_address, mime_message = pending.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                # Does nothing if already open.
+                connection.open()
+                send_mime_message(to_address, from_address, mime_message, connection=connection)
+            except Exception as e:
+                errors.append((to_address, e))
+                # The connection may be unusable now, so we start a new one for
+                # the next message.
+                with contextlib.suppress(Exception):
+                    connection.close()
+    finally:
+        connection.close()
+    return errors
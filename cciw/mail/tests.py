@@ -1,17 +1,25 @@
 import email
+import email.utils
+import io
 import re
+import threading
+import time
+from datetime import timedelta
 from email import policy
 from unittest import mock
 
 import mailer as queued_mail
 import mailer.engine
 import pytest
+from django.conf import settings
 from django.core import mail
 from django.core.mail.backends.base import BaseEmailBackend
 from django.core.mail.backends.locmem import EmailBackend as LocMemEmailBackend
 from django.db.transaction import atomic
+from django.test import TransactionTestCase
 from django.test.client import RequestFactory
 from django.test.utils import override_settings
+from django.utils import timezone
 from requests.exceptions import ConnectionError
 
 from cciw.accounts.models import Role, User
@@ -19,10 +27,19 @@ from cciw.cciwmain.tests import factories as camp_factories
 from cciw.officers.tests import factories as officer_factories
 from cciw.officers.tests.base import RolesSetupMixin
 from cciw.utils.functional import partition
-from cciw.utils.tests.base import AtomicChecksMixin, TestBase
+from cciw.utils.tests.base import AtomicChecksMixin, TestBase, TestBaseMixin
+from cciw.utils.worker import notify
 
 from . import views
+from .incoming import (
+    claim_incoming_mail,
+    get_incoming_mail_queue_metrics,
+    process_next_incoming_mail,
+    run_incoming_mail_worker,
+)
 from .lists import MailAccessDenied, NoSuchList, extract_email_addresses, find_list, handle_mail, mangle_from_address
+from .management.commands.handle_message import Command as HandleMessageCommand
+from .models import INCOMING_MAIL_CHANNEL, IncomingMail, IncomingMailState
 from .test_data import AWS_BOUNCE_NOTIFICATION, AWS_MESSAGE_ID, AWS_SNS_NOTIFICATION, BAD_MESSAGE_1
 
 
@@ -243,6 +260,32 @@ class TestMailingLists(RolesSetupMixin, TestBase):
         assert all(b"Sender: CCIW website <noreply@cciw.co.uk>" in m for m in sent_messages_bytes)
         assert any(True for m in mail.outbox if '"Fred Jones" <fredjones@example.com>' in m.to)
 
+        # Per-recipient headers
+        parsed_messages = [email.message_from_bytes(m, policy=policy.SMTP) for m in sent_messages_bytes]
+        assert [[a.addr_spec for a in p["To"].addresses] for p in parsed_messages] == [
+            [email.utils.parseaddr(a)[1] for a in m.to] for m in sent_messages
+        ]
+        assert len({p["Message-ID"] for p in parsed_messages}) == 3
+        assert all(p["Subject"] == "Test" for p in parsed_messages)
+
+    def test_handle_officer_list_internationalised_recipient(self):
+        camp = camp_factories.create_camp(
+            year=2000,
+            camp_name="Pink",
+            leader=officer_factories.create_officer(email=(leader_email := "kevin.smith@example.com")),
+        )
+        officer_factories.add_officers_to_camp(
+            camp, [officer_factories.create_officer(first_name="Zoë", last_name="Çelik", email="zoe@example.com")]
+        )
+        handle_mail(make_message(from_email=leader_email, to_email="camp-2000-pink-officers@mailtest.cciw.co.uk"))
+
+        rejections, sent_messages = partition_mailing_list_rejections(mail.outbox)
+        assert len(sent_messages) == 1
+        sent_message_bytes = sent_messages[0].message().as_bytes()
+        sent_message_bytes.decode("ascii")
+        sent_message_parsed = email.message_from_bytes(sent_message_bytes, policy=policy.SMTP)
+        assert sent_message_parsed["To"] == "Zoë Çelik <zoe@example.com>"
+
     def test_spam_and_virus_checking(self):
         role = self._setup_role_for_email(
             name="Test",
@@ -270,9 +313,9 @@ class TestMailingLists(RolesSetupMixin, TestBase):
             email="committee@mailtest.cciw.co.uk",
             recipients=[("aperson", "a.person@example.com")],
         )
-        with mock.patch("cciw.mail.lists.send_mime_message") as m_s:
+        with mock.patch("cciw.mail.smtp.send_mime_message") as m_s:
 
-            def connection_error():
+            def connection_error(*args, **kwargs):
                 raise ConnectionError("Connection refused")
 
             m_s.side_effect = connection_error
@@ -303,9 +346,9 @@ class TestMailingLists(RolesSetupMixin, TestBase):
             ],
         )
 
-        with mock.patch("cciw.mail.lists.send_mime_message") as m_s:
+        with mock.patch("cciw.mail.smtp.send_mime_message") as m_s:
 
-            def sendmail(to_address, from_address, mail_bytes):
+            def sendmail(to_address, from_address, mail_bytes, connection=None):
                 if to_address.endswith("@faildomain.com"):
                     raise Exception(f"We don't like {to_address}!")
                 # Otherwise succeed silently
@@ -386,6 +429,63 @@ class TestMailingLists(RolesSetupMixin, TestBase):
         assert "Use the following link" in m.body
         assert response.status_code == 200
 
+    def test_find_list_uses_index(self):
+        camps = [camp_factories.create_camp(camp_name=f"Camp{n}", year=2000) for n in range(5)]
+        leader = officer_factories.create_officer()
+        camp_factories.add_camp_leader(camps[0], leader)
+        # First call builds the index
+        find_list("camp-2000-camp0-officers@mailtest.cciw.co.uk", leader.email)
+
+        # Subsequent calls only need queries for the permission check on the
+        # matched list. We have a cached index, so the number of camps and lists
+        # doesn't matter.
+        camp_factories.add_camp_leader(camps[4], leader)
+        for camp in camps[0], camps[4]:
+            with self.assertNumQueries(3):
+                email_list = find_list(f"camp-2000-{camp.slug_name}-officers@mailtest.cciw.co.uk", leader.email)
+            assert email_list.address == f"camp-2000-{camp.slug_name}-officers@mailtest.cciw.co.uk"
+
+        with self.assertNumQueries(0):
+            with pytest.raises(NoSuchList):
+                find_list("camp-2000-camp0-officers@example.com", leader.email)
+            with pytest.raises(NoSuchList):
+                find_list("camp-2000-neon-officers@mailtest.cciw.co.uk", leader.email)
+
+    def test_find_list_index_invalidation(self):
+        camp_factories.create_camp(camp_name="Blue", year=2000)
+        superuser = officer_factories.create_officer(is_superuser=True)
+        with pytest.raises(NoSuchList):
+            find_list("camp-2000-red-leaders@mailtest.cciw.co.uk", superuser.email)
+
+        # New camp
+        red_camp = camp_factories.create_camp(camp_name="Red", year=2000)
+        assert find_list("camp-2000-red-leaders@mailtest.cciw.co.uk", superuser.email)
+
+        # Changed camp name
+        red_camp.camp_name.slug = "green"
+        red_camp.camp_name.save()
+        assert find_list("camp-2000-green-leaders@mailtest.cciw.co.uk", superuser.email)
+        with pytest.raises(NoSuchList):
+            find_list("camp-2000-red-leaders@mailtest.cciw.co.uk", superuser.email)
+
+        # Deleted camp
+        red_camp.delete()
+        with pytest.raises(NoSuchList):
+            find_list("camp-2000-green-leaders@mailtest.cciw.co.uk", superuser.email)
+
+        # Changed role address
+        role = self._setup_role_for_email(
+            email="myrole@mailtest.cciw.co.uk",
+            allow_emails_from_public=True,
+            recipients=[("test1", "test1@example.com")],
+        )
+        assert find_list("myrole@mailtest.cciw.co.uk", "someone@example.com")
+        role.email = "otherrole@mailtest.cciw.co.uk"
+        role.save()
+        assert find_list("otherrole@mailtest.cciw.co.uk", "someone@example.com")
+        with pytest.raises(NoSuchList):
+            find_list("myrole@mailtest.cciw.co.uk", "someone@example.com")
+
     def test_mangle_from_address(self):
         assert mangle_from_address("foo@bar.com") == '"foo(at)bar.com" <noreply@cciw.co.uk>'
         assert mangle_from_address("Mr Foo <foo@bar.com>") == '"Mr Foo foo(at)bar.com" <noreply@cciw.co.uk>'
@@ -398,6 +498,137 @@ class TestMailingLists(RolesSetupMixin, TestBase):
         assert rejections == []
 
 
+class TestIncomingMailQueue(TestBase):
+    def test_ses_incoming_queues_message(self):
+        request = make_plain_text_request("/", AWS_SNS_NOTIFICATION["body"], AWS_SNS_NOTIFICATION["headers"])
+        with mock.patch("cciw.aws.verify_sns_notification") as m:
+            m.side_effect = [True, True]
+            views.ses_incoming_notification(request)
+            # Repeated notification:
+            views.ses_incoming_notification(request)
+
+        incoming_mail = IncomingMail.objects.get()
+        assert incoming_mail.message_id == AWS_MESSAGE_ID.decode("ascii")
+        assert incoming_mail.state == IncomingMailState.PENDING
+
+    def test_enqueue_dedupes(self):
+        assert IncomingMail.objects.enqueue("abc")
+        assert not IncomingMail.objects.enqueue("abc")
+        assert IncomingMail.objects.count() == 1
+
+    def test_handle_message_command(self):
+        stdout = io.StringIO()
+        HandleMessageCommand(stdout=stdout).handle(message_id="abc")
+        HandleMessageCommand(stdout=stdout).handle(message_id="abc")
+        assert stdout.getvalue() == "Queued abc\nabc has already been queued\n"
+        assert IncomingMail.objects.get().state == IncomingMailState.PENDING
+
+    def test_process(self):
+        role = Role.objects.create(name="Test", email="committee@mailtest.cciw.co.uk", allow_emails_from_public=True)
+        role.email_recipients.create(username="aperson1", email="a.person.1@example.com")
+        role.email_recipients.create(username="aperson2", email="a.person.2@example.com")
+        IncomingMail.objects.enqueue("abc")
+        with mock.patch("cciw.mail.lists.download_ses_message_from_s3") as m:
+            m.return_value = make_message(to_email=role.email)
+            assert process_next_incoming_mail()
+            assert not process_next_incoming_mail()
+
+        assert m.call_args[0][0] == "abc"
+        assert len(mail.outbox) == 2
+        incoming_mail = IncomingMail.objects.get()
+        assert incoming_mail.state == IncomingMailState.DONE
+        assert incoming_mail.attempts == 1
+        assert incoming_mail.latency is not None
+
+    def test_process_error(self):
+        IncomingMail.objects.enqueue("abc")
+        with mock.patch("cciw.mail.lists.download_ses_message_from_s3") as m, self.assertLogs("cciw.mail.incoming"):
+            m.side_effect = ConnectionError()
+            assert process_next_incoming_mail()
+
+        incoming_mail = IncomingMail.objects.get()
+        assert incoming_mail.state == IncomingMailState.FAILED
+        assert incoming_mail.error == "ConnectionError"
+        # Not retried:
+        assert claim_incoming_mail(10) == []
+
+    def test_claim(self):
+        now = timezone.now()
+        for i in range(3):
+            IncomingMail.objects.create(message_id=f"msg{i}", received_at=now - timedelta(minutes=10 - i))
+        first = claim_incoming_mail(2, now=now)
+        assert [IncomingMail.objects.get(id=id).message_id for id in first] == ["msg0", "msg1"]
+        second = claim_incoming_mail(2, now=now)
+        assert [IncomingMail.objects.get(id=id).message_id for id in second] == ["msg2"]
+        assert claim_incoming_mail(2, now=now) == []
+
+    def test_claim_abandoned(self):
+        now = timezone.now()
+        IncomingMail.objects.enqueue("abc")
+        timeout = settings.INCOMING_MAIL_PROCESSING_TIMEOUT
+        for attempt in range(settings.INCOMING_MAIL_MAX_ATTEMPTS):
+            claimed = claim_incoming_mail(1, now=now)
+            assert len(claimed) == 1
+            # Not claimed again until the worker that claimed it is assumed dead:
+            assert claim_incoming_mail(1, now=now + timeout / 2) == []
+            now += timeout + timedelta(seconds=1)
+
+        assert claim_incoming_mail(1, now=now) == []
+        incoming_mail = IncomingMail.objects.get()
+        assert incoming_mail.state == IncomingMailState.FAILED
+        assert incoming_mail.attempts == settings.INCOMING_MAIL_MAX_ATTEMPTS
+
+    def test_metrics(self):
+        now = timezone.now()
+        IncomingMail.objects.create(message_id="pending", received_at=now - timedelta(seconds=30))
+        IncomingMail.objects.create(
+            message_id="done",
+            state=IncomingMailState.DONE,
+            received_at=now - timedelta(seconds=20),
+            finished_at=now - timedelta(seconds=18),
+        )
+        IncomingMail.objects.create(
+            message_id="failed",
+            state=IncomingMailState.FAILED,
+            received_at=now - timedelta(seconds=10),
+            finished_at=now - timedelta(seconds=6),
+        )
+        metrics = get_incoming_mail_queue_metrics(now)
+        assert metrics.pending == 1
+        assert metrics.processing == 0
+        assert metrics.oldest_pending_age == timedelta(seconds=30)
+        assert metrics.processed == 2
+        assert metrics.failed == 1
+        assert metrics.mean_latency == timedelta(seconds=3)
+        assert metrics.max_latency == timedelta(seconds=4)
+
+
+class TestIncomingMailWorker(TestBaseMixin, TransactionTestCase):
+    # NOTIFY is only delivered on commit, so this needs real transactions.
+    @override_settings(INCOMING_MAIL_POLL_INTERVAL=timedelta(seconds=60))
+    def test_woken_by_notify(self):
+        stop = threading.Event()
+        with mock.patch("cciw.mail.incoming.handle_mail_from_s3") as handle_mail_from_s3:
+            worker = threading.Thread(target=run_incoming_mail_worker, kwargs=dict(threads=2, stop=stop))
+            worker.start()
+            try:
+                # Let the worker threads find the queue empty and start waiting:
+                time.sleep(0.5)
+                IncomingMail.objects.enqueue("abc")
+                for i in range(50):
+                    if IncomingMail.objects.filter(state=IncomingMailState.DONE).exists():
+                        break
+                    time.sleep(0.1)
+            finally:
+                stop.set()
+                # Wake the worker, so that it sees `stop` without waiting for the next poll:
+                notify(INCOMING_MAIL_CHANNEL, "")
+                worker.join()
+
+        assert IncomingMail.objects.get().state == IncomingMailState.DONE
+        handle_mail_from_s3.assert_called_once_with("abc")
+
+
 def emailify(msg):
     return msg.strip().replace("\n", "\r\n").encode("utf-8")
 
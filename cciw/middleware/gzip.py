@@ -0,0 +1,13 @@
+from django.middleware.gzip import GZipMiddleware as DjangoGZipMiddleware
+
+
+class GZipMiddleware(DjangoGZipMiddleware):
+    """
+    GZipMiddleware that leaves responses that support byte ranges alone, because
+    ranges refer to the unencoded content. See cciw.documents.views
+    """
+
+    def process_response(self, request, response):
+        if response.has_header("Accept-Ranges"):
+            return response
+        return super().process_response(request, response)
@@ -1,9 +1,9 @@
-import operator
 from collections import defaultdict
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta
-from functools import cached_property, reduce
+from functools import cached_property
 
+from django.conf import settings
 from django.utils import timezone
 
 from cciw.accounts.models import User
@@ -102,35 +102,24 @@ def get_officers_with_dbs_info_for_camps(
     if officer_id is not None:
         camp_invitations = camp_invitations.filter(officer__id=officer_id)
     camp_invitations = list(camp_invitations)
+    if not camp_invitations:
+        return []
 
     all_officers = list({i.officer for i in camp_invitations})
     all_officers.sort(key=lambda o: (o.first_name, o.last_name))
-    apps = list(applications_for_camps(year_camps))
-    recent_dbs_officer_ids = set(
-        reduce(operator.or_, [DBSCheck.objects.get_for_camp(c, include_late=True) for c in year_camps]).values_list(
-            "officer_id", flat=True
-        )
-    )
+    all_officer_ids = [o.id for o in all_officers]
+    apps = applications_for_camps(year_camps, officer_ids=all_officer_ids).order_by("date_saved")
 
-    all_dbs_officer_ids = set(DBSCheck.objects.filter(officer__in=all_officers).values_list("officer_id", flat=True))
-
-    last_dbs_status = dict(
-        DBSCheck.objects.filter(officer__in=all_dbs_officer_ids).values_list("officer_id", "applicant_accepted")
-    )
+    # A DBS check is 'recent' if it could be valid for any of the camps, which
+    # is the case if the latest one is recent enough for the earliest camp
+    # (matching DBSCheck.objects.get_for_camp(camp, include_late=True))
+    recent_dbs_cutoff = min(c.start_date for c in year_camps) - timedelta(days=settings.DBS_VALID_FOR)
+    latest_dbs_checks = get_latest_dbs_checks(all_officer_ids)
 
     # Looking for action logs: set cutoff to a year before now, on the basis that
     # anything more than that will have been lost or irrelevant, and we don't
     # want to load everything into memory.
-    relevant_action_logs = (
-        DBSActionLog.objects.filter(officer__in=all_officers)
-        .filter(created_at__gt=now - timedelta(365))
-        .order_by("created_at")
-    )
-    dbs_forms_sent = list(relevant_action_logs.filter(action_type=DBSActionLogType.FORM_SENT))
-    requests_for_dbs_form_sent = list(
-        relevant_action_logs.filter(action_type=DBSActionLogType.REQUEST_FOR_DBS_FORM_SENT)
-    )
-    leader_alerts_sent = list(relevant_action_logs.filter(action_type=DBSActionLogType.LEADER_ALERT_SENT))
+    last_action_logs = get_last_action_logs(all_officer_ids, since=now - timedelta(365))
 
     update_service_dbs_numbers_for_officers = get_update_service_dbs_numbers(all_officers)
 
@@ -145,42 +134,72 @@ def get_officers_with_dbs_info_for_camps(
     for invitation in camp_invitations:
         officers_camps[invitation.officer_id].append(invitation.camp)
 
+    # NB: order_by('date_saved') above means most recent wins
     officer_apps = {a.officer_id: a for a in apps}
 
-    def logs_to_dict(logs) -> dict[int, datetime]:
-        # NB: order_by('created_at') above means that requests sent later will overwrite
-        # those sent earlier in the following dictionary
-        return {f.officer_id: f.created_at for f in logs}
-
-    dbs_forms_sent_for_officers = logs_to_dict(dbs_forms_sent)
-    requests_for_dbs_form_sent_for_officers = logs_to_dict(requests_for_dbs_form_sent)
-    leader_alerts_sent_for_officers = logs_to_dict(leader_alerts_sent)
-
     retval = []
     for o in all_officers:
         officer_camps = officers_camps[o.id]
         if not any(c in selected_camps for c in officer_camps):
             continue
         app = officer_apps.get(o.id, None)
+        latest_dbs_check = latest_dbs_checks.get(o.id, None)
         dbs_info = DBSInfo(
             camps=officer_camps,
             has_application_form=app is not None,
             application_id=app.id if app is not None else None,
-            has_dbs=o.id in all_dbs_officer_ids,
-            has_recent_dbs=o.id in recent_dbs_officer_ids,
-            last_dbs_form_sent=dbs_forms_sent_for_officers.get(o.id),
-            last_leader_alert_sent=leader_alerts_sent_for_officers.get(o.id),
-            last_form_request_sent=requests_for_dbs_form_sent_for_officers.get(o.id),
+            has_dbs=latest_dbs_check is not None,
+            has_recent_dbs=latest_dbs_check is not None and latest_dbs_check.completed >= recent_dbs_cutoff,
+            last_dbs_form_sent=last_action_logs.get((o.id, DBSActionLogType.FORM_SENT)),
+            last_leader_alert_sent=last_action_logs.get((o.id, DBSActionLogType.LEADER_ALERT_SENT)),
+            last_form_request_sent=last_action_logs.get((o.id, DBSActionLogType.REQUEST_FOR_DBS_FORM_SENT)),
             address=app.one_line_address if app is not None else "",
             birth_date=app.birth_date if app is not None else None,
             dbs_check_consent=app.dbs_check_consent if app is not None else False,
             update_enabled_dbs_number=update_service_dbs_numbers_for_officers.get(o.id),
-            last_dbs_rejected=not last_dbs_status[o.id] if o.id in last_dbs_status else False,
+            last_dbs_rejected=latest_dbs_check is not None and not latest_dbs_check.applicant_accepted,
         )
         retval.append((o, dbs_info))
     return retval
 
 
+@dataclass
+class LatestDBSCheck:
+    completed: date
+    applicant_accepted: bool
+
+
+def get_latest_dbs_checks(officer_ids: list[int]) -> dict[int, LatestDBSCheck]:
+    """
+    Returns the most recent DBS check for each officer, as a dictionary
+    of {officer_id: LatestDBSCheck}
+    """
+    # DISTINCT ON with ordering gives us just the most recent per officer
+    return {
+        officer_id: LatestDBSCheck(completed=completed, applicant_accepted=applicant_accepted)
+        for officer_id, completed, applicant_accepted in DBSCheck.objects.filter(officer__in=officer_ids)
+        .order_by("officer_id", "-completed", "-id")
+        .distinct("officer_id")
+        .values_list("officer_id", "completed", "applicant_accepted")
+    }
+
+
+def get_last_action_logs(officer_ids: list[int], *, since: datetime) -> dict[tuple[int, str], datetime]:
+    """
+    Returns the time of the most recent DBSActionLog of each type for each
+    officer, as a dictionary of {(officer_id, action_type): created_at}
+    """
+    return {
+        (officer_id, action_type): created_at
+        for officer_id, action_type, created_at in DBSActionLog.objects.filter(
+            officer__in=officer_ids, created_at__gt=since
+        )
+        .order_by("officer_id", "action_type", "-created_at")
+        .distinct("officer_id", "action_type")
+        .values_list("officer_id", "action_type", "created_at")
+    }
+
+
 def get_update_service_dbs_numbers(officers):
     # Find DBS numbers than can be used with the update service.
     # Two sources:
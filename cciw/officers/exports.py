@@ -0,0 +1,174 @@
+"""
+Background jobs for building large spreadsheet exports.
+
+Large exports can take a long time to build, so instead of doing it within the
+request (see cciw.officers.views.utils.exports), we create an ExportJob, which
+is built by a long running worker process (`manage.py run_export_job_worker`,
+managed by supervisor). The result is stored as an ExportDocument, which the
+user can download from the job page (which polls for progress using htmx) until
+it expires.
+
+The worker uses a small pool of threads, each of which claims jobs using
+SELECT ... FOR UPDATE SKIP LOCKED. It is woken by NOTIFY when a job is created,
+and also polls every EXPORT_JOB_POLL_INTERVAL. See cciw.utils.worker. Jobs are
+not built in the web server process, because uWSGI doesn't run Python threads
+without --enable-threads, and can kill a worker process part way through a
+build (harakiri, reload-on-rss).
+
+If the worker is killed while building a job, the job is marked as failed when
+the worker next starts, or after EXPORT_JOB_TIMEOUT.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from cciw.accounts.models import User
+from cciw.officers.models import ExportDocument, ExportJob, ExportJobState
+from cciw.utils.worker import notify, run_worker
+
+logger = logging.getLogger(__name__)
+
+EXPORT_JOB_TIMEOUT = timedelta(hours=1)
+
+# Channel for NOTIFY, so that the worker can start new jobs without waiting for
+# the next poll.
+EXPORT_JOB_CHANNEL = "cciw_export_jobs"
+
+
+def start_export_job(user: User, export_name: str, params: dict, *, filename: str, row_count: int) -> ExportJob:
+    now = timezone.now()
+    job = ExportJob.objects.create(
+        user=user,
+        export_name=export_name,
+        params=params,
+        filename=filename,
+        row_count=row_count,
+        created_at=now,
+        expires_at=now + settings.EXPORT_JOB_EXPIRES,
+    )
+    transaction.on_commit(lambda: submit_export_job(job.id))
+    return job
+
+
+def submit_export_job(job_id: int) -> None:
+    if settings.EXPORT_JOBS_RUN_IN_BACKGROUND:
+        notify(EXPORT_JOB_CHANNEL, str(job_id))
+    else:
+        run_export_job(job_id)
+
+
+def run_export_job(job_id: int) -> None:
+    # Claim the job, so it can't be run twice:
+    claimed = ExportJob.objects.filter(id=job_id, state=ExportJobState.PENDING).update(
+        state=ExportJobState.RUNNING, started_at=timezone.now()
+    )
+    if claimed:
+        _build_export_job(job_id)
+
+
+def claim_export_job() -> int | None:
+    """
+    Claims the oldest pending job for this worker, returning its id, or None.
+    """
+    with transaction.atomic():
+        job_id = (
+            ExportJob.objects.filter(state=ExportJobState.PENDING)
+            .order_by("created_at")
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)
+            .first()
+        )
+        if job_id is not None:
+            ExportJob.objects.filter(id=job_id).update(state=ExportJobState.RUNNING, started_at=timezone.now())
+    return job_id
+
+
+def run_next_export_job() -> bool:
+    """
+    Builds the next pending job, returning False if there wasn't one.
+    """
+    job_id = claim_export_job()
+    if job_id is None:
+        return False
+    _build_export_job(job_id)
+    return True
+
+
+def _build_export_job(job_id: int) -> None:
+    # Export definitions live with the views that use them, which import this module.
+    from cciw.officers.views.utils.exports import build_export
+
+    job = ExportJob.objects.get(id=job_id)
+    try:
+        builder = build_export(job.export_name, job.params)
+        content = builder.to_bytes()
+    except Exception as e:
+        logger.exception("Export job %s (%s) failed", job.id, job.export_name)
+        job.state = ExportJobState.FAILED
+        job.error = repr(e)
+        job.finished_at = timezone.now()
+        job.save()
+        return
+
+    with transaction.atomic():
+        job.document = ExportDocument.objects.create(
+            filename=job.filename,
+            mimetype=builder.mimetype,
+            content=content,
+        )
+        job.state = ExportJobState.COMPLETE
+        job.finished_at = timezone.now()
+        job.save()
+    logger.info(
+        "Export job %s (%s, %s rows) took %.2fs",
+        job.id,
+        job.export_name,
+        job.row_count,
+        job.duration.total_seconds(),
+    )
+
+
+def fail_stalled_export_jobs(now: datetime) -> int:
+    """
+    Marks as failed jobs that were lost (e.g. due to a restart)
+    """
+    return ExportJob.objects.filter(
+        state__in=[ExportJobState.PENDING, ExportJobState.RUNNING], created_at__lt=now - EXPORT_JOB_TIMEOUT
+    ).update(state=ExportJobState.FAILED, error="Job did not complete", finished_at=now)
+
+
+def delete_expired_export_jobs(now: datetime) -> None:
+    ExportJob.objects.expired(now).delete()
+    ExportDocument.objects.orphaned().delete()
+
+
+def fail_interrupted_export_jobs(now: datetime) -> int:
+    """
+    Marks as failed jobs that were running when the worker was stopped. Must
+    only be called when no jobs are running.
+    """
+    return ExportJob.objects.filter(state=ExportJobState.RUNNING).update(
+        state=ExportJobState.FAILED, error="Job was interrupted", finished_at=now
+    )
+
+
+# --- Worker ---
+
+
+def run_export_job_worker(*, threads: int, stop: threading.Event) -> None:
+    """
+    Runs the export job worker until `stop` is set. Only one should be run.
+    """
+    fail_interrupted_export_jobs(timezone.now())
+    run_worker(
+        name="Export job",
+        channel=EXPORT_JOB_CHANNEL,
+        process_next=run_next_export_job,
+        threads=threads,
+        poll_interval=settings.EXPORT_JOB_POLL_INTERVAL,
+        stop=stop,
+    )
@@ -0,0 +1,24 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cciw.officers.exports import run_export_job_worker
+
+
+class Command(BaseCommand):
+    help = "Run the worker that builds spreadsheet export jobs. See cciw.officers.exports"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=settings.EXPORT_JOB_WORKERS)
+
+    def handle(self, *args, threads, **options):
+        stop = threading.Event()
+
+        def stop_handler(signum, frame):
+            stop.set()
+
+        signal.signal(signal.SIGTERM, stop_handler)
+        signal.signal(signal.SIGINT, stop_handler)
+        run_export_job_worker(threads=threads, stop=stop)
@@ -0,0 +1,83 @@
+# Generated by Django 4.2.3 on 2026-10-18 22:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+import cciw.documents.fields
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("officers", "0009_alter_referenceaction_action_type"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExportDocument",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("filename", models.CharField(max_length=255)),
+                ("mimetype", models.CharField(max_length=255)),
+                ("size", models.PositiveIntegerField()),
+                ("content", models.BinaryField()),
+                ("erased_on", models.DateTimeField(blank=True, default=None, null=True)),
+            ],
+            options={
+                "base_manager_name": "objects",
+            },
+        ),
+        migrations.CreateModel(
+            name="ExportJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("export_name", models.CharField(max_length=100)),
+                ("params", models.JSONField(default=dict)),
+                ("filename", models.CharField(max_length=255)),
+                (
+                    "row_count",
+                    models.PositiveIntegerField(help_text="Approximate size of the data, when the job was created"),
+                ),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("complete", "Complete"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("started_at", models.DateTimeField(blank=True, default=None, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, default=None, null=True)),
+                ("expires_at", models.DateTimeField()),
+                ("error", models.TextField(blank=True)),
+                (
+                    "document",
+                    cciw.documents.fields.DocumentField(
+                        blank=True,
+                        default=None,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="export_job",
+                        to="officers.exportdocument",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="export_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("officers", "0010_exportjob"),
+    ]
+
+    operations = [
+        # See bookings/migrations/0060_supportinginformationdocument_content_storage.py
+        migrations.RunSQL(
+            "ALTER TABLE officers_exportdocument ALTER COLUMN content SET STORAGE EXTERNAL;",
+            "ALTER TABLE officers_exportdocument ALTER COLUMN content SET STORAGE EXTENDED;",
+        ),
+    ]
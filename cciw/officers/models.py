@@ -1,3 +1,4 @@
+from collections import defaultdict
 from datetime import date, datetime, timedelta
 
 from attr import dataclass
@@ -13,6 +14,8 @@ from django.utils.functional import cached_property
 
 from cciw.accounts.models import User
 from cciw.cciwmain.models import Camp
+from cciw.documents.fields import DocumentField
+from cciw.documents.models import Document, DocumentManager, DocumentQuerySet
 from cciw.officers.fields import (
     RequiredAddressField,
     RequiredCharField,
@@ -714,6 +717,101 @@ class DBSActionLog(models.Model):
         return f"Log of DBS action '{self.get_action_type_display()}' for {self.officer.full_name}, {self.created_at:%Y-%m-%d}"
 
 
+class ExportDocumentQuerySet(DocumentQuerySet):
+    def orphaned(self):
+        return self.filter(export_job__isnull=True)
+
+    def not_in_use(self, now: datetime):
+        return self.filter(models.Q(export_job__isnull=True) | models.Q(export_job__expires_at__lt=now))
+
+
+ExportDocumentManager = DocumentManager.from_queryset(ExportDocumentQuerySet)
+
+
+class ExportDocument(Document):
+    """
+    Stores the spreadsheet created by an ExportJob
+    """
+
+    objects = ExportDocumentManager()
+
+    class Meta:
+        base_manager_name = "objects"
+
+
+class ExportJobState(TextChoices):
+    PENDING = "pending", "Pending"
+    RUNNING = "running", "Running"
+    COMPLETE = "complete", "Complete"
+    FAILED = "failed", "Failed"
+
+
+class ExportJobQuerySet(models.QuerySet):
+    def older_than(self, before_datetime):
+        return self.filter(created_at__lt=before_datetime)
+
+    def expired(self, now: datetime):
+        return self.filter(expires_at__lt=now)
+
+    def not_in_use(self, now: datetime):
+        return self.expired(now)
+
+
+ExportJobManager = models.Manager.from_queryset(ExportJobQuerySet)
+
+
+class ExportJob(models.Model):
+    """
+    A spreadsheet export that is built in the background, for a single user.
+    See cciw.officers.exports
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="export_jobs", on_delete=models.CASCADE)
+    export_name = models.CharField(max_length=100)
+    params = models.JSONField(default=dict)
+    filename = models.CharField(max_length=255)
+    row_count = models.PositiveIntegerField(help_text="Approximate size of the data, when the job was created")
+    state = models.CharField(max_length=20, choices=ExportJobState.choices, default=ExportJobState.PENDING)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True, default=None)
+    finished_at = models.DateTimeField(null=True, blank=True, default=None)
+    expires_at = models.DateTimeField()
+    error = models.TextField(blank=True)
+    document = DocumentField(
+        ExportDocument,
+        related_name="export_job",
+        on_delete=models.SET_NULL,
+        default=None,
+        null=True,
+        blank=True,
+    )
+
+    objects = ExportJobManager()
+
+    def __str__(self):
+        return f"Export {self.filename} for {self.user.username}, {self.get_state_display()}"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.state in (ExportJobState.COMPLETE, ExportJobState.FAILED)
+
+    @property
+    def is_complete(self) -> bool:
+        return self.state == ExportJobState.COMPLETE
+
+    def is_expired(self, now: datetime) -> bool:
+        return self.expires_at < now
+
+    @property
+    def duration(self) -> timedelta | None:
+        """
+        Time taken to build the export, once finished
+        """
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
 TITLES = ["dr", "rev", "reverend", "pastor", "mr", "ms", "mrs", "prof"]
 
 
@@ -735,47 +833,89 @@ def close_enough_referee_match(referee1: Referee, referee2: Referee):
     return False
 
 
-def add_previous_references(referee: Referee) -> None:
+def add_previous_references(referees: list[Referee]) -> None:
     """
     Adds the attributes:
     - 'previous_reference' (which is None if no exact match)
     - 'possible_previous_references' (list ordered by relevance)
+    to each of the referees.
     """
-    exact, previous = get_previous_references(referee)
-    referee.previous_reference = exact
-    referee.possible_previous_references = [] if exact else previous
+    for referee, (exact, previous) in zip(referees, get_previous_references_for_referees(referees)):
+        referee.previous_reference = exact
+        referee.possible_previous_references = [] if exact else previous
 
 
 def get_previous_references(referee: Referee) -> tuple[Reference | None, list[Reference]]:
+    """
+    Returns the exact match previous Reference (or None), and a list of
+    possible previous References ordered by relevance
+    """
+    return get_previous_references_for_referees([referee])[0]
+
+
+def get_previous_references_for_referees(
+    referees: list[Referee],
+) -> list[tuple[Reference | None, list[Reference]]]:
+    """
+    Bulk version of get_previous_references, which uses a single query
+    """
+    if not referees:
+        return []
+
     # Look for References for same officer, within the previous five years.
     # Don't look for references from this year's application (which will be the
     # other referee).
-    cutoffdate = referee.application.date_saved - timedelta(365 * 5)
-    previous = list(
+    cutoff_dates = [_as_date(referee.application.date_saved) - timedelta(365 * 5) for referee in referees]
+    candidates = (
         Reference.objects.filter(
-            referee__application__officer=referee.application.officer,
+            referee__application__officer__in={referee.application.officer_id for referee in referees},
             referee__application__finished=True,
-            date_created__gte=cutoffdate,
+            date_created__gte=min(cutoff_dates),
         )
         .select_related("referee__application")
-        .exclude(referee__application=referee.application)
         .order_by("-referee__application__date_saved")
     )
+    by_officer = defaultdict(list)
+    by_match_key = defaultdict(list)
+    for reference in candidates:
+        officer_id = reference.referee.application.officer_id
+        by_officer[officer_id].append(reference)
+        by_match_key[_referee_match_key(officer_id, reference.referee)].append(reference)
+
+    results = []
+    for referee, cutoff_date in zip(referees, cutoff_dates):
+
+        def is_previous(reference):
+            return reference.date_created >= cutoff_date and reference.referee.application_id != referee.application_id
+
+        # Sort by relevance
+        def relevance_key(reference):
+            # Matching name or email address is better, so has lower value,
+            # so it comes first.
+            return -(
+                int(reference.referee.email.lower() == referee.email.lower())
+                + int(reference.referee.name.lower() == referee.name.lower())
+            )
 
-    # Sort by relevance
-    def relevance_key(reference):
-        # Matching name or email address is better, so has lower value,
-        # so it comes first.
-        return -(
-            int(reference.referee.email.lower() == referee.email.lower())
-            + int(reference.referee.name.lower() == referee.name.lower())
-        )
+        officer_id = referee.application.officer_id
+        previous = [reference for reference in by_officer[officer_id] if is_previous(reference)]
+        previous.sort(key=relevance_key)  # sort is stable, so previous sort by date should be kept
+
+        # References that are close enough matches (see close_enough_referee_match), of
+        # which we want the first in the order above:
+        exact_matches = [
+            reference for reference in by_match_key[_referee_match_key(officer_id, referee)] if is_previous(reference)
+        ]
+        exact = min(exact_matches, key=relevance_key) if exact_matches else None
+        results.append((exact, previous))
+    return results
+
+
+def _as_date(value: date) -> date:
+    # Application.date_saved can be a datetime before it has been saved and reloaded
+    return value.date() if isinstance(value, datetime) else value
 
-    previous.sort(key=relevance_key)  # sort is stable, so previous sort by date should be kept
 
-    exact = None
-    for reference in previous:
-        if close_enough_referee_match(reference.referee, referee):
-            exact = reference
-            break
-    return (exact, previous)
+def _referee_match_key(officer_id: int, referee: Referee) -> tuple:
+    # See close_enough_referee_match
+    return (officer_id, normalized_name(referee.name).lower(), referee.email.lower())
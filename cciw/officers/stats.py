@@ -5,7 +5,7 @@ from django.conf import settings
 
 from cciw.cciwmain.models import Camp
 from cciw.officers.applications import applications_for_camp
-from cciw.officers.models import DBSCheck, Reference
+from cciw.officers.models import Application, DBSCheck, Invitation, Reference
 from cciw.utils.stats import accumulate_dates
 
 
@@ -77,50 +77,77 @@ def get_camp_officer_stats(camp) -> pd.DataFrame:
 
 def get_camp_officer_stats_trend(start_year, end_year) -> pd.DataFrame:
     years = list(range(start_year, end_year + 1))
-    officer_counts = []
-    application_counts = []
-    reference_in_time_counts = []
-    dbs_in_time_counts = []
-    for year in years:
-        camps = Camp.objects.filter(year=year)
-        # It's hard to make use of SQL efficiently here, because the
-        # applications_for_camp logic and the DBS application logic can't be
-        # captured in SQL efficiently, due to there being no direct link to
-        # camps.
-        officer_count = 0
-        application_count = 0
-        reference_in_time_count = 0
-        dbs_in_time_count = 0
-
-        # There are some slight 'bugs' here when officers go on mutliple camps.
-        # Correct behaviour is tricky to define - for example, if an officer
-        # goes on two camps, and for one of them has a valid DBS and the other
-        # he/she doesn't, due to dates.
-        for camp in camps:
-            officer_ids = list(camp.invitations.values_list("officer_id", flat=True))
-            officer_count += len(officer_ids)
-            application_form_ids = list(applications_for_camp(camp).values_list("id", flat=True))
-            application_count += len(application_form_ids)
-            reference_in_time_count += Reference.objects.filter(
-                referee__application__in=application_form_ids, date_created__lte=camp.start_date
-            ).count()
-            dbs_in_time_count += DBSCheck.objects.filter(
-                officer__in=officer_ids,
-                completed__isnull=False,
-                completed__lte=camp.start_date,
-                completed__gte=camp.start_date - timedelta(days=settings.DBS_VALID_FOR),
-            ).count()  # ignores the possibility that an officer can have more than one
-        officer_counts.append(officer_count)
-        application_counts.append(application_count)
-        reference_in_time_counts.append(reference_in_time_count)
-        dbs_in_time_counts.append(dbs_in_time_count)
+
+    # We fetch all the rows we need for the whole range of years in a few
+    # queries, and then do the date window logic for each camp (duplicated from
+    # applications_for_camp and DBSCheck.get_for_camp) using pandas.
+
+    # There are some slight 'bugs' here when officers go on mutliple camps.
+    # Correct behaviour is tricky to define - for example, if an officer
+    # goes on two camps, and for one of them has a valid DBS and the other
+    # he/she doesn't, due to dates.
+    camps = _to_frame(
+        Camp.objects.filter(year__gte=start_year - 1, year__lte=end_year),
+        ["id", "year", "start_date", "end_date"],
+        date_columns=["start_date", "end_date"],
+    ).rename(columns={"id": "camp_id"})
+    # Applications must be after the end of the previous year's camps
+    previous_year_end_dates = camps.groupby("year")["end_date"].max()
+    previous_year_end_dates.index = previous_year_end_dates.index + 1
+    camps["previous_year_end_date"] = pd.to_datetime(camps["year"].map(previous_year_end_dates))
+    camps = camps[camps["year"] >= start_year]
+
+    invitations_qs = Invitation.objects.filter(camp__year__gte=start_year, camp__year__lte=end_year)
+    invitations = _to_frame(invitations_qs, ["camp_id", "officer_id"]).merge(camps, on="camp_id")
+
+    applications_qs = Application.objects.filter(finished=True, officer__in=invitations_qs.values("officer_id"))
+    if len(camps):
+        applications_qs = applications_qs.filter(
+            date_saved__gt=camps["start_date"].min().date() - timedelta(365),
+            date_saved__lte=camps["start_date"].max().date(),
+        )
+    applications = _to_frame(applications_qs, ["id", "officer_id", "date_saved"], date_columns=["date_saved"])
+    references = _to_frame(
+        Reference.objects.filter(referee__application__in=applications_qs.values("id")),
+        ["referee__application_id", "date_created"],
+        date_columns=["date_created"],
+    ).rename(columns={"referee__application_id": "application_id"})
+    dbs_checks = _to_frame(
+        DBSCheck.objects.filter(officer__in=invitations_qs.values("officer_id"), completed__isnull=False),
+        ["officer_id", "completed"],
+        date_columns=["completed"],
+    )
+
+    camp_applications = invitations.merge(applications.rename(columns={"id": "application_id"}), on="officer_id")
+    camp_applications = camp_applications[
+        (camp_applications["date_saved"] > camp_applications["start_date"] - pd.Timedelta(days=365))
+        & (camp_applications["date_saved"] <= camp_applications["start_date"])
+        & (
+            camp_applications["previous_year_end_date"].isna()
+            | (camp_applications["date_saved"] > camp_applications["previous_year_end_date"])
+        )
+    ]
+
+    camp_references = camp_applications.merge(references, on="application_id")
+    camp_references = camp_references[camp_references["date_created"] <= camp_references["start_date"]]
+
+    # This ignores the possibility that an officer can have more than one
+    camp_dbs_checks = invitations.merge(dbs_checks, on="officer_id")
+    camp_dbs_checks = camp_dbs_checks[
+        (camp_dbs_checks["completed"] <= camp_dbs_checks["start_date"])
+        & (camp_dbs_checks["completed"] >= camp_dbs_checks["start_date"] - pd.Timedelta(days=settings.DBS_VALID_FOR))
+    ]
+
+    def count_by_year(frame):
+        return frame.groupby("year").size().reindex(years, fill_value=0).astype("int64").to_list()
+
     df = pd.DataFrame(
         index=years,
         data={
-            "Officer count": officer_counts,
-            "Application count": application_counts,
-            "References received in time": reference_in_time_counts,
-            "Valid DBS received in time": dbs_in_time_counts,
+            "Officer count": count_by_year(invitations),
+            "Application count": count_by_year(camp_applications),
+            "References received in time": count_by_year(camp_references),
+            "Valid DBS received in time": count_by_year(camp_dbs_checks),
         },
     )
     df["Application fraction"] = df["Application count"] / df["Officer count"]
@@ -130,6 +157,17 @@ def get_camp_officer_stats_trend(start_year, end_year) -> pd.DataFrame:
     return df
 
 
+def _to_frame(qs, fields: list[str], *, date_columns: list[str] = ()) -> pd.DataFrame:
+    """
+    Returns a DataFrame with the given fields from a QuerySet, with date
+    columns converted to datetime64 for vectorized comparisons.
+    """
+    df = pd.DataFrame.from_records(list(qs.values_list(*fields)), columns=fields)
+    for column in date_columns:
+        df[column] = pd.to_datetime(df[column])
+    return df
+
+
 def get_first(date_officer_list):
     """
     Given a list of (date, officer id) pairs,
@@ -1,10 +1,13 @@
 from datetime import date, timedelta
 
 from django.core import mail
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from cciw.cciwmain.models import Camp
 from cciw.cciwmain.tests import factories as camp_factories
+from cciw.cciwmain.tests.utils import init_query_caches
 from cciw.officers.dbs import get_officers_with_dbs_info_for_camps
 from cciw.officers.models import DBSActionLog, DBSActionLogType, DBSCheck
 from cciw.utils.tests.base import TestBase
@@ -170,6 +173,55 @@ class DbsInfoTests(TestBase):
         assert dbs_info.update_enabled_dbs_number.number == "00123"
         assert dbs_info.update_enabled_dbs_number.previous_check_good is None
 
+    def test_latest_dbs_check_used(self):
+        factories.create_application(self.officer_user, year=self.year)
+        self.officer_user.dbs_checks.create(
+            completed=self.camp.start_date - timedelta(days=10),
+            dbs_number="00123",
+            applicant_accepted=True,
+        )
+        self.officer_user.dbs_checks.create(
+            completed=self.camp.start_date - timedelta(days=365 * 10),
+            dbs_number="00456",
+            applicant_accepted=False,
+        )
+        officer, dbs_info = self.get_officer_with_dbs_info()
+        assert dbs_info.has_dbs
+        assert dbs_info.has_recent_dbs
+        assert not dbs_info.applicant_rejected
+
+    def test_old_dbs_check_not_recent(self):
+        self.officer_user.dbs_checks.create(
+            completed=self.camp.start_date - timedelta(days=365 * 10),
+            dbs_number="00123",
+        )
+        officer, dbs_info = self.get_officer_with_dbs_info()
+        assert dbs_info.has_dbs
+        assert not dbs_info.has_recent_dbs
+
+    def test_query_count(self):
+        def add_officers(count):
+            for i in range(count):
+                officer = factories.create_officer()
+                self.camp.invitations.create(officer=officer)
+                application = factories.create_application(officer, year=self.year, dbs_number="00123")
+                officer.dbs_checks.create(completed=application.date_saved, dbs_number="00123")
+                for action_type in DBSActionLogType:
+                    DBSActionLog.objects.create(officer=officer, action_type=action_type)
+
+        init_query_caches()
+        camps = list(Camp.objects.filter(year=self.year))
+        add_officers(1)
+        with CaptureQueriesContext(connection) as queries:
+            get_officers_with_dbs_info_for_camps(camps, camps)
+        query_count = len(queries)
+
+        add_officers(10)
+        with self.assertNumQueries(query_count):
+            officers_and_dbs_info = get_officers_with_dbs_info_for_camps(camps, camps)
+        assert len(officers_and_dbs_info) == 12
+        assert query_count <= 8
+
 
 class ManageDbsPageSL(SeleniumBase):
     def setUp(self):
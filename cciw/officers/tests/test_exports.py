@@ -0,0 +1,170 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from time_machine import travel
+
+from cciw.bookings import factories as bookings_factories
+from cciw.bookings.models import BookingState
+from cciw.cciwmain.tests import factories as camps_factories
+from cciw.officers.exports import (
+    delete_expired_export_jobs,
+    fail_interrupted_export_jobs,
+    fail_stalled_export_jobs,
+    run_next_export_job,
+)
+from cciw.officers.models import ExportDocument, ExportJob, ExportJobState
+from cciw.utils import xl
+from cciw.utils.tests.base import TestBase, disable_logging
+from cciw.utils.tests.webtest import WebTestBase
+
+from . import factories
+
+
+class TestExportJobs(WebTestBase):
+    def setUp(self):
+        super().setUp()
+        self.camp = camps_factories.create_camp()
+        for i in range(3):
+            bookings_factories.create_booking(camp=self.camp, state=BookingState.BOOKED)
+        self.booking_secretary = factories.create_booking_secretary()
+        self.officer_login(self.booking_secretary)
+
+    def export_url(self):
+        return reverse("cciw-officers-export_camper_data_for_year", kwargs={"year": self.camp.year})
+
+    def start_export(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.get_literal_url(self.export_url() + "?data_retention_notice_seen=1", auto_follow=False)
+        self.assertCode(302)
+        return ExportJob.objects.get()
+
+    def test_small_export_in_request(self):
+        self.get_literal_url(self.export_url() + "?data_retention_notice_seen=1")
+        assert self.last_response.content_type == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        assert ExportJob.objects.count() == 0
+
+    @override_settings(EXPORT_JOB_ROWS_THRESHOLD=2)
+    def test_large_export_in_background(self):
+        job = self.start_export()
+        assert job.user == self.booking_secretary
+        assert job.row_count == 3
+        assert job.filename == f"CCIW-bookings-{self.camp.year}.xlsx"
+        assert job.state == ExportJobState.COMPLETE
+        assert job.duration is not None
+
+        self.auto_follow()
+        self.assertTextPresent("Your export is ready")
+        self.follow_link(f"a[href=\"{reverse('cciw-officers-export_job_download', kwargs={'job_id': job.id})}\"]")
+        wkbk = xl.workbook_from_bytes(self.last_response.content)
+        assert wkbk.sheetnames == ["Notice", "All bookings"]
+        assert wkbk["All bookings"].max_row == 4
+
+    @override_settings(EXPORT_JOB_ROWS_THRESHOLD=2, EXPORT_JOBS_RUN_IN_BACKGROUND=True)
+    def test_large_export_with_worker(self):
+        job = self.start_export()
+        assert job.state == ExportJobState.PENDING
+        assert run_next_export_job()
+        job.refresh_from_db()
+        assert job.state == ExportJobState.COMPLETE
+        assert not run_next_export_job()
+
+    @override_settings(EXPORT_JOB_ROWS_THRESHOLD=2)
+    def test_polling(self):
+        with mock.patch("cciw.officers.exports.submit_export_job"):
+            job = self.start_export()
+        assert job.state == ExportJobState.PENDING
+        job_url = reverse("cciw-officers-export_job", kwargs={"job_id": job.id})
+
+        response = self.app.get(job_url, headers={"HX-Request": "true"})
+        assert "Preparing" in response.text
+        assert "<html" not in response.text
+        assert response.pyquery("#export-job-status").attr("hx-trigger") == "every 2s"
+
+        ExportJob.objects.update(state=ExportJobState.FAILED, finished_at=timezone.now())
+        response = self.app.get(job_url, headers={"HX-Request": "true"})
+        assert "there was a problem" in response.text
+        assert response.pyquery("#export-job-status").attr("hx-trigger") is None
+
+    @override_settings(EXPORT_JOB_ROWS_THRESHOLD=2)
+    def test_failed_job(self):
+        with disable_logging(), mock.patch(
+            "cciw.bookings.utils.ExcelSimpleBuilder.add_sheet_with_header_row", side_effect=ValueError("Oops")
+        ):
+            job = self.start_export()
+        assert job.state == ExportJobState.FAILED
+        assert "Oops" in job.error
+        assert job.document is None
+
+    @override_settings(EXPORT_JOB_ROWS_THRESHOLD=2)
+    def test_only_owner_can_access(self):
+        job = self.start_export()
+        self.officer_login(factories.create_booking_secretary())
+        for name in ["cciw-officers-export_job", "cciw-officers-export_job_download"]:
+            self.get_literal_url(reverse(name, kwargs={"job_id": job.id}), expect_errors=[404])
+            self.assertCode(404)
+
+    @override_settings(EXPORT_JOB_ROWS_THRESHOLD=2)
+    def test_expired(self):
+        job = self.start_export()
+        with travel(job.expires_at + timedelta(seconds=1)):
+            self.get_url("cciw-officers-export_job", job_id=job.id)
+            self.assertTextPresent("This export has expired")
+            self.get_literal_url(
+                reverse("cciw-officers-export_job_download", kwargs={"job_id": job.id}), expect_errors=[404]
+            )
+            self.assertCode(404)
+
+
+class TestExportJobCleanup(TestBase):
+    def create_job(self, **kwargs):
+        now = timezone.now()
+        return ExportJob.objects.create(
+            user=factories.create_officer(),
+            export_name="camper_data_for_year",
+            params={"year": 2000},
+            filename="test.xlsx",
+            row_count=1,
+            expires_at=now + timedelta(days=1),
+            **kwargs,
+        )
+
+    def test_delete_expired(self):
+        document = ExportDocument.objects.create(filename="test.xlsx", mimetype="text/plain", content=b"x")
+        job = self.create_job(state=ExportJobState.COMPLETE, document=document)
+        delete_expired_export_jobs(timezone.now())
+        assert ExportJob.objects.filter(id=job.id).exists()
+        assert ExportDocument.objects.filter(id=document.id).exists()
+
+        delete_expired_export_jobs(job.expires_at + timedelta(seconds=1))
+        assert not ExportJob.objects.filter(id=job.id).exists()
+        assert not ExportDocument.objects.filter(id=document.id).exists()
+
+    def test_fail_stalled(self):
+        job = self.create_job(state=ExportJobState.RUNNING)
+        now = timezone.now()
+        assert fail_stalled_export_jobs(now) == 0
+        assert fail_stalled_export_jobs(now + timedelta(hours=2)) == 1
+        job.refresh_from_db()
+        assert job.state == ExportJobState.FAILED
+
+    def test_fail_interrupted(self):
+        job = self.create_job(state=ExportJobState.RUNNING)
+        pending_job = self.create_job(state=ExportJobState.PENDING)
+        assert fail_interrupted_export_jobs(timezone.now()) == 1
+        job.refresh_from_db()
+        assert job.state == ExportJobState.FAILED
+        pending_job.refresh_from_db()
+        assert pending_job.state == ExportJobState.PENDING
+
+    def test_run_next_export_job_oldest_first(self):
+        with travel(timezone.now() - timedelta(minutes=1)):
+            first_job = self.create_job(state=ExportJobState.PENDING)
+        second_job = self.create_job(state=ExportJobState.PENDING)
+        assert run_next_export_job()
+        first_job.refresh_from_db()
+        second_job.refresh_from_db()
+        assert first_job.state == ExportJobState.COMPLETE
+        assert second_job.state == ExportJobState.PENDING
@@ -111,6 +111,30 @@ class TestSlackers(TestBase):
             }
         ]
 
+    def test_serious_slackers_date_windows(self):
+        # Boundaries should match `could_be_for_camp` for Application and DBSCheck
+        officer1 = factories.create_officer()
+        officer2 = factories.create_officer()
+        camp1 = camp_factories.create_camp(year=date.today().year - 2, officers=[officer1, officer2])
+        camp2 = camp_factories.create_camp(year=date.today().year - 1, officers=[officer1, officer2])
+
+        # Officer 1 - application on the start date, and DBS exactly at the limit of validity
+        officer1.applications.create(date_saved=camp1.start_date, finished=True)
+        officer1.dbs_checks.create(
+            dbs_number="123456", completed=camp1.start_date - timedelta(days=settings.DBS_VALID_FOR)
+        )
+        # Officer 2 - application too early, and DBS after the camps started
+        officer2.applications.create(date_saved=camp1.start_date - timedelta(days=365), finished=True)
+        officer2.dbs_checks.create(dbs_number="654321", completed=camp2.start_date + timedelta(days=1))
+
+        serious_slackers = {item["officer"]: item for item in camp_serious_slacker_list(camp2)}
+        assert serious_slackers[officer1]["missing_application_forms"] == []
+        assert serious_slackers[officer1]["last_good_apps_year"] == camp1.year
+        assert serious_slackers[officer1]["missing_dbss"] == []
+        assert serious_slackers[officer1]["last_good_dbss_year"] == camp1.year
+        assert serious_slackers[officer2]["missing_application_forms"] == [camp1]
+        assert serious_slackers[officer2]["missing_dbss"] == [camp1]
+
 
 class TestApplicationFormStatusPAge(SiteSetupMixin, WebTestBase):
     def test_page(self):
@@ -10,10 +10,18 @@ from cciw.accounts.models import User
 from cciw.cciwmain.models import Camp
 from cciw.cciwmain.tests import factories as camps_factories
 from cciw.cciwmain.tests.base import SiteSetupMixin
+from cciw.cciwmain.tests.utils import FuzzyInt, init_query_caches
 from cciw.officers.email import make_ref_form_url
-from cciw.officers.models import Referee, ReferenceAction, close_enough_referee_match, get_previous_references
+from cciw.officers.models import (
+    Referee,
+    ReferenceAction,
+    close_enough_referee_match,
+    get_previous_references,
+    get_previous_references_for_referees,
+)
 from cciw.officers.tests import factories
 from cciw.officers.tests.base import RolesSetupMixin
+from cciw.utils.tests.base import TestBase
 from cciw.utils.tests.factories import Auto
 from cciw.utils.tests.webtest import SeleniumBase, WebTestBase
 
@@ -49,6 +57,25 @@ class ManageReferencesPageWT(WebTestBase):
         self.assertTextPresent(application.referees[1].email)
         self.assertTextPresent(application.referees[1].name)
 
+    def test_page_query_count(self):
+        # The number of queries must not depend on the number of officers
+        # and referees. See also test_previous_references_for_referees
+        camp = camps_factories.create_camp(leader=(leader := factories.create_officer()))
+        for i in range(5):
+            officer = factories.create_officer()
+            factories.add_officers_to_camp(camp, [officer])
+            previous_application = factories.create_application(officer=officer, year=camp.year - 1)
+            for referee in previous_application.referees:
+                factories.create_complete_reference(referee)
+            application = factories.create_application(officer=officer, year=camp.year)
+            factories.create_complete_reference(application.referees[0])
+
+        self.officer_login(leader)
+        init_query_caches()
+        with self.assertNumQueries(FuzzyInt(1, 10)):
+            self.get_url("cciw-officers-manage_references", camp_id=camp.url_id)
+        assert len(self.last_response.pyquery("[name=request-updated-reference]")) == 5
+
     def test_page_anonymous_denied(self):
         camp = camps_factories.create_camp()
         self.get_literal_url(
@@ -273,6 +300,42 @@ def test_exact_match_with_title():
     )
 
 
+class PreviousReferences(TestBase):
+    def test_previous_references_for_referees(self):
+        officer1 = factories.create_officer()
+        officer2 = factories.create_officer()
+        old_app = factories.create_application(officer=officer1, year=2000)
+        old_reference = factories.create_complete_reference(old_app.referees[0])
+        old_reference.date_created = date(2000, 2, 1)  # More than 5 years before
+        old_reference.save()
+        prev_app1 = factories.create_application(
+            officer=officer1, year=2008, referee1_name="Rev. Joe Bloggs", referee1_email="Joe@example.com"
+        )
+        factories.create_complete_reference(prev_app1.referees[0])
+        factories.create_complete_reference(prev_app1.referees[1])
+        prev_app2 = factories.create_application(officer=officer2, year=2009)
+        factories.create_complete_reference(prev_app2.referees[0])
+
+        app1 = factories.create_application(
+            officer=officer1, year=2010, referee1_name="Joe Bloggs", referee1_email="joe@example.com"
+        )
+        app2 = factories.create_application(officer=officer2, year=2010, referee1_name="Someone New")
+        referees = [app1.referees[0], app1.referees[1], app2.referees[0], app2.referees[1]]
+        with self.assertNumQueries(1):
+            results = get_previous_references_for_referees(referees)
+        assert results == [get_previous_references(referee) for referee in referees]
+
+        (exact1, previous1), (exact2, previous2), (exact3, previous3), (exact4, previous4) = results
+        assert exact1 == prev_app1.referees[0].reference
+        assert previous1 == [prev_app1.referees[0].reference, prev_app1.referees[1].reference]
+        assert exact2 == prev_app1.referees[1].reference
+        assert previous2 == [prev_app1.referees[1].reference, prev_app1.referees[0].reference]
+        assert exact3 is None
+        assert previous3 == [prev_app2.referees[0].reference]
+        assert exact4 is None
+        assert previous4 == [prev_app2.referees[0].reference]
+
+
 def make_local_url(url):
     url = url.replace("https://" + settings.PRODUCTION_DOMAIN, "")
     assert settings.PRODUCTION_DOMAIN not in url
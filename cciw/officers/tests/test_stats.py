@@ -1,9 +1,64 @@
+import random
+from datetime import date, timedelta
+
+import pandas as pd
+from django.conf import settings
+
+from cciw.cciwmain.models import Camp
 from cciw.cciwmain.tests import factories as camp_factories
+from cciw.officers.applications import applications_for_camp
+from cciw.officers.models import Application, DBSCheck, Invitation, Referee, Reference
 from cciw.officers.stats import get_camp_officer_stats, get_camp_officer_stats_trend
 from cciw.officers.tests import factories as officer_factories
 from cciw.utils.tests.base import TestBase
 
 
+def legacy_get_camp_officer_stats_trend(start_year, end_year) -> pd.DataFrame:
+    # Previous implementation, doing queries for each camp, used to check the
+    # current one.
+    years = list(range(start_year, end_year + 1))
+    officer_counts = []
+    application_counts = []
+    reference_in_time_counts = []
+    dbs_in_time_counts = []
+    for year in years:
+        officer_count = 0
+        application_count = 0
+        reference_in_time_count = 0
+        dbs_in_time_count = 0
+        for camp in Camp.objects.filter(year=year):
+            officer_ids = list(camp.invitations.values_list("officer_id", flat=True))
+            officer_count += len(officer_ids)
+            application_form_ids = list(applications_for_camp(camp).values_list("id", flat=True))
+            application_count += len(application_form_ids)
+            reference_in_time_count += Reference.objects.filter(
+                referee__application__in=application_form_ids, date_created__lte=camp.start_date
+            ).count()
+            dbs_in_time_count += DBSCheck.objects.filter(
+                officer__in=officer_ids,
+                completed__isnull=False,
+                completed__lte=camp.start_date,
+                completed__gte=camp.start_date - timedelta(days=settings.DBS_VALID_FOR),
+            ).count()
+        officer_counts.append(officer_count)
+        application_counts.append(application_count)
+        reference_in_time_counts.append(reference_in_time_count)
+        dbs_in_time_counts.append(dbs_in_time_count)
+    df = pd.DataFrame(
+        index=years,
+        data={
+            "Officer count": officer_counts,
+            "Application count": application_counts,
+            "References received in time": reference_in_time_counts,
+            "Valid DBS received in time": dbs_in_time_counts,
+        },
+    )
+    df["Application fraction"] = df["Application count"] / df["Officer count"]
+    df["References fraction"] = df["References received in time"] / (df["Officer count"] * 2)
+    df["Valid DBS fraction"] = df["Valid DBS received in time"] / df["Officer count"]
+    return df
+
+
 class StatsTests(TestBase):
     # Very basic tests here, should expand
 
@@ -19,3 +74,84 @@ class StatsTests(TestBase):
         camp_factories.create_camp(year=2012)
         results = get_camp_officer_stats_trend(2010, 2012)
         assert results["Officer count"].to_dict() == {2010: 3, 2011: 2, 2012: 0}
+
+
+class StatsTrendParityTests(TestBase):
+    def create_data(self, seed):
+        rnd = random.Random(seed)
+        officers = [officer_factories.create_officer() for i in range(20)]
+        camps = []
+        for year in range(2010, 2016):
+            if year == 2013:
+                continue  # A year with no camps
+            for i in range(rnd.randint(1, 3)):
+                start_date = date(year, 7, 1) + timedelta(days=rnd.randint(0, 40))
+                camps.append(camp_factories.create_camp(start_date=start_date))
+
+        invitations = []
+        applications = []
+        dbs_checks = []
+        for camp in camps:
+            for officer in rnd.sample(officers, rnd.randint(0, 10)):
+                invitations.append(Invitation(camp=camp, officer=officer))
+                # Dates around the boundaries of the windows
+                for days_before in rnd.sample([0, 1, 100, 200, 364, 365, 366], rnd.randint(0, 2)):
+                    applications.append(
+                        Application(
+                            officer=officer,
+                            finished=rnd.random() < 0.9,
+                            date_saved=camp.start_date - timedelta(days=days_before),
+                        )
+                    )
+                for days_before in rnd.sample(
+                    [-1, 0, 1, 500, settings.DBS_VALID_FOR, settings.DBS_VALID_FOR + 1], rnd.randint(0, 2)
+                ):
+                    dbs_checks.append(
+                        DBSCheck(
+                            officer=officer,
+                            dbs_number="123",
+                            completed=camp.start_date - timedelta(days=days_before),
+                        )
+                    )
+        Invitation.objects.bulk_create(invitations, ignore_conflicts=True)
+        Application.objects.bulk_create(applications)
+        DBSCheck.objects.bulk_create(dbs_checks)
+        referees = Referee.objects.bulk_create(
+            [Referee(application=app, referee_number=num) for app in applications for num in [1, 2]]
+        )
+        Reference.objects.bulk_create(
+            [
+                Reference(
+                    referee=referee,
+                    referee_name="Referee",
+                    how_long_known="A long time",
+                    capacity_known="Pastor",
+                    known_offences=False,
+                    capability_children="Wonderful",
+                    character="Good",
+                    concerns="None",
+                    date_created=referee.application.date_saved + timedelta(days=rnd.choice([0, 5, 30, 400])),
+                )
+                for referee in referees
+                if rnd.random() < 0.8
+            ]
+        )
+
+    def test_parity(self):
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                Camp.objects.all().delete()
+                self.create_data(seed)
+                pd.testing.assert_frame_equal(
+                    get_camp_officer_stats_trend(2009, 2016), legacy_get_camp_officer_stats_trend(2009, 2016)
+                )
+
+    def test_empty(self):
+        pd.testing.assert_frame_equal(
+            get_camp_officer_stats_trend(2010, 2012), legacy_get_camp_officer_stats_trend(2010, 2012)
+        )
+
+    def test_query_count(self):
+        self.create_data(0)
+        with self.assertNumQueries(5):
+            get_camp_officer_stats_trend(2009, 2016)
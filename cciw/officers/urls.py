@@ -125,6 +125,9 @@ urlpatterns = [
         views.create_reference_thanks,
         name="cciw-officers-create_reference_thanks",
     ),
+    # Exports
+    path("exports/<int:job_id>/", views.export_job, name="cciw-officers-export_job"),
+    path("exports/<int:job_id>/download/", views.export_job_download, name="cciw-officers-export_job_download"),
     # Officer other
     path("files/<path:path>", views.officer_files, name="cciw-officers-officer_files"),
     path("info/", views.officer_info, name="cciw-officers-info"),
@@ -221,4 +224,6 @@ urlpatterns = [
         views.data_erasure_request_execute,
         name="cciw-officers-data_erasure_request_execute",
     ),
+    path("query-profile/", views.query_profile, name="cciw-officers-query_profile"),
+    path("query-profile/reset/", views.query_profile_reset, name="cciw-officers-query_profile_reset"),
 ]
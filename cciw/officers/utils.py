@@ -1,7 +1,11 @@
 """
 Utility functions for officers app.
 """
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
 
 from cciw.accounts.models import User
 from cciw.cciwmain.models import Camp
@@ -58,13 +62,42 @@ def camp_serious_slacker_list(camp: Camp) -> list[User]:
         Application.objects.filter(finished=True, officer__in=officers, date_saved__lte=latest_camp.start_date)
     )
 
-    all_received_refs = list(Reference.objects.select_related("referee").filter(referee__application__in=all_apps))
-
-    all_dbss = list(DBSCheck.objects.filter(officer__in=officers))
+    received_ref_application_ids = list(
+        Reference.objects.filter(referee__application__in=all_apps).values_list("referee__application_id", flat=True)
+    )
 
-    received_ref_dict = defaultdict(list)
-    for ref in all_received_refs:
-        received_ref_dict[ref.referee.application_id].append(ref)
+    all_dbss = list(DBSCheck.objects.filter(officer__in=officers).values_list("officer_id", "completed"))
+
+    received_ref_counts = defaultdict(int)
+    for application_id in received_ref_application_ids:
+        received_ref_counts[application_id] += 1
+
+    # Rather than scanning all the invitations/applications/DBS checks for each
+    # camp, we build indexes up front, so that the work done is proportional
+    # to the number of invitations:
+    # - invitations grouped by camp
+    # - sorted dates of applications (and of applications with two references)
+    #   for each officer, which we can bisect to find one in the window for a camp.
+    # - sorted dates of DBS checks for each officer, similarly.
+    # The windows here must match `could_be_for_camp` for Application and DBSCheck.
+    invitations_by_camp = defaultdict(dict)
+    for i in all_invitations:
+        invitations_by_camp[i.camp_id].setdefault(i.officer_id, i.officer)
+
+    application_dates = defaultdict(list)
+    application_with_references_dates = defaultdict(list)
+    for app in all_apps:
+        application_dates[app.officer_id].append(app.date_saved)
+        if received_ref_counts[app.id] >= 2:
+            application_with_references_dates[app.officer_id].append(app.date_saved)
+
+    dbs_dates = defaultdict(list)
+    for officer_id, completed in all_dbss:
+        dbs_dates[officer_id].append(completed)
+
+    for date_index in [application_dates, application_with_references_dates, dbs_dates]:
+        for dates in date_index.values():
+            dates.sort()
 
     # For each officer, we need to build a list of the years when they were on
     # camp but failed to submit an application form.
@@ -85,22 +118,21 @@ def camp_serious_slacker_list(camp: Camp) -> list[User]:
     officer_dbss_last_good_year = {}
 
     for c in relevant_camps:
-        camp_officers = {i.officer for i in all_invitations if i.camp == c}
-        camp_applications = [a for a in all_apps if a.could_be_for_camp(c)]
-        officers_with_applications = {a.officer for a in camp_applications}
-        officers_with_two_references = {a.officer for a in camp_applications if len(received_ref_dict[a.id]) >= 2}
-        officers_with_dbss = {dbs.officer for dbs in all_dbss if dbs.could_be_for_camp(c)}
-
-        for o in camp_officers:
-            if o in officers_with_applications:
+        # Application: date_saved in (start_date - 365 days, start_date]
+        app_window = (c.start_date - timedelta(days=365), c.start_date)
+        # DBS: completed in [start_date - DBS_VALID_FOR, start_date]
+        dbs_window = (c.start_date - timedelta(days=settings.DBS_VALID_FOR), c.start_date)
+
+        for officer_id, o in invitations_by_camp[c.id].items():
+            if _has_date_in_range(application_dates[officer_id], *app_window, include_start=False):
                 officer_apps_present[o].append(c)
             else:
                 officer_apps_missing[o].append(c)
-            if o in officers_with_two_references:
+            if _has_date_in_range(application_with_references_dates[officer_id], *app_window, include_start=False):
                 officer_refs_present[o].append(c)
             else:
                 officer_refs_missing[o].append(c)
-            if o in officers_with_dbss:
+            if _has_date_in_range(dbs_dates[officer_id], *dbs_window, include_start=True):
                 officer_dbss_present[o].append(c)
             else:
                 officer_dbss_missing[o].append(c)
@@ -158,6 +190,15 @@ def camp_serious_slacker_list(camp: Camp) -> list[User]:
     ]
 
 
+def _has_date_in_range(sorted_dates: list[date], start: date, end: date, *, include_start: bool) -> bool:
+    """
+    Returns True if `sorted_dates` contains a date between `start` and `end`,
+    with `end` always included.
+    """
+    idx = (bisect_left if include_start else bisect_right)(sorted_dates, start)
+    return idx < len(sorted_dates) and sorted_dates[idx] <= end
+
+
 def officer_data_to_spreadsheet(camp: Camp):
     spreadsheet = ExcelSimpleBuilder()
     # Import here to avoid import cycle
@@ -39,6 +39,7 @@ from .dbs import (
     mark_dbs_sent,
     request_dbs_form_action,
 )
+from .exports import export_job, export_job_download
 from .general import officer_files, officer_info
 from .leaders import (
     booking_ages_stats,
@@ -68,6 +69,12 @@ from .leaders import (
 )
 from .menus import index, leaders_index
 from .referees import create_reference, create_reference_thanks
-from .webmaster import data_erasure_request_execute, data_erasure_request_plan, data_erasure_request_start
+from .webmaster import (
+    data_erasure_request_execute,
+    data_erasure_request_plan,
+    data_erasure_request_start,
+    query_profile,
+    query_profile_reset,
+)
 
 cciw_password_reset = PasswordResetView.as_view(form_class=CciwPasswordResetForm)
@@ -5,15 +5,9 @@ import pandas_highcharts.core
 from django.contrib.admin.views.decorators import staff_member_required
 from django.template.response import TemplateResponse
 from django.urls import reverse
-from django.utils import timezone
 
 from cciw.bookings.models import Booking, Price, is_booking_open
-from cciw.bookings.stats import get_booking_summary_stats
-from cciw.bookings.utils import (
-    addresses_for_mailing_list,
-    payments_to_spreadsheet,
-    year_bookings_to_spreadsheet,
-)
+from cciw.bookings.stats import get_booking_stats_freshness, get_booking_summary_stats
 from cciw.cciwmain.decorators import json_response
 from cciw.cciwmain.models import Camp
 from cciw.utils.spreadsheet import ExcelFromDataFrameBuilder
@@ -26,10 +20,9 @@ from .utils.auth import (
 )
 from .utils.breadcrumbs import officers_breadcrumbs, with_breadcrumbs
 from .utils.data_retention import DataRetentionNotice, show_data_retention_notice
+from .utils.exports import EXPORT_PAYMENT_DATE_FORMAT, export_spreadsheet_response
 from .utils.spreadsheets import spreadsheet_response
 
-EXPORT_PAYMENT_DATE_FORMAT = "%Y-%m-%d"
-
 BOOKING_STATS_PREVIOUS_YEARS = 4
 
 
@@ -37,11 +30,7 @@ BOOKING_STATS_PREVIOUS_YEARS = 4
 @booking_secretary_required
 @show_data_retention_notice(DataRetentionNotice.CAMPERS, "Camper data")
 def export_camper_data_for_year(request, year: int):
-    return spreadsheet_response(
-        year_bookings_to_spreadsheet(year),
-        f"CCIW-bookings-{year}",
-        notice=DataRetentionNotice.CAMPERS,
-    )
+    return export_spreadsheet_response(request, "camper_data_for_year", year=year)
 
 
 # treasurer gets to see these to know how much money
@@ -85,17 +74,7 @@ def booking_secretary_reports(request, year: int):
 
 @booking_secretary_required
 def export_payment_data(request):
-    date_start = request.GET["start"]
-    date_end = request.GET["end"]
-    date_start = datetime.strptime(date_start, EXPORT_PAYMENT_DATE_FORMAT).replace(
-        tzinfo=timezone.get_default_timezone()
-    )
-    date_end = datetime.strptime(date_end, EXPORT_PAYMENT_DATE_FORMAT).replace(tzinfo=timezone.get_default_timezone())
-    return spreadsheet_response(
-        payments_to_spreadsheet(date_start, date_end),
-        f"CCIW-payments-{date_start:%Y-%m-%d}-to-{date_end:%Y-%m-%d}",
-        notice=DataRetentionNotice.CAMPERS,
-    )
+    return export_spreadsheet_response(request, "payment_data", start=request.GET["start"], end=request.GET["end"])
 
 
 @staff_member_required
@@ -112,6 +91,7 @@ def booking_summary_stats(request, start_year: int, end_year: int):
             "start_year": start_year,
             "end_year": end_year,
             "chart_data": pandas_highcharts.core.serialize(chart_data, output_type="json"),
+            "stats_freshness": get_booking_stats_freshness(range(start_year, end_year + 1)),
         },
     )
 
@@ -210,6 +190,4 @@ def get_booking_expected_amount_due(request):
 
 @cciw_secretary_or_booking_secretary_required
 def brochure_mailing_list(request, year: int):
-    return spreadsheet_response(
-        addresses_for_mailing_list(year), f"CCIW-mailing-list-{year}", notice=DataRetentionNotice.CAMPERS
-    )
+    return export_spreadsheet_response(request, "brochure_mailing_list", year=year)
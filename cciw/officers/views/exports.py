@@ -0,0 +1,46 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404
+from django.template.response import TemplateResponse
+from django.utils import timezone
+
+from cciw.documents.views import document_response
+from cciw.officers.exports import fail_stalled_export_jobs
+from cciw.officers.models import ExportJob
+from cciw.utils.views import for_htmx
+
+from .utils.breadcrumbs import officers_breadcrumbs, with_breadcrumbs
+
+
+def _get_export_job(request, job_id: int) -> ExportJob:
+    # Jobs are only visible to the user who created them
+    try:
+        return ExportJob.objects.get(id=job_id, user=request.user)
+    except ExportJob.DoesNotExist:
+        raise Http404
+
+
+@staff_member_required
+@with_breadcrumbs(officers_breadcrumbs)
+@for_htmx(use_block="status")
+def export_job(request, job_id: int):
+    now = timezone.now()
+    job = _get_export_job(request, job_id)
+    if not job.is_finished and fail_stalled_export_jobs(now):
+        job.refresh_from_db()
+    return TemplateResponse(
+        request,
+        "cciw/officers/export_job.html",
+        {
+            "title": f"Export {job.filename}",
+            "job": job,
+            "expired": job.is_expired(now),
+        },
+    )
+
+
+@staff_member_required
+def export_job_download(request, job_id: int):
+    job = _get_export_job(request, job_id)
+    if not job.is_complete or job.is_expired(timezone.now()) or job.document_id is None:
+        raise Http404
+    return document_response(request, job.document)
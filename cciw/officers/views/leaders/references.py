@@ -90,10 +90,9 @@ def manage_references(request, camp_id: CampId):
         ]
         # Note that we add this as an attribute because we also need to sort by
         # the same key client side.
-        if referee.reference_is_received():
-            continue  # Don't need the following
-        # decorate each Reference with suggested previous References.
-        add_previous_references(referee)
+
+    # decorate each Reference with suggested previous References.
+    add_previous_references([referee for referee in all_referees if not referee.reference_is_received()])
 
     all_referees.sort(key=lambda referee: referee.sort_key)
 
@@ -5,7 +5,7 @@ from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.template.response import TemplateResponse
 from django.urls import reverse
 
-from cciw.bookings.stats import get_booking_ages_stats, get_booking_progress_stats
+from cciw.bookings.stats import get_booking_ages_stats, get_booking_progress_stats, get_booking_stats_freshness
 from cciw.cciwmain.common import CampId
 from cciw.cciwmain.models import Camp
 from cciw.utils.spreadsheet import ExcelFromDataFrameBuilder
@@ -142,6 +142,7 @@ def booking_progress_stats(request, start_year: int = None, end_year: int = None
                 title="Bookings by days relative to start of camp",
                 output_type="json",
             ),
+            "stats_freshness": _get_booking_stats_freshness(start_year, end_year, camp_objs),
         },
     )
 
@@ -213,6 +214,7 @@ def booking_ages_stats(
             "chart_data": pandas_highcharts.core.serialize(data, title="Age of campers", output_type="json"),
             "colors_data": colors,
             "stack_columns": stack_columns,
+            "stats_freshness": _get_booking_stats_freshness(start_year, end_year, camps),
         },
     )
 
@@ -239,6 +241,13 @@ def _get_booking_ages_stats_from_params(start_year, end_year, camp_ids) -> tuple
     return start_year, end_year, camps, data
 
 
+def _get_booking_stats_freshness(start_year, end_year, camps):
+    if camps is not None:
+        return get_booking_stats_freshness({camp.year for camp in camps})
+    else:
+        return get_booking_stats_freshness(range(start_year, end_year + 1))
+
+
 def _parse_year_or_camp_ids(start_year, end_year, camp_ids):
     if camp_ids is not None:
         return None, None, [get_camp_or_404(camp_id) for camp_id in camp_ids]
@@ -65,7 +65,7 @@ def leaders_index(request):
     show_all = "show_all" in request.GET
     camps: Iterable[Camp] = Camp.objects.all().include_other_years_info()
     if not show_all:
-        camps = camps.filter(id__in=[c.id for c in user.camps_as_admin_or_leader])
+        camps = camps.filter(id__in=user.capabilities.camp_ids)
     last_existing_year = Camp.objects.order_by("-year")[0].year
 
     return TemplateResponse(
@@ -0,0 +1,101 @@
+"""
+Spreadsheet exports. Large ones are built in the background, see
+cciw.officers.exports
+"""
+from collections.abc import Callable
+from datetime import datetime, timedelta
+
+import attr
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseRedirect
+from django.urls import reverse
+from django.utils import timezone
+
+from cciw.bookings.models import Booking, Payment
+from cciw.bookings.utils import addresses_for_mailing_list, payments_to_spreadsheet, year_bookings_to_spreadsheet
+from cciw.officers.exports import start_export_job
+from cciw.utils.spreadsheet import ExcelBuilder
+
+from .data_retention import DataRetentionNotice
+from .spreadsheets import add_notice, spreadsheet_response
+
+EXPORT_PAYMENT_DATE_FORMAT = "%Y-%m-%d"
+
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class SpreadsheetExport:
+    """
+    Definition of an export. The callables all take the same keyword
+    arguments, which must be JSON serializable so they can be stored on ExportJob.
+    """
+
+    build: Callable[..., ExcelBuilder]
+    get_filename: Callable[..., str]
+    get_row_count: Callable[..., int]
+    notice: DataRetentionNotice | None
+
+
+def build_export(export_name: str, params: dict) -> ExcelBuilder:
+    export = EXPORTS[export_name]
+    builder = export.build(**params)
+    add_notice(builder, export.notice)
+    return builder
+
+
+def export_spreadsheet_response(request, export_name: str, **params) -> HttpResponse:
+    """
+    Returns the spreadsheet for an export, or for large datasets, starts a
+    background job and redirects to its page.
+    """
+    export = EXPORTS[export_name]
+    row_count = export.get_row_count(**params)
+    if row_count <= settings.EXPORT_JOB_ROWS_THRESHOLD:
+        return spreadsheet_response(export.build(**params), export.get_filename(**params), notice=export.notice)
+    job = start_export_job(
+        request.user,
+        export_name,
+        params,
+        filename=f"{export.get_filename(**params)}.{ExcelBuilder.file_ext}",
+        row_count=row_count,
+    )
+    return HttpResponseRedirect(reverse("cciw-officers-export_job", kwargs={"job_id": job.id}))
+
+
+# --- Export definitions ---
+
+
+def _parse_export_date(value: str) -> datetime:
+    return datetime.strptime(value, EXPORT_PAYMENT_DATE_FORMAT).replace(tzinfo=timezone.get_default_timezone())
+
+
+def _payments_in_range(start: str, end: str):
+    # See payments_to_spreadsheet
+    return Payment.objects.filter(
+        created_at__gte=_parse_export_date(start),
+        created_at__lt=_parse_export_date(end) + timedelta(days=1),
+        source__isnull=False,
+    )
+
+
+EXPORTS: dict[str, SpreadsheetExport] = {
+    "camper_data_for_year": SpreadsheetExport(
+        build=lambda *, year: year_bookings_to_spreadsheet(year),
+        get_filename=lambda *, year: f"CCIW-bookings-{year}",
+        get_row_count=lambda *, year: Booking.objects.filter(camp__year=year).confirmed().count(),
+        notice=DataRetentionNotice.CAMPERS,
+    ),
+    "payment_data": SpreadsheetExport(
+        build=lambda *, start, end: payments_to_spreadsheet(_parse_export_date(start), _parse_export_date(end)),
+        get_filename=lambda *, start, end: (
+            f"CCIW-payments-{_parse_export_date(start):%Y-%m-%d}-to-{_parse_export_date(end):%Y-%m-%d}"
+        ),
+        get_row_count=lambda *, start, end: _payments_in_range(start, end).count(),
+        notice=DataRetentionNotice.CAMPERS,
+    ),
+    "brochure_mailing_list": SpreadsheetExport(
+        build=lambda *, year: addresses_for_mailing_list(year),
+        get_filename=lambda *, year: f"CCIW-mailing-list-{year}",
+        get_row_count=lambda *, year: Booking.objects.filter(camp__year=year - 1).count(),
+        notice=DataRetentionNotice.CAMPERS,
+    ),
+}
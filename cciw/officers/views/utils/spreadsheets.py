@@ -1,8 +1,6 @@
-import openpyxl
-from django.http import HttpResponse
+from django.http import FileResponse
 
 from cciw.officers.views.utils.data_retention import DATA_RETENTION_NOTICES_TXT, DataRetentionNotice
-from cciw.utils import xl
 from cciw.utils.spreadsheet import ExcelBuilder
 
 
@@ -11,26 +9,20 @@ def spreadsheet_response(
     filename: str,
     *,
     notice: DataRetentionNotice | None,
-) -> HttpResponse:
-    output = builder.to_bytes()
-
+) -> FileResponse:
+    add_notice(builder, notice)
+    # Streamed from the file, rather than read into memory.
+    return FileResponse(
+        builder.to_file(),
+        as_attachment=True,
+        filename=f"{filename}.{builder.file_ext}",
+        content_type=builder.mimetype,
+    )
+
+
+def add_notice(builder: ExcelBuilder, notice: DataRetentionNotice | None) -> None:
     if notice is not None:
-        workbook: openpyxl.Workbook = xl.workbook_from_bytes(builder.to_bytes())
-        sheet = workbook.create_sheet("Notice", 0)
-        c_header = sheet.cell(1, 1)
-        c_header.value = "Data retention notice:"
-        c_header.font = xl.header_font
-
-        for row_idx, line in enumerate(notice_to_lines(notice), start=3):
-            c = sheet.cell(row_idx, 1)
-            c.value = line
-            c.font = xl.default_font
-        sheet.column_dimensions["A"].width = 100
-
-        output = xl.workbook_to_bytes(workbook)
-    response = HttpResponse(output, content_type=builder.mimetype)
-    response["Content-Disposition"] = f"attachment; filename={filename}.{builder.file_ext}"
-    return response
+        builder.add_notice_sheet("Data retention notice:", notice_to_lines(notice))
 
 
 def notice_to_lines(notice: DataRetentionNotice) -> list[str]:
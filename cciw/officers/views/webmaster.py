@@ -1,11 +1,14 @@
 from django import forms
+from django.conf import settings
 from django.db import transaction
-from django.http import HttpRequest
+from django.http import HttpRequest, HttpResponseRedirect
 from django.template.response import TemplateResponse
+from django.urls import reverse
 from django.views.decorators.http import require_POST
 
 from cciw.data_retention.erasure_requests import data_erasure_request_create_plan, data_erasure_request_search
 from cciw.data_retention.models import ErasureExecutionLog
+from cciw.query_profiler import ORDERINGS, get_query_profiles, reset_query_profiles
 
 from .utils.auth import webmaster_required
 
@@ -93,3 +96,28 @@ def data_erasure_request_execute(request: HttpRequest):
             "erasure_log": erasure_log,
         },
     )
+
+
+@webmaster_required
+def query_profile(request: HttpRequest):
+    order_by = request.GET.get("order_by", "duplicates")
+    if order_by not in ORDERINGS:
+        order_by = "duplicates"
+    return TemplateResponse(
+        request,
+        "cciw/officers/query_profile.html",
+        {
+            "title": "Query profile",
+            "profiles": get_query_profiles(order_by=order_by),
+            "order_by": order_by,
+            "orderings": list(ORDERINGS),
+            "sample_rate": settings.QUERY_PROFILER_SAMPLE_RATE,
+        },
+    )
+
+
+@webmaster_required
+@require_POST
+def query_profile_reset(request: HttpRequest):
+    reset_query_profiles()
+    return HttpResponseRedirect(reverse("cciw-officers-query_profile"))
@@ -0,0 +1,184 @@
+"""
+Sampling query profiler, for finding views that do too many queries in production.
+
+A fraction of requests (settings.QUERY_PROFILER_SAMPLE_RATE) are recorded using
+cciw.db_debug.QueryRecorder. For each URL name, we keep totals of the number of
+queries, DB time and duplicate queries in the cache, which is shared between
+web server processes, along with the duplicate query groups for the request with
+the most queries. These are shown by `manage.py query_profile` and on the
+webmaster's query profile page.
+
+Totals are updated with cache.incr(), which is atomic with memcached. Other
+values can lose updates from concurrent requests, which doesn't matter here.
+"""
+import logging
+import random
+
+import attr
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from cciw.db_debug import QueryInfo, QueryRecorder, group_query_info
+
+logger = logging.getLogger(__name__)
+
+QUERY_PROFILER_CACHE_KEY_PREFIX = "cciw.query_profiler"
+QUERY_PROFILER_URL_NAMES_CACHE_KEY = f"{QUERY_PROFILER_CACHE_KEY_PREFIX}.url_names"
+# Stored as integers so that they can be updated with cache.incr():
+COUNTERS = ["requests", "queries", "duplicates", "db_time_us"]
+MAX_DUPLICATE_GROUPS = 10
+MAX_SQL_LENGTH = 2000
+UNRESOLVED_URL_NAME = "<unresolved>"
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class DuplicateQueryGroup:
+    sql: str
+    count: int
+    db_time: float
+    stacktrace: str
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ViewQueryProfile:
+    url_name: str
+    requests: int
+    queries: int
+    duplicates: int
+    db_time: float
+    max_queries: int
+    # From the sampled request with the most queries:
+    duplicate_groups: list[DuplicateQueryGroup]
+
+    @property
+    def mean_queries(self) -> float:
+        return self.queries / self.requests if self.requests else 0.0
+
+    @property
+    def mean_duplicates(self) -> float:
+        return self.duplicates / self.requests if self.requests else 0.0
+
+    @property
+    def mean_db_time(self) -> float:
+        return self.db_time / self.requests if self.requests else 0.0
+
+
+# Sort keys for "worst offenders", by name:
+ORDERINGS = {
+    "duplicates": lambda profile: profile.mean_duplicates,
+    "queries": lambda profile: profile.mean_queries,
+    "db_time": lambda profile: profile.mean_db_time,
+    "total_db_time": lambda profile: profile.db_time,
+}
+
+
+def query_profiler_middleware(get_response):
+    def middleware(request):
+        if random.random() >= settings.QUERY_PROFILER_SAMPLE_RATE:
+            return get_response(request)
+
+        recorder = QueryRecorder(stacktraces=settings.QUERY_PROFILER_STACKTRACES)
+        with connection.execute_wrapper(recorder):
+            response = get_response(request)
+        try:
+            record_query_profile(get_url_name(request), recorder.queries)
+        except Exception:
+            # The profiler must never break the site
+            logger.exception("Error recording query profile")
+        return response
+
+    return middleware
+
+
+def get_url_name(request) -> str:
+    resolver_match = getattr(request, "resolver_match", None)
+    if resolver_match is None or not resolver_match.view_name:
+        return UNRESOLVED_URL_NAME
+    return resolver_match.view_name
+
+
+def record_query_profile(url_name: str, queries: list[QueryInfo]) -> None:
+    timeout = settings.QUERY_PROFILER_RETENTION.total_seconds()
+    groups = group_query_info(queries)
+    db_time = sum(q.duration for q in queries if q.duration)
+    amounts = {
+        "requests": 1,
+        "queries": len(queries),
+        "duplicates": len(queries) - len(groups),
+        "db_time_us": round(db_time * 1_000_000),
+    }
+    for counter, amount in amounts.items():
+        key = _cache_key(url_name, counter)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            # Missing or expired. If another request adds it first, we lose
+            # this amount, which is fine.
+            cache.add(key, amount, timeout=timeout)
+
+    worst_key = _cache_key(url_name, "worst")
+    existing = cache.get_many([QUERY_PROFILER_URL_NAMES_CACHE_KEY, worst_key])
+    url_names = existing.get(QUERY_PROFILER_URL_NAMES_CACHE_KEY, set())
+    if url_name not in url_names:
+        cache.set(QUERY_PROFILER_URL_NAMES_CACHE_KEY, url_names | {url_name}, timeout=timeout)
+    worst = existing.get(worst_key)
+    if worst is None or len(queries) > worst["queries"]:
+        cache.set(
+            worst_key,
+            {
+                "queries": len(queries),
+                # Plain dicts, so that cached values survive code changes
+                "duplicate_groups": [
+                    dict(
+                        # Not formatted with params, which could contain personal data
+                        sql=group[0].sql[:MAX_SQL_LENGTH],
+                        count=len(group),
+                        db_time=sum(q.duration for q in group if q.duration),
+                        stacktrace=group[0].stacktrace,
+                    )
+                    for group in sorted(groups, key=len, reverse=True)[:MAX_DUPLICATE_GROUPS]
+                    if len(group) > 1
+                ],
+            },
+            timeout=timeout,
+        )
+
+
+def get_query_profiles(order_by: str = "duplicates") -> list[ViewQueryProfile]:
+    """
+    Returns the recorded profiles, worst first.
+    """
+    url_names = sorted(cache.get(QUERY_PROFILER_URL_NAMES_CACHE_KEY, set()))
+    values = cache.get_many([_cache_key(url_name, name) for url_name in url_names for name in COUNTERS + ["worst"]])
+    profiles = []
+    for url_name in url_names:
+        counts = {name: values.get(_cache_key(url_name, name), 0) for name in COUNTERS}
+        if not counts["requests"]:
+            continue
+        worst = values.get(_cache_key(url_name, "worst"), {"queries": 0, "duplicate_groups": []})
+        profiles.append(
+            ViewQueryProfile(
+                url_name=url_name,
+                requests=counts["requests"],
+                queries=counts["queries"],
+                duplicates=counts["duplicates"],
+                db_time=counts["db_time_us"] / 1_000_000,
+                max_queries=worst["queries"],
+                duplicate_groups=[DuplicateQueryGroup(**group) for group in worst["duplicate_groups"]],
+            )
+        )
+    profiles.sort(key=ORDERINGS[order_by], reverse=True)
+    return profiles
+
+
+def reset_query_profiles() -> None:
+    url_names = cache.get(QUERY_PROFILER_URL_NAMES_CACHE_KEY, set())
+    cache.delete_many(
+        [QUERY_PROFILER_URL_NAMES_CACHE_KEY]
+        + [_cache_key(url_name, name) for url_name in url_names for name in COUNTERS + ["worst"]]
+    )
+
+
+def _cache_key(url_name: str, name: str) -> str:
+    return f"{QUERY_PROFILER_CACHE_KEY_PREFIX}:{url_name}:{name}"
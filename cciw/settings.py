@@ -470,6 +470,16 @@ else:
     # easier:
     INCOMING_MAIL_DOMAIN = "mailtest.cciw.co.uk"
 
+# Incoming mail is handled by a worker process. See cciw.mail.incoming
+INCOMING_MAIL_WORKER_THREADS = 4
+INCOMING_MAIL_POLL_INTERVAL = timedelta(seconds=10)
+INCOMING_MAIL_METRICS_INTERVAL = timedelta(minutes=15)
+# Messages being processed for longer than this are assumed to have been lost
+# by a worker that died, and are processed again:
+INCOMING_MAIL_PROCESSING_TIMEOUT = timedelta(minutes=30)
+INCOMING_MAIL_MAX_ATTEMPTS = 3
+# Finished messages are kept for this long, for deduplication and metrics:
+INCOMING_MAIL_KEEP_FOR = timedelta(days=7)
 
 RECREATE_ROUTES_AUTOMATICALLY = LIVEBOX
 
@@ -495,8 +505,9 @@ SECURE_DOWNLOAD_URL_BASE = "/protected/"  # See nginx conf
 
 _MIDDLEWARE = [
     (DEVBOX and DEBUG, "cciw.db_debug.db_debug_middleware"),
+    (True, "cciw.query_profiler.query_profiler_middleware"),
     (True, "django.middleware.security.SecurityMiddleware"),
-    (True, "django.middleware.gzip.GZipMiddleware"),
+    (True, "cciw.middleware.gzip.GZipMiddleware"),
     (USE_DEBUG_TOOLBAR and DEBUG, "debug_toolbar.middleware.DebugToolbarMiddleware"),
     (True, "django.contrib.sessions.middleware.SessionMiddleware"),
     (True, "django.middleware.common.CommonMiddleware"),
@@ -513,6 +524,11 @@ _MIDDLEWARE = [
 
 MIDDLEWARE = tuple(val for (test, val) in _MIDDLEWARE if test)
 
+# Fraction of requests whose queries are recorded. See cciw.query_profiler
+QUERY_PROFILER_SAMPLE_RATE = 0.02 if LIVEBOX else 0
+QUERY_PROFILER_STACKTRACES = False
+QUERY_PROFILER_RETENTION = timedelta(days=14)
+
 # == MESSAGES ==
 
 MESSAGE_STORAGE = "django.contrib.messages.storage.fallback.FallbackStorage"
@@ -578,6 +594,11 @@ BOOKING_FULL_PAYMENT_DUE = timedelta(days=90)
 BOOKING_FULL_PAYMENT_DUE_DISPLAY = "3 months"
 BOOKING_EMAIL_REMINDER_FREQUENCY = timedelta(days=3)
 LATE_BOOKING_THRESHOLD = timedelta(days=14)
+# Booking statistics are rebuilt at most this often when bookings change. See cciw.bookings.stats
+BOOKING_STATS_REFRESH_INTERVAL = timedelta(minutes=10)
+# Queued payments are processed in transactions of at most this many payments,
+# which concurrent processes share. See cciw.bookings.models.process_all_payments
+PAYMENT_PROCESSING_BATCH_SIZE = 100
 
 
 # == DBS ==
@@ -586,6 +607,17 @@ LATE_BOOKING_THRESHOLD = timedelta(days=14)
 EXTERNAL_DBS_OFFICER = SECRETS["EXTERNAL_DBS_OFFICER"]
 
 
+# == Exports ==
+
+# Spreadsheet exports with more rows than this are built by a background job,
+# instead of in the request. See cciw.officers.exports
+EXPORT_JOB_ROWS_THRESHOLD = 2000
+EXPORT_JOB_WORKERS = 2
+EXPORT_JOB_POLL_INTERVAL = timedelta(seconds=10)
+EXPORT_JOB_EXPIRES = timedelta(days=1)
+EXPORT_JOBS_RUN_IN_BACKGROUND = True
+
+
 # == Third party ==
 
 # Wiki
@@ -677,3 +709,8 @@ if TESTS_RUNNING:
     faulthandler.register(signal.SIGUSR1)
 
     CAPTCHA_TEST_MODE = True
+
+    # There is no worker in tests, so jobs are run on commit:
+    EXPORT_JOBS_RUN_IN_BACKGROUND = False
+
+    BOOKING_STATS_REFRESH_INTERVAL = timedelta(0)
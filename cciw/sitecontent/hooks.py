@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+
+from cciw.cciwmain import pagecache
+from cciw.utils.cache import clear_cache_now_and_on_commit
+
+from .models import HtmlChunk, MenuLink
+
+
+def site_content_changed(sender, **kwargs):
+    # Menus and HTML chunks appear on cached public pages.
+    clear_cache_now_and_on_commit(pagecache.clear_page_cache)
+
+
+for model in [MenuLink, HtmlChunk]:
+    post_save.connect(site_content_changed, sender=model)
+    post_delete.connect(site_content_changed, sender=model)
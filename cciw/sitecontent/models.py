@@ -67,3 +67,6 @@ class HtmlChunk(models.Model):
     class Meta:
         verbose_name = "HTML chunk"
         ordering = ["name"]
+
+
+from . import hooks  # noqa isort:skip
@@ -1,6 +1,7 @@
 from django.http import Http404
 from django.template.response import TemplateResponse
 
+from cciw.cciwmain.pagecache import get_or_render
 from cciw.sitecontent.models import MenuLink
 
 
@@ -10,22 +11,29 @@ def find(request, path: str, template_name="cciw/chunk_page.html"):
     else:
         url = "/" + path + "/"
 
-    try:
-        link = MenuLink.objects.get(url=url)
-    except MenuLink.DoesNotExist:
-        raise Http404()
+    def get_page():
+        try:
+            link = MenuLink.objects.get(url=url)
+        except MenuLink.DoesNotExist:
+            return None
+
+        try:
+            chunk = link.htmlchunk_set.filter()[0]
+        except IndexError:
+            return None
+        return chunk.page_title, chunk.render(request)
 
-    try:
-        chunk = link.htmlchunk_set.filter()[0]
-    except IndexError:
+    page = get_or_render(request, "chunk_page", [url], get_page)
+    if page is None:
         raise Http404()
+    title, chunk_html = page
 
     return TemplateResponse(
         request,
         template_name,
         {
-            "title": chunk.page_title,
-            "chunk_html": chunk.render(request),
+            "title": title,
+            "chunk_html": chunk_html,
         },
     )
 
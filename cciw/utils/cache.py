@@ -0,0 +1,15 @@
+from collections.abc import Callable
+
+from django.db import transaction
+
+
+def clear_cache_now_and_on_commit(clear: Callable[[], None]) -> None:
+    """
+    Calls `clear` to invalidate a cache of database data that is about to
+    change, immediately and again when the current transaction commits.
+
+    The second call is needed in case another process re-populates the cache,
+    between the first call and the commit, using data from before the commit.
+    """
+    clear()
+    transaction.on_commit(clear)
@@ -1,7 +1,10 @@
 # Simple spreadsheet abstraction that does what we need for returning data in
 # spreadsheets, supporting .xlsx
 
+import tempfile
 from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from typing import BinaryIO
 
 import pandas as pd
 
@@ -13,19 +16,45 @@ class ExcelBuilder(ABC):
     file_ext = "xlsx"
 
     @abstractmethod
-    def to_bytes(self) -> bytes:
+    def add_notice_sheet(self, header: str, lines: list[str]):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def to_file(self) -> BinaryIO:
+        """
+        Returns the spreadsheet as a file object, positioned at the start.
+        """
         raise NotImplementedError()
 
+    def to_bytes(self) -> bytes:
+        with self.to_file() as f:
+            return f.read()
+
 
 class ExcelSimpleBuilder(ExcelBuilder):
+    """
+    Builds spreadsheets from rows of data, which are written to disk as they
+    are added, so large spreadsheets don't need to be held in memory.
+    """
+
     def __init__(self):
         self.wkbk = xl.empty_workbook()
+        self.saved_file = None
 
-    def add_sheet_with_header_row(self, name: str, headers: list[str], contents: list[list[str]]):
+    def add_sheet_with_header_row(self, name: str, headers: list[str], contents: Iterable[list]):
         xl.add_sheet_with_header_row(self.wkbk, name, headers, contents)
 
-    def to_bytes(self) -> bytes:
-        return xl.workbook_to_bytes(self.wkbk)
+    def add_notice_sheet(self, header: str, lines: list[str]):
+        xl.add_notice_sheet(self.wkbk, header, lines)
+
+    def to_file(self) -> BinaryIO:
+        # Write only workbooks can only be saved once, so we keep the file,
+        # and return a new file object each time.
+        if self.saved_file is None:
+            self.saved_file = tempfile.NamedTemporaryFile(suffix=f".{self.file_ext}")
+            self.wkbk.save(self.saved_file)
+            self.saved_file.flush()
+        return open(self.saved_file.name, "rb")
 
 
 class ExcelFromDataFrameBuilder(ExcelBuilder):
@@ -36,5 +65,11 @@ class ExcelFromDataFrameBuilder(ExcelBuilder):
     def add_sheet_from_dataframe(self, name: str, dataframe: pd.DataFrame):
         dataframe.to_excel(self.pd_writer, sheet_name=name)
 
-    def to_bytes(self) -> bytes:
-        return xl.workbook_to_bytes(self.pd_writer.book)  # using ExcelWriter internals
+    def add_notice_sheet(self, header: str, lines: list[str]):
+        xl.add_notice_sheet(self.pd_writer.book, header, lines)  # using ExcelWriter internals
+
+    def to_file(self) -> BinaryIO:
+        f = tempfile.TemporaryFile()
+        self.pd_writer.book.save(f)  # using ExcelWriter internals
+        f.seek(0)
+        return f
@@ -43,10 +43,16 @@ class TimeTravelMixin:
 class TestBaseMixin(TimeTravelMixin):
     def setUp(self):
         super().setUp()
+        import cciw.accounts.models
         import cciw.cciwmain.common
-
-        cciw.cciwmain.common._thisyear = None
-        cciw.cciwmain.common._thisyear_timestamp = None
+        import cciw.cciwmain.pagecache
+        import cciw.mail.lists
+
+        # Caches aren't cleared by rollback of the previous test's transaction
+        cciw.cciwmain.common.clear_thisyear_cache()
+        cciw.accounts.models.clear_user_capabilities_cache()
+        cciw.mail.lists.clear_list_index_cache()
+        cciw.cciwmain.pagecache.clear_page_cache()
 
         # To get our custom email backend to be used, we have to patch settings
         # at this point, due to how Django's test runner also sets this value:
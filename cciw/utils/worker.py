@@ -0,0 +1,126 @@
+"""
+Long running worker processes for queues stored in the database.
+
+A worker runs a fixed pool of threads, each of which repeatedly calls a
+`process_next` function. This should claim the next item on the queue (using
+SELECT ... FOR UPDATE SKIP LOCKED, so that threads don't handle the same item),
+handle it, and return False if the queue was empty.
+
+Threads with nothing to do sleep until the queue's channel is notified (see
+`notify`), or until the next poll, in case a notification is missed (e.g. while
+the worker is restarting).
+
+Workers are run by management commands, managed by supervisor. See
+cciw.mail.incoming and cciw.officers.exports
+"""
+import logging
+import select
+import threading
+import time
+from collections.abc import Callable
+from datetime import timedelta
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def notify(channel: str, payload: str) -> None:
+    """
+    Wakes up the worker listening on `channel`. Within a transaction, this is
+    delivered on commit.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [channel, payload])
+
+
+def run_worker(
+    *,
+    name: str,
+    channel: str,
+    process_next: Callable[[], bool],
+    threads: int,
+    poll_interval: timedelta,
+    stop: threading.Event,
+    periodic: Callable[[], None] | None = None,
+    periodic_interval: timedelta | None = None,
+) -> None:
+    """
+    Runs a worker until `stop` is set. `periodic`, if given, is called from the
+    main thread every `periodic_interval`.
+    """
+    wakeup = threading.Condition()
+    worker_threads = [
+        threading.Thread(
+            target=_worker_thread,
+            args=(name, process_next, wakeup, poll_interval.total_seconds(), stop),
+            name=f"{channel}-{i}",
+            daemon=True,
+        )
+        for i in range(threads)
+    ]
+    for thread in worker_threads:
+        thread.start()
+    logger.info("%s worker started with %s threads", name, threads)
+    try:
+        _listen(channel, wakeup, poll_interval.total_seconds(), stop, periodic, periodic_interval)
+    finally:
+        stop.set()
+        with wakeup:
+            wakeup.notify_all()
+        for thread in worker_threads:
+            thread.join()
+        connection.close()
+        logger.info("%s worker stopped", name)
+
+
+def _worker_thread(
+    name: str,
+    process_next: Callable[[], bool],
+    wakeup: threading.Condition,
+    poll_interval: float,
+    stop: threading.Event,
+) -> None:
+    try:
+        while not stop.is_set():
+            try:
+                found = process_next()
+            except Exception:
+                # e.g. database connection problems. Don't spin while they last.
+                logger.exception("Error in %s worker", name)
+                connection.close()
+                found = False
+            if not found:
+                # If a notification arrives just before we start waiting, we
+                # miss it and pick up the item at the next poll instead.
+                with wakeup:
+                    wakeup.wait(timeout=poll_interval)
+    finally:
+        connection.close()
+
+
+def _listen(
+    channel: str,
+    wakeup: threading.Condition,
+    poll_interval: float,
+    stop: threading.Event,
+    periodic: Callable[[], None] | None,
+    periodic_interval: timedelta | None,
+) -> None:
+    # LISTEN needs autocommit, which is the default for Django connections outside atomic blocks.
+    with connection.cursor() as cursor:
+        cursor.execute(f"LISTEN {channel}")
+    pg_connection = connection.connection
+    last_periodic = time.monotonic()
+    while not stop.is_set():
+        if select.select([pg_connection], [], [], poll_interval) != ([], [], []):
+            pg_connection.poll()
+            if pg_connection.notifies:
+                # One wake up is enough however many items were added, as
+                # threads keep going until the queue is empty.
+                pg_connection.notifies.clear()
+                with wakeup:
+                    wakeup.notify_all()
+        if periodic is not None and time.monotonic() - last_periodic >= periodic_interval.total_seconds():
+            periodic()
+            last_periodic = time.monotonic()
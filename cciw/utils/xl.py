@@ -1,20 +1,25 @@
 """
 Simplified xlwt interface
 """
+from collections.abc import Iterable
 from datetime import date, datetime
 from io import BytesIO
 
 from django.utils import timezone
 from openpyxl import Workbook, load_workbook, styles
-from openpyxl.cell import Cell
+from openpyxl.cell import Cell, WriteOnlyCell
 from openpyxl.styles.fonts import DEFAULT_FONT
-from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
 from pytz import UTC
 
 
 def empty_workbook():
-    wkbk: Workbook = Workbook()
-    wkbk.remove(wkbk.worksheets[0])
+    """
+    Returns a write only workbook, which writes rows to temporary files as they
+    are added, rather than keeping them in memory.
+    """
+    wkbk: Workbook = Workbook(write_only=True)
+    add_named_styles(wkbk)
     return wkbk
 
 
@@ -23,61 +28,83 @@ default_font = styles.Font(size=font_size, name=DEFAULT_FONT.name)
 header_font = styles.Font(bold=True, size=font_size, name=DEFAULT_FONT.name)
 url_font = styles.Font(color=styles.colors.BLUE, size=font_size, name=DEFAULT_FONT.name)
 
-
-def add_sheet_with_header_row(wkbk: Workbook, name: str, headers: list[str], contents: list[list[str]]):
+border = styles.Border(
+    left=styles.Side(border_style="thin"),
+    right=styles.Side(border_style="thin"),
+    top=styles.Side(border_style="thin"),
+    bottom=styles.Side(border_style="thin"),
+)
+alignment = styles.Alignment(vertical="center")
+wrapped_alignment = styles.Alignment(vertical="center", wrapText=True)
+date_format = "YYYY/MM/DD"
+
+# Cells share these named styles, rather than each having their own font,
+# border etc. which is much slower for large sheets.
+HEADER_STYLE = "cciw_header"
+DEFAULT_STYLE = "cciw_default"
+DATE_STYLE = "cciw_date"
+WRAPPED_STYLE = "cciw_wrapped"
+URL_STYLE = "cciw_url"
+
+
+def add_named_styles(wkbk: Workbook):
+    for named_style in [
+        styles.NamedStyle(name=HEADER_STYLE, font=header_font, border=border),
+        styles.NamedStyle(name=DEFAULT_STYLE, font=default_font, border=border, alignment=alignment),
+        styles.NamedStyle(
+            name=DATE_STYLE, font=default_font, border=border, alignment=alignment, number_format=date_format
+        ),
+        styles.NamedStyle(name=WRAPPED_STYLE, font=default_font, border=border, alignment=wrapped_alignment),
+        styles.NamedStyle(name=URL_STYLE, font=url_font, border=border, alignment=alignment),
+    ]:
+        wkbk.add_named_style(named_style)
+
+
+def add_sheet_with_header_row(wkbk: Workbook, name: str, headers: list[str], contents: Iterable[list]):
     """
-    Utility function for adding sheet to xlwt workbook.
+    Utility function for adding sheet to workbook created by `empty_workbook`.
+    `contents` can be a generator, rows are written as they are produced.
     """
-    wksh: Worksheet = wkbk.create_sheet(title=name)
-
-    border = styles.Border(
-        left=styles.Side(border_style="thin"),
-        right=styles.Side(border_style="thin"),
-        top=styles.Side(border_style="thin"),
-        bottom=styles.Side(border_style="thin"),
-    )
+    wksh: WriteOnlyWorksheet = wkbk.create_sheet(title=name)
 
-    alignment = styles.Alignment(vertical="center")
-    wrapped_alignment = styles.Alignment(vertical="center", wrapText=True)
-    date_format = "YYYY/MM/DD"
+    def styled_cell(val, style):
+        cell = WriteOnlyCell(wksh, value=val)
+        cell.style = style
+        return cell
 
-    for c_idx, header in enumerate(headers, start=1):
-        cell: Cell = wksh.cell(row=1, column=c_idx, value=header)
-        cell.font = header_font
-        cell.border = border
+    wksh.append([styled_cell(header, HEADER_STYLE) for header in headers])
 
     header_row_count = 1
 
     for r_idx, row in enumerate(contents, start=1 + header_row_count):
         normal_row_height = font_size
         row_height = normal_row_height
-        for c_idx, val in enumerate(row, start=1):
-            cell: Cell = wksh.cell(row=r_idx, column=c_idx)
-            cell.border = border
-            cell.alignment = alignment
-            cell.font = default_font
-
+        cells = []
+        for val in row:
+            style = DEFAULT_STYLE
             if isinstance(val, str):
                 # normalise newlines to style expected by Excel
                 val = val.replace("\r\n", "\n")
 
             if isinstance(val, datetime | date):
-                cell.number_format = date_format
+                style = DATE_STYLE
                 if isinstance(val, datetime):
                     if timezone.is_aware(val):
                         val = timezone.make_naive(val, UTC)
             else:
                 if isinstance(val, str) and "\n" in val:
                     # This is needed or Excel displays box character for newlines.
-                    cell.alignment = wrapped_alignment
+                    style = WRAPPED_STYLE
                     # Set height to be able to see all lines
                     row_height = max(row_height, font_size * (val.count("\n") + 1))
                 if looks_like_url(val):
                     val = f'=HYPERLINK("{val}"; "{val}")'
-                    cell.font = url_font
-            cell.value = val
+                    style = URL_STYLE
+            cells.append(styled_cell(val, style))
         if row_height > normal_row_height:
+            # Row dimensions have to be set before the row is written.
             wksh.row_dimensions[r_idx].height = row_height
+        wksh.append(cells)
 
 
 def looks_like_url(val):
@@ -89,6 +116,27 @@ def looks_like_url(val):
     )
 
 
+def add_notice_sheet(wkbk: Workbook, header: str, lines: list[str]):
+    """
+    Adds a sheet with a notice as the first sheet in the workbook.
+    """
+    wksh = wkbk.create_sheet("Notice", 0)
+
+    def cell(val, font):
+        if isinstance(wksh, WriteOnlyWorksheet):
+            cell = WriteOnlyCell(wksh, value=val)
+        else:
+            cell = Cell(wksh, value=val)
+        cell.font = font
+        return cell
+
+    wksh.column_dimensions["A"].width = 100
+    wksh.append([cell(header, header_font)])
+    wksh.append([])
+    for line in lines:
+        wksh.append([cell(line, default_font)])
+
+
 def workbook_to_bytes(wkbk: Workbook) -> bytes:
     s = BytesIO()
     wkbk.save(s)
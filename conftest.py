@@ -1,3 +1,5 @@
+import pytest
+
 BROWSER = "Firefox"
 SHOW_BROWSER = False
 
@@ -7,9 +9,25 @@ def pytest_addoption(parser):
         "--browser", type=str, default="Firefox", help="Selenium driver_name to use", choices=["Firefox", "Chrome"]
     )
     parser.addoption("--show-browser", action="store_true", default=False, help="Show web browser window")
+    parser.addoption("--benchmarks", action="store_true", default=False, help="Run benchmarks (skipped by default)")
+    parser.addoption(
+        "--update-view-budgets",
+        action="store_true",
+        default=False,
+        help="Rewrite cciw/benchmarks/view_budgets.json from measured values (with --benchmarks)",
+    )
 
 
 def pytest_configure(config):
     global SHOW_BROWSER, BROWSER
     BROWSER = config.option.browser
     SHOW_BROWSER = config.option.show_browser
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.option.benchmarks:
+        return
+    skip_benchmark = pytest.mark.skip(reason="Benchmarks only run with --benchmarks")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
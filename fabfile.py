@@ -607,10 +607,28 @@ def restart_webserver(c):
         start_webserver(c)
 
 
+@root_task()
+def restart_incoming_mail_worker(c):
+    """
+    Restarts the worker that handles incoming mail, so that it picks up new code
+    """
+    supervisorctl(c, f"restart {PROJECT_NAME}_incoming_mail_worker")
+
+
+@root_task()
+def restart_export_job_worker(c):
+    """
+    Restarts the worker that builds spreadsheet exports, so that it picks up new code
+    """
+    supervisorctl(c, f"restart {PROJECT_NAME}_export_job_worker")
+
+
 @root_task()
 def restart_all(c):
     supervisorctl(c, "reread")  # for first time, to ensure it can see webserver conf
     restart_webserver(c)
+    restart_incoming_mail_worker(c)
+    restart_export_job_worker(c)
 
 
 @root_task()